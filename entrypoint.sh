@@ -6,4 +6,9 @@ cd /usr/src/stratpoll-api/ && alembic upgrade head
 # * init platform
 python /usr/src/stratpoll-api/src/init_platform.py
 
-hypercorn src.main:app --workers 1 --bind 0.0.0.0:8100
\ No newline at end of file
+# * metrics of workers from a previous run must not be added to the new ones
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+BOOTSTRAP_ON_STARTUP=False hypercorn src.main:app --workers 1 --bind 0.0.0.0:8100
\ No newline at end of file
@@ -15,6 +15,8 @@ class ResponseErrorMessage(BaseModel):
 
 class Settings(BaseSettings):
     openapi_url: str = os.getenv("OPENAPI_URL", "/openapi.json")
+    # * A document written by `python -m src.openapi --output openapi.json`, loaded instead of generating the schema on startup.
+    openapi_schema_file: str = os.getenv("OPENAPI_SCHEMA_FILE", None)  # type: ignore
 
     app_name: str = os.getenv("APP_NAME", "REGNIFY HTTP API")
     api_version: str = os.getenv("API_VERSION", "1.0")
@@ -24,6 +26,10 @@ class Settings(BaseSettings):
     admin_last_name: str = os.getenv("ADMIN_LAST_NAME", "Doe")
     admin_password: str = os.getenv("ADMIN_PASSWORD", "worldSecret")
 
+    # * When False, workers skip the platform bootstrap on startup entirely,
+    # * expecting `python src/init_platform.py` to have been run once per deploy.
+    bootstrap_on_startup: bool = os.getenv("BOOTSTRAP_ON_STARTUP", "True") == "True"  # type: ignore
+
     db_host: str = os.getenv("DB_HOST", None)  # type: ignore
     db_port: str = os.getenv("DB_PORT", None)  # type: ignore
     db_password: str = os.getenv("DB_PASSWORD", None)  # type: ignore
@@ -79,6 +85,13 @@ class Settings(BaseSettings):
     mail_ssl_tls: bool = os.getenv("MAIL_SSL_TLS", "False") == "True"  # type: ignore
     use_credentials: bool = os.getenv("USE_CREDENTIALS", "False") == "True"  # type: ignore
 
+    # * Emails are sent from the outbox table in batches of `mail_outbox_batch_size` over one connection,
+    # * a failed one is retried after a backoff that doubles each time, up to `mail_outbox_max_attempts`.
+    mail_outbox_batch_size: int = int(os.getenv("MAIL_OUTBOX_BATCH_SIZE", "50"))  # type: ignore
+    mail_outbox_poll_seconds: float = float(os.getenv("MAIL_OUTBOX_POLL_SECONDS", "5"))
+    mail_outbox_max_attempts: int = int(os.getenv("MAIL_OUTBOX_MAX_ATTEMPTS", "5"))  # type: ignore
+    mail_outbox_retry_backoff_seconds: float = float(os.getenv("MAIL_OUTBOX_RETRY_BACKOFF_SECONDS", "30"))
+
     display_scopes: bool = os.getenv("DISPLAY_SCOPES_IN_DOCUMENTATION", "True") == "True"  # type: ignore
 
     cloud_sql_instance_name: str = os.getenv("CLOUD_SQL_INSTANCE_NAME", None)  # type: ignore
@@ -88,20 +101,77 @@ class Settings(BaseSettings):
     minio_access_key: str = os.getenv("MINIO_ACCESS_KEY", None)  # type: ignore
     minio_secret_key: str = os.getenv("MINIO_SECRET_KEY", None)  # type: ignore
     secure_minio: bool = os.getenv("SECURE_MINIO", "False") == "True"  # type: ignore
+    # * Connections to the storage are kept alive and reused, up to `storage_pool_size` of them,
+    # * 0 matches the threads that can use them: the threadpool and the derivative workers.
+    storage_pool_size: int = int(os.getenv("STORAGE_POOL_SIZE", "0"))  # type: ignore
+    storage_connect_timeout_seconds: float = float(os.getenv("STORAGE_CONNECT_TIMEOUT_SECONDS", "5"))
+    storage_read_timeout_seconds: float = float(os.getenv("STORAGE_READ_TIMEOUT_SECONDS", "60"))
 
     backend_storage_option: str = os.getenv("BACKEND_STORAGE_OPTION", "MINIO_STORAGE")  # type: ignore
-
-    # * Number of bytes to send while uploading a particular file, one at a time.
-    # * If the size of a file is more than the value provided here, the value here will be used
+    # * The directory LOCAL_STORAGE keeps its buckets in.
+    local_storage_path: str = os.getenv("LOCAL_STORAGE_PATH", "storage")  # type: ignore
+
+    # * A local directory (or tmpfs) to keep copies of downloaded files in, unset disables the cache.
+    file_cache_path: str = os.getenv("FILE_CACHE_PATH", None)  # type: ignore
+    file_cache_max_mb: float = float(os.getenv("FILE_CACHE_MAX_MB", "512"))
+    file_cache_max_file_mb: float = float(os.getenv("FILE_CACHE_MAX_FILE_MB", "10"))
+
+    # * BUCKET_PER_USER or SHARED_BUCKET, where every user's files are prefixed by the user in `shared_bucket_name`.
+    storage_layout: str = os.getenv("STORAGE_LAYOUT", "BUCKET_PER_USER")  # type: ignore
+    shared_bucket_name: str = os.getenv("SHARED_BUCKET_NAME", "regnify-files")  # type: ignore
+
+    # * Store identical content once, in `blob_bucket_name`, shared by every file with the same checksum.
+    content_addressed_storage: bool = os.getenv("CONTENT_ADDRESSED_STORAGE", "False") == "True"  # type: ignore
+    blob_bucket_name: str = os.getenv("BLOB_BUCKET_NAME", "regnify-blobs")  # type: ignore
+
+    # * PROXY streams files through the API, REDIRECT and PRESIGNED_URL hand out
+    # * short-lived presigned URLs so the bytes go straight to/from the storage.
+    file_delivery_mode: str = os.getenv("FILE_DELIVERY_MODE", "PROXY")  # type: ignore
+    presigned_url_expire_minutes: int = int(os.getenv("PRESIGNED_URL_EXPIRE_MINUTES", "15"))  # type: ignore
+
+    # * Render resized, metadata-free copies of user photos on a background pool after upload.
+    image_derivatives: bool = os.getenv("IMAGE_DERIVATIVES", "True") == "True"  # type: ignore
+    image_derivative_workers: int = int(os.getenv("IMAGE_DERIVATIVE_WORKERS", "2"))  # type: ignore
+
+    # * Walk the buckets for objects no row points to, and rows whose object is gone, on a
+    # * background thread. Orphans older than the grace period are removed with DELETE, or only logged with REPORT.
+    orphan_reconciler: bool = os.getenv("ORPHAN_RECONCILER", "False") == "True"  # type: ignore
+    orphan_action: str = os.getenv("ORPHAN_ACTION", "REPORT")  # type: ignore
+    orphan_grace_period_minutes: float = float(os.getenv("ORPHAN_GRACE_PERIOD_MINUTES", "1440"))
+    orphan_reconciler_interval_minutes: float = float(os.getenv("ORPHAN_RECONCILER_INTERVAL_MINUTES", "60"))
+    orphan_reconciler_page_size: int = int(os.getenv("ORPHAN_RECONCILER_PAGE_SIZE", "500"))  # type: ignore
+    orphan_reconciler_pages_per_run: int = int(os.getenv("ORPHAN_RECONCILER_PAGES_PER_RUN", "20"))  # type: ignore
+    orphan_reconciler_pause_seconds: float = float(os.getenv("ORPHAN_RECONCILER_PAUSE_SECONDS", "1"))
+
+    # * Resumable uploads no chunk was sent to for this long are aborted, checked every `resumable_upload_sweep_minutes`.
+    resumable_upload_expire_minutes: float = float(os.getenv("RESUMABLE_UPLOAD_EXPIRE_MINUTES", "1440"))
+    resumable_upload_sweep_minutes: float = float(os.getenv("RESUMABLE_UPLOAD_SWEEP_MINUTES", "30"))
+
+    # * The size, in mb, of the parts a file larger than one part is uploaded in,
+    # * `upload_parallel_parts` of them at a time. Parts are at least 5 mb.
     upload_file_bytes_per_stream: float = float(
-        os.getenv("UPLOAD_FILE_BYTES_PER_STREAM", "100")  # 100mb
+        os.getenv("UPLOAD_FILE_BYTES_PER_STREAM", "8")  # 8mb
     )
+    upload_parallel_parts: int = int(os.getenv("UPLOAD_PARALLEL_PARTS", "4"))  # type: ignore
+    upload_part_attempts: int = int(os.getenv("UPLOAD_PART_ATTEMPTS", "3"))  # type: ignore
     max_size_of_a_file: float = float(
         os.getenv("MAX_SIZE_OF_A_FILE", "100")  # 100 mb 104,857,600
     )
     user_file_to_upload_limit: float = float(
         os.getenv("MAX_SIZE_OF_A_USER_PHOTO", "5")  # 5 mb
     )
+    # * Uploads a worker process takes at once, and the mb they can bring in together. One that
+    # * does not fit waits up to `upload_admission_wait_seconds` and is then refused with a 503.
+    max_concurrent_uploads: int = int(os.getenv("MAX_CONCURRENT_UPLOADS", "8"))  # type: ignore
+    max_upload_bytes_in_flight: float = float(os.getenv("MAX_UPLOAD_BYTES_IN_FLIGHT", "256"))
+    upload_admission_wait_seconds: float = float(os.getenv("UPLOAD_ADMISSION_WAIT_SECONDS", "10"))
+    # * Serve `/metrics` for Prometheus. Set PROMETHEUS_MULTIPROC_DIR to an empty directory
+    # * shared by the worker processes to add up the metrics of all of them.
+    metrics_enabled: bool = os.getenv("METRICS_ENABLED", "False") == "True"  # type: ignore
+    # * Threads each worker process runs the sync endpoints and dependencies on.
+    threadpool_size: int = int(os.getenv("THREADPOOL_SIZE", "40"))  # type: ignore
+    # * The largest body, in mb, of a request to a route that does not take a file.
+    max_request_body_size: float = float(os.getenv("MAX_REQUEST_BODY_SIZE", "1"))
 
     def get_full_database_url(self):
         return f"postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
@@ -5,19 +5,16 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from dotenv import load_dotenv
 from src.config import Settings, setup_logger
+from src.metrics import TimedQueuePool, instrument_engine
 from typing import Optional
 from sqlalchemy.engine import Engine as Database
 
 from sqlalchemy.orm import Session
 
-from google.cloud.sql.connector import Connector
-
 load_dotenv()
 
 app_settings = Settings()
 
-engine = create_engine(app_settings.get_full_database_url())
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
@@ -42,7 +39,8 @@ _db_conn: Optional[Database] = None
 # * https://github.com/tiangolo/fastapi/issues/726#issuecomment-557687526
 def open_db_connections():
     global _db_conn
-    _db_conn = get_engine()
+    _db_conn = get_engine(poolclass=TimedQueuePool)
+    instrument_engine(_db_conn)
 
 
 def close_db_connections():
@@ -51,15 +49,19 @@ def close_db_connections():
         _db_conn.dispose()
 
 
-def get_engine():
+def get_engine(**engine_kwargs):
     if app_settings.sql_database_provider == "CLOUD_SQL":
-        return create_engine(SQLALCHEMY_DATABASE_URL, creator=get_cloud_sql_conn)
+        return create_engine(
+            SQLALCHEMY_DATABASE_URL, creator=get_cloud_sql_conn, **engine_kwargs
+        )
     else:
-        return create_engine(app_settings.get_full_database_url())
+        return create_engine(app_settings.get_full_database_url(), **engine_kwargs)
 
 
 def get_cloud_sql_conn():
-    connector = Connector()
+    # * Only deployments using CLOUD_SQL pay for importing the connector.
+    from google.cloud.sql.connector import Connector
+
     with Connector() as connector:
         conn = connector.connect(
             app_settings.cloud_sql_instance_name,
@@ -83,10 +85,6 @@ def get_db():
         db.close()  # type: ignore
 
 
-db_engine = get_engine()
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
-Base = declarative_base()
-
 # ***
 
 
@@ -23,6 +23,12 @@ class BaseForbiddenException(Exception):
     pass
 
 
+class RangeNotSatisfiableException(Exception):
+    def __init__(self, message: str, total_bytes: int) -> None:
+        super().__init__(message)
+        self.total_bytes = total_bytes
+
+
 def handle_bad_request_exception(exception: Exception):
     """Raises an 400 HTTPException"""
 
@@ -63,4 +69,14 @@ def handle_forbidden_exception(exception: Exception):
     ) from exception
 
 
+def handle_range_not_satisfiable_exception(exception: RangeNotSatisfiableException):
+    """Raises an 416 HTTPException"""
+
+    raise HTTPException(
+        detail=str(exception),
+        status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+        headers={"Content-Range": f"bytes */{exception.total_bytes}"},
+    ) from exception
+
+
 FILE_DOES_NOT_EXIST_ERROR_MESSAGE = "The file does not exist in our records."
@@ -0,0 +1,190 @@
+"""Upload Admission"""
+
+import asyncio
+import math
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from fastapi import status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.config import Settings
+from src.files.utils import megabytes_to_bytes
+from src.metrics import publish_stats
+from src.middleware import BodyLimit
+
+
+class UploadAdmission:
+    """
+    Caps the uploads a worker process handles at once, by count and by the
+    bytes they can bring in.
+
+    An upload that does not fit waits in line, first come first served,
+    for up to `max_wait_seconds` and is turned away after that. A single
+    upload larger than `max_bytes` is let in once nothing else is in flight,
+    so it waits its turn instead of never getting one.
+
+    Only used from the event loop, so the counters need no lock.
+    """
+
+    def __init__(self, max_uploads: int, max_bytes: int, max_wait_seconds: float):
+        self.max_uploads = max(1, max_uploads)
+        self.max_bytes = max_bytes
+        self.max_wait_seconds = max_wait_seconds
+
+        self.in_flight = 0
+        self.bytes_in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters: Deque[Tuple[asyncio.Future, int]] = deque()
+
+    def _fits(self, total_bytes: int) -> bool:
+        if self.in_flight == 0:
+            return True
+        return (
+            self.in_flight < self.max_uploads
+            and self.bytes_in_flight + total_bytes <= self.max_bytes
+        )
+
+    def _admit(self, total_bytes: int):
+        self.in_flight += 1
+        self.bytes_in_flight += total_bytes
+        self.admitted += 1
+
+    def _wake(self):
+        """Lets in the waiters at the front of the line that fit now."""
+
+        while self._waiters:
+            future, total_bytes = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(total_bytes):
+                return
+            self._waiters.popleft()
+            self._admit(total_bytes)
+            future.set_result(True)
+
+    async def acquire(self, total_bytes: int) -> bool:
+        """Waits for room for an upload of `total_bytes`, returns False once the wait is over."""
+
+        if not self._waiters and self._fits(total_bytes):
+            self._admit(total_bytes)
+            self.publish_stats()
+            return True
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, total_bytes)
+        self._waiters.append(waiter)
+        self.publish_stats()
+        try:
+            return await asyncio.wait_for(future, self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        except BaseException:
+            # ? Let in right before the request was cancelled.
+            if future.done() and not future.cancelled():
+                self.release(total_bytes)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            # * The line might move now that this one left it.
+            self._wake()
+            self.publish_stats()
+
+    def release(self, total_bytes: int):
+        self.in_flight -= 1
+        self.bytes_in_flight -= total_bytes
+        self._wake()
+        self.publish_stats()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "bytes_in_flight": self.bytes_in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "max_uploads": self.max_uploads,
+            "max_bytes": self.max_bytes,
+        }
+
+    def publish_stats(self):
+        """Publishes the counters as they change, as an upload can be in flight for minutes."""
+
+        publish_stats("upload_admission", self.stats())
+
+
+class UploadAdmissionMiddleware:
+    """
+    Holds the requests to the upload routes until the `UploadAdmission` lets
+    them in, and answers 503 with `Retry-After` when it does not.
+
+    An upload counts for its `Content-Length`, or for the most its route
+    takes without one.
+    """
+
+    def __init__(
+        self, app: ASGIApp, admission: UploadAdmission, routes: List[BodyLimit]
+    ) -> None:
+        self.app = app
+        self.admission = admission
+        self.routes = routes
+
+    def get_max_bytes(self, method: str, path: str) -> Optional[int]:
+        for route_method, path_pattern, max_bytes in self.routes:
+            if route_method == method and path_pattern.match(path):
+                return max_bytes
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        total_bytes = self.get_max_bytes(scope["method"], scope["path"])
+        if total_bytes is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit():
+                total_bytes = min(total_bytes, int(value))
+                break
+
+        if not await self.admission.acquire(total_bytes):
+            response = JSONResponse(
+                {"detail": "Too many uploads are in progress, try again later."},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={
+                    "Retry-After": str(
+                        max(1, math.ceil(self.admission.max_wait_seconds))
+                    )
+                },
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.admission.release(total_bytes)
+
+
+_upload_admission: Optional[UploadAdmission] = None
+
+
+def get_upload_admission(app_settings: Settings) -> UploadAdmission:
+    """The admission of this process, created on first use."""
+
+    global _upload_admission
+    if _upload_admission is None:
+        _upload_admission = UploadAdmission(
+            max_uploads=app_settings.max_concurrent_uploads,
+            max_bytes=megabytes_to_bytes(app_settings.max_upload_bytes_in_flight),
+            max_wait_seconds=app_settings.upload_admission_wait_seconds,
+        )
+    return _upload_admission
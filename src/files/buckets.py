@@ -0,0 +1,61 @@
+"""Known Buckets"""
+
+import threading
+from collections import OrderedDict
+from typing import Union
+from uuid import UUID
+
+
+class BucketRegistry:
+    """
+    Remembers, for the whole process, the bucket row of each owner and the
+    storage buckets known to exist, so uploads skip those round trips.
+
+    Entries only go stale when a bucket is removed, which the API never does
+    as every worker keeps its own registry. `forget_owner` and
+    `forget_storage_bucket` are for buckets removed by hand.
+    """
+
+    def __init__(self, max_owners: int = 10_000) -> None:
+        self.max_owners = max_owners
+        self._bucket_ids: "OrderedDict[str, UUID]" = OrderedDict()
+        self._storage_buckets: "set[str]" = set()
+        self._lock = threading.Lock()
+
+    def get_bucket_id(self, owner_id) -> Union[UUID, None]:
+        with self._lock:
+            bucket_id = self._bucket_ids.get(str(owner_id))
+            if bucket_id is not None:
+                self._bucket_ids.move_to_end(str(owner_id))
+            return bucket_id
+
+    def set_bucket_id(self, owner_id, bucket_id: UUID):
+        with self._lock:
+            self._bucket_ids[str(owner_id)] = bucket_id
+            self._bucket_ids.move_to_end(str(owner_id))
+            while len(self._bucket_ids) > self.max_owners:
+                self._bucket_ids.popitem(last=False)
+
+    def forget_owner(self, owner_id):
+        with self._lock:
+            self._bucket_ids.pop(str(owner_id), None)
+
+    def has_storage_bucket(self, bucket_name: str) -> bool:
+        with self._lock:
+            return bucket_name in self._storage_buckets
+
+    def add_storage_bucket(self, bucket_name: str):
+        with self._lock:
+            self._storage_buckets.add(bucket_name)
+
+    def forget_storage_bucket(self, bucket_name: str):
+        with self._lock:
+            self._storage_buckets.discard(bucket_name)
+
+    def clear(self):
+        with self._lock:
+            self._bucket_ids.clear()
+            self._storage_buckets.clear()
+
+
+bucket_registry = BucketRegistry()
@@ -1,4 +1,7 @@
+from typing import Dict, List, Optional, Tuple
+
 from src.config import Settings, setup_logger
+from src.files.utils import StoredObject
 
 
 class BaseS3Client:
@@ -26,3 +29,58 @@ class BaseS3Client:
 
     def get_file_info(self):
         raise NotImplementedError
+
+    def create_multipart_upload(
+        self, bucket_name: str, file_name: str, mime_type: str
+    ) -> str:
+        """Starts a multipart upload of the object and returns its id."""
+
+        raise NotImplementedError
+
+    def upload_part(
+        self,
+        bucket_name: str,
+        file_name: str,
+        upload_id: str,
+        part_number: int,
+        data: bytes,
+    ) -> str:
+        """Sends one part, sending a part number again replaces it. Returns its ETag."""
+
+        raise NotImplementedError
+
+    def complete_multipart_upload(
+        self,
+        bucket_name: str,
+        file_name: str,
+        upload_id: str,
+        parts: List[Tuple[int, str]],
+    ):
+        raise NotImplementedError
+
+    def abort_multipart_upload(self, bucket_name: str, file_name: str, upload_id: str):
+        raise NotImplementedError
+
+    def list_file_objects(
+        self, bucket_name: str, after: Optional[str], limit: int
+    ) -> Tuple[List[StoredObject], Optional[str]]:
+        """
+        Lists up to `limit` objects of the bucket, in a stable order, starting
+        after the `after` marker of the previous page.
+
+        Returns:
+            Tuple: The objects and the marker of the next page, None once the
+                whole bucket has been listed.
+        """
+
+        raise NotImplementedError
+
+    def get_file_path(self, bucket_name: str, file_name: str) -> Optional[str]:
+        """The path of the object on the local file system, None for remote storages."""
+
+        return None
+
+    def pool_stats(self) -> Dict[str, int]:
+        """The connections of the client's HTTP pool, empty for storages without one."""
+
+        return {}
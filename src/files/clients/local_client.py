@@ -0,0 +1,347 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+from src.config import Settings
+from src.exceptions import BaseNotFoundException, GeneralException
+from src.files.clients.client import BaseS3Client
+from src.files.pipeline import UPLOAD_CHUNK_SIZE, UploadStream, iter_file_chunks
+from src.files.utils import StoredFileInfo, StoredObject
+
+# * The S3 rules, which also keep bucket names from escaping the storage root.
+BUCKET_NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9.-]{1,61}[a-z0-9]$")
+
+# * Where files are written before they are moved into place, on the same file system.
+INCOMING_DIRECTORY = ".incoming"
+
+# * Multipart uploads get a directory in the incoming one, named by their id.
+UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+UPLOAD_METADATA_FILE = "upload.json"
+
+
+class LocalStorageClient(BaseS3Client):
+    """
+    Buckets and objects on the local file system, for single node deployments
+    and for running the tests without MinIO.
+
+    A bucket is a directory under `local_storage_path`. An object is stored
+    under the SHA-256 of its name, sharded two levels deep so no directory
+    grows too large, next to a small JSON file holding its name and content
+    type. Files are written aside and renamed into place once complete, so a
+    reader never sees half an object.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        super().__init__(settings)
+
+        self.root = os.path.abspath(self.settings.local_storage_path)
+        self.incoming = os.path.join(self.root, INCOMING_DIRECTORY)
+        os.makedirs(self.incoming, exist_ok=True)
+
+    def _get_bucket_path(self, bucket_name: str) -> str:
+        if not BUCKET_NAME_PATTERN.match(bucket_name or ""):
+            raise GeneralException("Invalid S3 bucket name.")
+        return os.path.join(self.root, bucket_name)
+
+    def get_file_path(self, bucket_name: str, file_name: str) -> str:
+        digest = hashlib.sha256(file_name.encode("utf-8")).hexdigest()
+        return os.path.join(
+            self._get_bucket_path(bucket_name), digest[:2], digest[2:4], digest
+        )
+
+    def _open_existing_file(self, bucket_name: str, file_name: str):
+        try:
+            return open(self.get_file_path(bucket_name, file_name), "rb")
+        except FileNotFoundError:
+            raise BaseNotFoundException("The file was not found in the storage.")
+
+    def _move_into_place(self, temporary_path: str, file_path: str):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.replace(temporary_path, file_path)
+
+    def make_bucket(self, name: str):
+        try:
+            os.mkdir(self._get_bucket_path(name))
+        except OSError as err:
+            self.logger.exception(err)
+            raise GeneralException("Unable to create S3 bucket.")
+
+    def bucket_exists(self, name: str) -> bool:
+        return os.path.isdir(self._get_bucket_path(name))
+
+    def download_file(self, bucket_name: str, file_name: str) -> BytesIO:
+        with self._open_existing_file(bucket_name, file_name) as stored_file:
+            return BytesIO(stored_file.read())
+
+    def open_file_stream(
+        self,
+        bucket_name: str,
+        file_name: str,
+        offset: int = 0,
+        length: int = 0,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+    ) -> Iterator[bytes]:
+        """Yields the file `chunk_size` bytes at a time, `length` 0 reads to the end."""
+
+        return iter_file_chunks(
+            self._open_existing_file(bucket_name, file_name), offset, length, chunk_size
+        )
+
+    def upload_file(
+        self,
+        upload_stream: UploadStream,
+        bucket_name: str,
+        s3_file_name: str,
+        mime_type: str,
+    ) -> int:
+        """
+        Writes the file aside, flushes it to disk and renames it into place.
+
+        Raises:
+            FileTooLargeException: If the file is larger than the stream's limit,
+                nothing is left behind.
+
+        Returns:
+            int: The size of the uploaded file.
+        """
+
+        self._write_file(
+            bucket_name,
+            s3_file_name,
+            mime_type,
+            lambda temporary_file: shutil.copyfileobj(
+                upload_stream, temporary_file, UPLOAD_CHUNK_SIZE
+            ),
+        )
+        return upload_stream.total_bytes
+
+    def _write_file(
+        self,
+        bucket_name: str,
+        file_name: str,
+        mime_type: str,
+        write: Callable[[BinaryIO], None],
+    ):
+        """Has `write` fill a file aside, flushes it to disk and renames it into place."""
+
+        if not self.bucket_exists(bucket_name):
+            raise GeneralException("The S3 bucket does not exist.")
+
+        file_path = self.get_file_path(bucket_name, file_name)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.incoming)
+        temporary_metadata_path = None
+        try:
+            with os.fdopen(file_descriptor, "wb") as temporary_file:
+                write(temporary_file)
+                temporary_file.flush()
+                os.fsync(temporary_file.fileno())
+
+            file_descriptor, temporary_metadata_path = tempfile.mkstemp(
+                dir=self.incoming
+            )
+            with os.fdopen(file_descriptor, "w") as temporary_metadata_file:
+                json.dump(
+                    {"object_name": file_name, "content_type": mime_type},
+                    temporary_metadata_file,
+                )
+
+            self._move_into_place(temporary_metadata_path, f"{file_path}.json")
+            self._move_into_place(temporary_path, file_path)
+        except BaseException:
+            for path in (temporary_path, temporary_metadata_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            raise
+
+    def _get_upload_path(self, upload_id: str) -> str:
+        if not UPLOAD_ID_PATTERN.match(upload_id or ""):
+            raise GeneralException("Invalid upload id.")
+        return os.path.join(self.incoming, upload_id)
+
+    def create_multipart_upload(
+        self, bucket_name: str, file_name: str, mime_type: str
+    ) -> str:
+        """Parts are kept in a directory of their own until the upload is completed."""
+
+        if not self.bucket_exists(bucket_name):
+            raise GeneralException("The S3 bucket does not exist.")
+
+        upload_id = uuid4().hex
+        upload_path = self._get_upload_path(upload_id)
+        os.mkdir(upload_path)
+        with open(
+            os.path.join(upload_path, UPLOAD_METADATA_FILE), "w"
+        ) as metadata_file:
+            json.dump({"content_type": mime_type}, metadata_file)
+
+        return upload_id
+
+    def upload_part(
+        self,
+        bucket_name: str,
+        file_name: str,
+        upload_id: str,
+        part_number: int,
+        data: bytes,
+    ) -> str:
+        upload_path = self._get_upload_path(upload_id)
+        if not os.path.isdir(upload_path):
+            raise BaseNotFoundException("The upload was not found in the storage.")
+
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=upload_path)
+        with os.fdopen(file_descriptor, "wb") as temporary_file:
+            temporary_file.write(data)
+        os.replace(temporary_path, os.path.join(upload_path, f"{part_number:05d}"))
+
+        return hashlib.md5(data).hexdigest()
+
+    def complete_multipart_upload(
+        self,
+        bucket_name: str,
+        file_name: str,
+        upload_id: str,
+        parts: List[Tuple[int, str]],
+    ):
+        """Joins the parts into the object, the parts directory goes with it."""
+
+        upload_path = self._get_upload_path(upload_id)
+        part_paths = [
+            os.path.join(upload_path, f"{part_number:05d}") for part_number, _ in parts
+        ]
+        if not all(os.path.exists(part_path) for part_path in part_paths):
+            raise GeneralException("Some parts of the upload are missing.")
+
+        with open(os.path.join(upload_path, UPLOAD_METADATA_FILE)) as metadata_file:
+            mime_type = json.load(metadata_file)["content_type"]
+
+        def write(temporary_file: BinaryIO):
+            for part_path in part_paths:
+                with open(part_path, "rb") as part_file:
+                    shutil.copyfileobj(part_file, temporary_file, UPLOAD_CHUNK_SIZE)
+
+        self._write_file(bucket_name, file_name, mime_type, write)
+        shutil.rmtree(upload_path, ignore_errors=True)
+
+    def abort_multipart_upload(self, bucket_name: str, file_name: str, upload_id: str):
+        shutil.rmtree(self._get_upload_path(upload_id), ignore_errors=True)
+
+    def remove_file_object(self, bucket_name: str, file_name: str):
+        file_path = self.get_file_path(bucket_name, file_name)
+        try:
+            for path in (file_path, f"{file_path}.json"):
+                if os.path.exists(path):
+                    os.remove(path)
+        except OSError as err:
+            self.logger.exception(err)
+            raise GeneralException("Unable to remove S3 bucket.")
+
+    def remove_file_objects(self, bucket_name: str, file_names: List[str]) -> List[str]:
+        """Removes the objects, returns the names of the ones that could not be removed."""
+
+        failed_file_names = []
+        for file_name in file_names:
+            try:
+                self.remove_file_object(bucket_name, file_name)
+            except GeneralException:
+                failed_file_names.append(file_name)
+        return failed_file_names
+
+    def remove_bucket(self, name: str):
+        """Removes the bucket, which has to be empty apart from the empty shard directories."""
+
+        bucket_path = self._get_bucket_path(name)
+        try:
+            for directory, _, _ in sorted(os.walk(bucket_path), reverse=True):
+                os.rmdir(directory)
+        except OSError as err:
+            self.logger.exception(err)
+            raise GeneralException("Unable to remove S3 bucket.")
+
+    def list_file_objects(
+        self, bucket_name: str, after: Optional[str], limit: int
+    ) -> Tuple[List[StoredObject], Optional[str]]:
+        """Lists the objects in the order of their hashed names, `after` is the last hash of the previous page."""
+
+        bucket_path = self._get_bucket_path(bucket_name)
+        if not os.path.isdir(bucket_path):
+            return [], None
+
+        stored_objects: List[StoredObject] = []
+        for digest in self._iter_digests(bucket_path, after or ""):
+            if len(stored_objects) == limit:
+                return stored_objects, after
+            file_path = os.path.join(bucket_path, digest[:2], digest[2:4], digest)
+            try:
+                file_stat = os.stat(file_path)
+                with open(f"{file_path}.json") as metadata_file:
+                    object_name = json.load(metadata_file)["object_name"]
+            except (OSError, ValueError, KeyError):
+                # ? Removed while listing, or its metadata is not readable.
+                continue
+
+            stored_objects.append(
+                StoredObject(
+                    name=object_name,
+                    total_bytes=file_stat.st_size,
+                    last_modified=datetime.fromtimestamp(
+                        file_stat.st_mtime, tz=timezone.utc
+                    ),
+                )
+            )
+            after = digest
+
+        return stored_objects, None
+
+    def _iter_digests(self, bucket_path: str, after: str) -> Iterator[str]:
+        """The hashed names of the bucket's files greater than `after`, in order."""
+
+        for first in sorted(os.listdir(bucket_path)):
+            if first < after[:2]:
+                continue
+            first_path = os.path.join(bucket_path, first)
+            for second in sorted(os.listdir(first_path)):
+                if first + second < after[:4]:
+                    continue
+                for digest in sorted(os.listdir(os.path.join(first_path, second))):
+                    if digest > after and not digest.endswith(".json"):
+                        yield digest
+
+    def presigned_download_url(
+        self, bucket_name: str, file_name: str, expires: timedelta
+    ) -> str:
+        raise GeneralException(
+            "The local storage can not generate download URLs, use the PROXY delivery mode."
+        )
+
+    def presigned_upload_url(
+        self, bucket_name: str, file_name: str, expires: timedelta
+    ) -> str:
+        raise GeneralException(
+            "The local storage can not generate upload URLs, upload through the API."
+        )
+
+    def get_file_info(self, bucket_name: str, file_name: str) -> StoredFileInfo:
+        file_path = self.get_file_path(bucket_name, file_name)
+        try:
+            total_bytes = os.stat(file_path).st_size
+        except FileNotFoundError:
+            raise BaseNotFoundException("The file was not found in the storage.")
+
+        content_type: Optional[str] = None
+        try:
+            with open(f"{file_path}.json") as metadata_file:
+                content_type = json.load(metadata_file).get("content_type")
+        except (OSError, ValueError) as err:
+            self.logger.exception(err)
+
+        return StoredFileInfo(total_bytes=total_bytes, content_type=content_type)
+
+    def get_file_size(self, bucket_name: str, file_name: str) -> str:
+        return str(self.get_file_info(bucket_name, file_name).total_bytes)
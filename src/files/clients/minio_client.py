@@ -1,34 +1,133 @@
-from typing import BinaryIO
-from urllib3.response import HTTPResponse
 import os
+import urllib3
+from urllib3.response import HTTPResponse
 from datetime import timedelta
 from io import BytesIO
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from minio.helpers import ObjectWriteResult
+import certifi
 
-from minio import Minio
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteObject
+from minio.helpers import MAX_MULTIPART_COUNT, MAX_PART_SIZE, MIN_PART_SIZE
 
-from src.files.utils import seek_to_start, meet_upload_file_limit_rule
+from minio import Minio
 
-from minio.error import MinioException
+from minio.error import MinioException, S3Error
 
 from src.files.clients.client import BaseS3Client
-from src.exceptions import GeneralException, FileTooLargeException
+from src.files.multipart import MultipartUpload
+from src.files.pipeline import UPLOAD_CHUNK_SIZE, UploadStream
+from src.exceptions import BaseNotFoundException, GeneralException
+from src.files.utils import StoredFileInfo, StoredObject, megabytes_to_bytes
 from src.config import Settings
-from src.service import ONE_MB_IN_BYTES
+
+
+class MinioMultipartUpload(MultipartUpload):
+    """
+    `MultipartUpload` on top of the S3 calls the MinIO client makes for
+    `put_object`, which queues every part of a stream in memory instead.
+    """
+
+    def __init__(
+        self, client: Minio, bucket_name: str, object_name: str, mime_type: str, **kw
+    ) -> None:
+        super().__init__(**kw)
+        self.client = client
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.headers = {"Content-Type": mime_type}
+
+    def put_object(self, data: bytes):
+        self.client.put_object(
+            self.bucket_name,
+            self.object_name,
+            BytesIO(data),
+            length=len(data),
+            content_type=self.headers["Content-Type"],
+        )
+
+    def create(self) -> str:
+        return self.client._create_multipart_upload(
+            self.bucket_name, self.object_name, dict(self.headers)
+        )
+
+    def upload_part(self, upload_id: str, part_number: int, data: bytes) -> str:
+        return self.client._upload_part(
+            self.bucket_name, self.object_name, data, None, upload_id, part_number
+        )
+
+    def complete(self, upload_id: str, parts: List[Tuple[int, str]]):
+        self.client._complete_multipart_upload(
+            self.bucket_name,
+            self.object_name,
+            upload_id,
+            [Part(part_number, etag) for part_number, etag in parts],
+        )
+
+    def abort(self, upload_id: str):
+        self.client._abort_multipart_upload(
+            self.bucket_name, self.object_name, upload_id
+        )
+
+
+def make_http_client(settings: Settings) -> urllib3.PoolManager:
+    """
+    The pool MinIO builds by default, sized for the threads that share it
+    and with the timeouts of the settings instead of five minutes each.
+    """
+
+    pool_size = settings.storage_pool_size or (
+        settings.threadpool_size + settings.image_derivative_workers
+    )
+    return urllib3.PoolManager(
+        timeout=urllib3.util.Timeout(
+            connect=settings.storage_connect_timeout_seconds,
+            read=settings.storage_read_timeout_seconds,
+        ),
+        maxsize=pool_size,
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=urllib3.Retry(
+            total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]
+        ),
+    )
 
 
 class MinioClient(BaseS3Client):
     def __init__(self, settings: Settings) -> None:
         super().__init__(settings)
 
+        self.http_client = make_http_client(self.settings)
         self.client = Minio(
             self.settings.minio_host,
             access_key=self.settings.minio_access_key,
             secret_key=self.settings.minio_secret_key,
             secure=self.settings.secure_minio,
+            http_client=self.http_client,
         )
 
+    def pool_stats(self) -> Dict[str, int]:
+        stats = {
+            "max_size": self.http_client.connection_pool_kw["maxsize"],
+            "opened": 0,
+            "requests": 0,
+            "idle": 0,
+        }
+        for key in self.http_client.pools.keys():
+            pool = self.http_client.pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            stats["opened"] += pool.num_connections
+            stats["requests"] += pool.num_requests
+            stats["idle"] += sum(
+                connection is not None for connection in list(pool.pool.queue)
+            )
+        # * Requests sent over a connection that was kept alive.
+        stats["reused"] = stats["requests"] - stats["opened"]
+        return stats
+
     def print_handled_message(self, err: MinioException):
         self.logger.info("MINIO Exception: Handled Gracefully")
         self.logger.exception(err)
@@ -56,62 +155,137 @@ class MinioClient(BaseS3Client):
             response.close()  # type: ignore
             response.release_conn()  # type: ignore
 
+    def open_file_stream(
+        self,
+        bucket_name: str,
+        file_name: str,
+        offset: int = 0,
+        length: int = 0,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+    ) -> Iterator[bytes]:
+        """
+        Yields the object `chunk_size` bytes at a time.
+
+        The request is sent right away, so a missing object fails here and not
+        half way through a response. The connection goes back to the pool once
+        the iterator is exhausted or closed.
+
+        Args:
+            offset (int): The first byte to read.
+            length (int): The number of bytes to read, 0 reads to the end.
+        """
+
+        response: HTTPResponse = self.client.get_object(
+            bucket_name, file_name, offset=offset, length=length
+        )
+
+        def iter_chunks():
+            try:
+                yield from response.stream(chunk_size)
+            finally:
+                response.close()
+                response.release_conn()
+
+        return iter_chunks()
+
     def upload_file(
         self,
-        file_to_upload: BinaryIO,
+        upload_stream: UploadStream,
         bucket_name: str,
         s3_file_name: str,
         mime_type: str,
-        file_size_limit: int = -1,
     ):
         """
-        Uploads the file to the correct S3 storage.
+        Streams the file to the correct S3 storage.
+
+        The size is not known up front. A file larger than one part of
+        `upload_file_bytes_per_stream` mb is sent as a multipart upload,
+        `upload_parallel_parts` parts at a time.
 
         Args:
-            buffer (BufferedReader): The bytes of the file to upload.
+            upload_stream (UploadStream): The file to upload.
             bucket_name (str): The name of the bucket to upload to.
             s3_file_name (str): The S3 compliance file name.
-            file_size_limit (int): The file size limit (in bytes) to check the file's size against.
+            mime_type (str): The content type to store the file with.
 
         Raises:
-            TypeError: If the method is unable to determine the mime type of the file.
-            FileTooLargeException: If the file is larger than the specified limit.
+            FileTooLargeException: If the file is larger than the stream's limit,
+                any started multipart upload is aborted.
 
         Returns:
             int: The size of the uploaded file.
 
         """
 
-        seek_to_start(file_to_upload)  # type: ignore
-        size = os.fstat(file_to_upload.fileno()).st_size
+        part_size = max(
+            megabytes_to_bytes(self.settings.upload_file_bytes_per_stream),
+            MIN_PART_SIZE,
+            # * The largest file allowed has to fit in the maximum number of parts.
+            -(-upload_stream.max_bytes // MAX_MULTIPART_COUNT),
+        )
+        MinioMultipartUpload(
+            self.client,
+            bucket_name,
+            s3_file_name,
+            mime_type,
+            part_size=min(part_size, MAX_PART_SIZE),
+            max_in_flight=self.settings.upload_parallel_parts,
+            max_attempts=self.settings.upload_part_attempts,
+        ).upload(upload_stream)
 
-        bytes_per_stream = size
-        if size > self.settings.upload_file_bytes_per_stream:
-            bytes_per_stream = self.settings.upload_file_bytes_per_stream
+        return upload_stream.total_bytes
 
+    def create_multipart_upload(
+        self, bucket_name: str, file_name: str, mime_type: str
+    ) -> str:
         try:
-            self.logger.info(f"Using {file_size_limit} bytes as file limit")
-            expected_max_file_size = (
-                self.settings.max_size_of_a_file
-                if file_size_limit <= 0
-                else file_size_limit
+            return self.client._create_multipart_upload(
+                bucket_name, file_name, {"Content-Type": mime_type}
             )
-            meet_upload_file_limit_rule(
-                file_to_upload, file_limit=expected_max_file_size
+        except MinioException as err:
+            self.print_handled_message(err)
+            raise GeneralException("Unable to start the upload.")
+
+    def upload_part(
+        self,
+        bucket_name: str,
+        file_name: str,
+        upload_id: str,
+        part_number: int,
+        data: bytes,
+    ) -> str:
+        try:
+            return self.client._upload_part(
+                bucket_name, file_name, data, None, upload_id, part_number
             )
-        except GeneralException as raised_exception:
-            raise FileTooLargeException(str(raised_exception))
-
-        seek_to_start(file_to_upload)
-        _: ObjectWriteResult = self.client.put_object(
-            bucket_name=bucket_name,
-            object_name=s3_file_name,
-            data=file_to_upload,
-            length=size,
-            content_type=mime_type,
-        )
+        except MinioException as err:
+            self.print_handled_message(err)
+            raise GeneralException("Unable to upload this part of the file.")
 
-        return size
+    def complete_multipart_upload(
+        self,
+        bucket_name: str,
+        file_name: str,
+        upload_id: str,
+        parts: List[Tuple[int, str]],
+    ):
+        try:
+            self.client._complete_multipart_upload(
+                bucket_name,
+                file_name,
+                upload_id,
+                [Part(part_number, etag) for part_number, etag in parts],
+            )
+        except MinioException as err:
+            self.print_handled_message(err)
+            raise GeneralException("Unable to complete the upload.")
+
+    def abort_multipart_upload(self, bucket_name: str, file_name: str, upload_id: str):
+        try:
+            self.client._abort_multipart_upload(bucket_name, file_name, upload_id)
+        except MinioException as err:
+            self.print_handled_message(err)
+            raise GeneralException("Unable to abort the upload.")
 
     def remove_file_object(self, bucket_name: str, file_name: str):
         try:
@@ -120,28 +294,109 @@ class MinioClient(BaseS3Client):
             self.print_handled_message(err)
             raise GeneralException("Unable to remove S3 bucket.")
 
-    def presigned_download_url(self, bucket_name: str, file_name: str) -> str:
+    def remove_file_objects(self, bucket_name: str, file_names: List[str]) -> List[str]:
+        """
+        Removes the objects with multi-object delete calls, a thousand per request.
+
+        Returns:
+            List[str]: The names of the objects that could not be removed.
+        """
+
         try:
-            return self.client.presigned_get_object(bucket_name, file_name)
+            errors = self.client.remove_objects(
+                bucket_name, (DeleteObject(file_name) for file_name in file_names)
+            )
+            # * The requests are only sent while the errors are read.
+            failed_file_names = []
+            for error in errors:
+                self.logger.error(f"Unable to remove {error.name}: {error.message}")
+                failed_file_names.append(error.name)
+            return failed_file_names
+        except MinioException as err:
+            self.print_handled_message(err)
+            raise GeneralException("Unable to remove S3 files.")
+
+    def list_file_objects(
+        self, bucket_name: str, after: Optional[str], limit: int
+    ) -> Tuple[List[StoredObject], Optional[str]]:
+        """Lists the objects in key order, `after` is the last key of the previous page."""
+
+        try:
+            listed_objects = list(
+                islice(
+                    self.client.list_objects(
+                        bucket_name, recursive=True, start_after=after
+                    ),
+                    # * One more than asked for tells if there is a next page.
+                    limit + 1,
+                )
+            )
+        except S3Error as err:
+            if err.code == "NoSuchBucket":
+                return [], None
+            self.print_handled_message(err)
+            raise GeneralException("Unable to list the S3 bucket.")
+        except MinioException as err:
+            self.print_handled_message(err)
+            raise GeneralException("Unable to list the S3 bucket.")
+
+        stored_objects = [
+            StoredObject(
+                name=listed_object.object_name,  # type: ignore
+                total_bytes=listed_object.size or 0,
+                last_modified=listed_object.last_modified,  # type: ignore
+            )
+            for listed_object in listed_objects[:limit]
+        ]
+        if len(listed_objects) <= limit:
+            return stored_objects, None
+        return stored_objects, stored_objects[-1].name
+
+    def remove_bucket(self, name: str):
+        try:
+            self.client.remove_bucket(name)
+        except MinioException as err:
+            self.print_handled_message(err)
+            raise GeneralException("Unable to remove S3 bucket.")
+
+    def presigned_download_url(
+        self, bucket_name: str, file_name: str, expires: timedelta
+    ) -> str:
+        try:
+            return self.client.presigned_get_object(
+                bucket_name, file_name, expires=expires
+            )
         except MinioException as err:
             self.print_handled_message(err)
             raise GeneralException("Unable to generate a download URL")
 
     def presigned_upload_url(
-        self, bucket_name: str, file_name: str, days_expiring: int
+        self, bucket_name: str, file_name: str, expires: timedelta
     ) -> str:
         try:
             return self.client.presigned_put_object(
-                bucket_name, file_name, expires=timedelta(days=days_expiring)
+                bucket_name, file_name, expires=expires
             )
         except MinioException as err:
             self.print_handled_message(err)
             raise GeneralException("Unable to generate an upload URL")
 
-    def get_file_size(self, bucket_name: str, file_name: str) -> str:
+    def get_file_info(self, bucket_name: str, file_name: str) -> StoredFileInfo:
         try:
             file_object = self.client.stat_object(bucket_name, file_name)
-            return str(file_object.size)
+        except S3Error as err:
+            if err.code == "NoSuchKey":
+                raise BaseNotFoundException("The file was not found in the storage.")
+            self.print_handled_message(err)
+            raise GeneralException("Unable to get the file information.")
         except MinioException as err:
             self.print_handled_message(err)
-            raise GeneralException("Unable to get file size.")
+            raise GeneralException("Unable to get the file information.")
+
+        return StoredFileInfo(
+            total_bytes=file_object.size,  # type: ignore
+            content_type=file_object.content_type,
+        )
+
+    def get_file_size(self, bucket_name: str, file_name: str) -> str:
+        return str(self.get_file_info(bucket_name, file_name).total_bytes)
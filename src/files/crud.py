@@ -1,5 +1,8 @@
-from typing import List, Union
-from uuid import UUID
+from datetime import datetime
+from typing import List, Set, Tuple, Union
+from uuid import UUID, uuid4
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from src.config import setup_logger
 from src.files.utils import format_bucket_name
@@ -8,7 +11,15 @@ from sqlalchemy.engine.row import Row
 
 from src.exceptions import BaseConflictException
 
-from src.models import Bucket, FileObject
+from src.models import (
+    Bucket,
+    FileBlob,
+    FileDerivative,
+    FileObject,
+    ReconcilerCheckpoint,
+    UploadSession,
+    UploadSessionPart,
+)
 from src.users.crud.users import UserCRUD
 
 
@@ -37,6 +48,23 @@ class FileCRUD:
 
         return db_bucket
 
+    def upsert_bucket(self, owner_id) -> UUID:
+        """Creates the owner's bucket unless it exists, in one atomic statement, and returns its id."""
+
+        bucket_name = format_bucket_name(owner_id)
+        bucket_id = self.db.execute(
+            insert(Bucket)
+            .values(id=uuid4(), owner_id=owner_id, name=bucket_name)
+            # * A no-op update, so that the existing row is returned too.
+            .on_conflict_do_update(
+                index_elements=[Bucket.name], set_={"name": bucket_name}
+            )
+            .returning(Bucket.id)
+        ).scalar()
+        self.db.commit()
+
+        return bucket_id
+
     def save_file(
         self,
         file_name: str,
@@ -46,20 +74,25 @@ class FileCRUD:
         extension: str,
         backend_storage: str,
         total_bytes: int = 0,
+        checksum: str = None,  # type: ignore
+        blob_id: UUID = None,  # type: ignore
+        bucket_id: UUID = None,  # type: ignore
+        storage_bucket: str = None,  # type: ignore
     ) -> FileObject:
 
-        db_bucket = self.get_owner_bucket(owner_id)
-        if not db_bucket:
-            self.logger.info(f"Creating bucket for user {owner_id}")
-            db_bucket = self.create_bucket(owner_id)
+        if bucket_id is None:
+            bucket_id = self.upsert_bucket(owner_id)
 
         db_file_object = FileObject(
             original_file_name=original_file_name.lower(),
             file_name=file_name,
-            bucket_id=db_bucket.id,
-            mime_type=extension,
+            bucket_id=bucket_id,
+            storage_bucket=storage_bucket,
+            mime_type=mime_type,
             extension=extension,
             total_bytes=total_bytes,
+            checksum=checksum,
+            blob_id=blob_id,
             backend_storage=backend_storage,
         )
 
@@ -76,6 +109,11 @@ class FileCRUD:
         if db_file_object:
             return db_file_object
 
+    def get_file_by_name(self, file_name: str) -> Union[None, FileObject]:
+        return (
+            self.db.query(FileObject).filter(FileObject.file_name == file_name).first()
+        )
+
     def get_total_bytes_used(self, owner_id: UUID) -> int:
         result = self.db.execute(
             f"SELECT SUM(total_bytes) as total_bytes FROM file_object INNER JOIN bucket ON bucket.id = bucket_id WHERE bucket.owner_id::text = '{owner_id}'"
@@ -112,6 +150,73 @@ class FileCRUD:
 
         return search_filter.all()
 
+    def get_files_with_totals(
+        self,
+        skip: int = 0,
+        limit: int = 10,
+        owner_id: UUID = None,  # type: ignore
+        extension: str = None,  # type: ignore
+        mime_type: str = None,  # type: ignore
+        order_direction: OrderDirection = OrderDirection.DESC,
+    ) -> Tuple[List[FileObject], int, int]:
+        """
+        A page of files along with the number and total size of all the files
+        matching the filters, in one query.
+
+        `mime_type` can also be a whole type, such as `image/*`.
+
+        Returns:
+            Tuple: The files, the number of files and their total bytes.
+        """
+
+        order_by_option = FileObject.date_created.desc()
+        if order_direction == OrderDirection.ASC:
+            order_by_option = FileObject.date_created.asc()
+
+        # * Window functions run before the offset and limit, over every matching row.
+        search_filter = self.db.query(
+            FileObject,
+            func.count().over().label("total"),
+            func.coalesce(func.sum(FileObject.total_bytes).over(), 0).label(
+                "total_bytes"
+            ),
+        )
+        if owner_id is not None:
+            search_filter = search_filter.join(Bucket).filter(
+                Bucket.owner_id == owner_id
+            )
+        if extension is not None:
+            search_filter = search_filter.filter(
+                FileObject.extension == extension.lower().lstrip(".")
+            )
+        if mime_type is not None:
+            if mime_type.endswith("/*"):
+                search_filter = search_filter.filter(
+                    FileObject.mime_type.startswith(mime_type[:-1].lower())
+                )
+            else:
+                search_filter = search_filter.filter(
+                    FileObject.mime_type == mime_type.lower()
+                )
+
+        rows = (
+            search_filter.order_by(order_by_option, FileObject.id)
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+        if rows:
+            return [row[0] for row in rows], rows[0].total, rows[0].total_bytes
+        if skip == 0:
+            return [], 0, 0
+
+        # ? Past the last page there is no row to read the totals from.
+        totals = search_filter.with_entities(
+            func.count(FileObject.id),
+            func.coalesce(func.sum(FileObject.total_bytes), 0),
+        ).one()
+        return [], totals[0], totals[1]
+
     def total_files(
         self,
         owner_id: UUID = None,  # type: ignore
@@ -122,6 +227,28 @@ class FileCRUD:
 
         return cursor.count()
 
+    def get_files_by_ids(
+        self, file_ids: List[UUID], owner_id: UUID = None  # type: ignore
+    ) -> List[FileObject]:
+        """The files with these ids, only the ones the owner has if `owner_id` is given."""
+
+        search_filter = self.db.query(FileObject).filter(FileObject.id.in_(file_ids))
+        if owner_id is not None:
+            search_filter = search_filter.join(Bucket).filter(
+                Bucket.owner_id == owner_id
+            )
+
+        return search_filter.all()
+
+    def get_file_ids(self, owner_id: UUID, limit: int) -> List[UUID]:
+        return [
+            file_id
+            for (file_id,) in self.db.query(FileObject.id)
+            .join(Bucket)
+            .filter(Bucket.owner_id == owner_id)
+            .limit(limit)
+        ]
+
     def remove_file(self, file_id) -> int:
         return (
             self.db.query(FileObject)
@@ -129,9 +256,340 @@ class FileCRUD:
             .delete(synchronize_session=False)
         )
 
-    def remove_files(self, file_ids: List[int]) -> int:
+    def remove_files(self, file_ids: List[UUID]) -> int:
         return (
             self.db.query(FileObject)
             .filter(FileObject.id.in_(file_ids))
             .delete(synchronize_session=False)
         )
+
+    def acquire_blob(self, checksum: str) -> Union[FileBlob, None]:
+        """Adds a reference to the blob holding this content, None if it is not stored yet."""
+
+        blob_id = self.db.execute(
+            update(FileBlob)
+            .where(FileBlob.checksum == checksum)
+            .values(reference_count=FileBlob.reference_count + 1)
+            .returning(FileBlob.id)
+        ).scalar()
+        self.db.commit()
+
+        if blob_id is None:
+            return None
+        return self.db.query(FileBlob).get(blob_id)
+
+    def create_blob(
+        self, checksum: str, bucket_name: str, object_name: str, total_bytes: int
+    ) -> Tuple[Union[FileBlob, None], bool]:
+        """
+        Records a newly stored blob with one reference. If a concurrent upload
+        of the same content got there first, its blob gets the reference.
+
+        Returns:
+            Tuple[FileBlob, bool]: The blob and whether this call created it.
+        """
+
+        blob_id = self.db.execute(
+            insert(FileBlob)
+            .values(
+                id=uuid4(),
+                checksum=checksum,
+                bucket_name=bucket_name,
+                object_name=object_name,
+                total_bytes=total_bytes,
+                reference_count=1,
+            )
+            .on_conflict_do_nothing(index_elements=[FileBlob.checksum])
+            .returning(FileBlob.id)
+        ).scalar()
+        self.db.commit()
+
+        if blob_id is None:
+            return self.acquire_blob(checksum), False
+        return self.db.query(FileBlob).get(blob_id), True
+
+    def release_blob(self, blob_id: UUID, references: int = 1) -> Union[Row, None]:
+        """
+        Drops `references` references to the blob, and the blob itself with
+        the last one, in the caller's transaction.
+
+        Returns:
+            Row: The bucket_name and object_name of a blob nothing references
+                any more, its stored object should be removed.
+        """
+
+        self.db.execute(
+            update(FileBlob)
+            .where(FileBlob.id == blob_id)
+            .values(reference_count=FileBlob.reference_count - references)
+        )
+        # * The condition keeps a blob that was acquired again in the meantime.
+        removed_blob = self.db.execute(
+            delete(FileBlob)
+            .where(FileBlob.id == blob_id, FileBlob.reference_count <= 0)
+            .returning(FileBlob.bucket_name, FileBlob.object_name)
+        ).first()
+
+        return removed_blob
+
+    def save_derivative(
+        self,
+        file_object_id: UUID,
+        size: int,
+        format: str,
+        mime_type: str,
+        storage_bucket: str,
+        object_name: str,
+        total_bytes: int,
+        checksum: str,
+    ) -> None:
+        """Records a derivative, replacing the one of the same size and format if it was rendered before."""
+
+        values = {
+            "mime_type": mime_type,
+            "storage_bucket": storage_bucket,
+            "object_name": object_name,
+            "total_bytes": total_bytes,
+            "checksum": checksum,
+        }
+        self.db.execute(
+            insert(FileDerivative)
+            .values(
+                id=uuid4(),
+                file_object_id=file_object_id,
+                size=size,
+                format=format,
+                **values,
+            )
+            .on_conflict_do_update(
+                index_elements=[
+                    FileDerivative.file_object_id,
+                    FileDerivative.size,
+                    FileDerivative.format,
+                ],
+                set_=values,
+            )
+        )
+        self.db.commit()
+
+    def get_derivatives_of_files(self, file_ids: List[UUID]) -> List[FileDerivative]:
+        return (
+            self.db.query(FileDerivative)
+            .filter(FileDerivative.file_object_id.in_(file_ids))
+            .all()
+        )
+
+    def get_derivatives(self, file_object_id: UUID) -> List[FileDerivative]:
+        return (
+            self.db.query(FileDerivative)
+            .filter(FileDerivative.file_object_id == file_object_id)
+            .order_by(FileDerivative.size.asc())
+            .all()
+        )
+
+    def get_storage_bucket_names(self) -> Set[str]:
+        """Every storage bucket a file, blob or derivative row points into."""
+
+        bucket_names = self.db.query(Bucket.name).union(
+            self.db.query(FileObject.storage_bucket).filter(
+                FileObject.storage_bucket.isnot(None)
+            ),
+            self.db.query(FileBlob.bucket_name),
+            self.db.query(FileDerivative.storage_bucket),
+        )
+        return {bucket_name for (bucket_name,) in bucket_names}
+
+    def get_referenced_object_names(
+        self, bucket_name: str, object_names: List[str]
+    ) -> Set[str]:
+        """The ones of `object_names` a file, blob or derivative row of the bucket points to."""
+
+        if not object_names:
+            return set()
+
+        file_names = (
+            self.db.query(FileObject.file_name)
+            .join(Bucket)
+            .filter(
+                FileObject.file_name.in_(object_names),
+                func.coalesce(FileObject.storage_bucket, Bucket.name) == bucket_name,
+            )
+            .union(
+                self.db.query(FileBlob.object_name).filter(
+                    FileBlob.bucket_name == bucket_name,
+                    FileBlob.object_name.in_(object_names),
+                ),
+                self.db.query(FileDerivative.object_name).filter(
+                    FileDerivative.storage_bucket == bucket_name,
+                    FileDerivative.object_name.in_(object_names),
+                ),
+            )
+        )
+        return {file_name for (file_name,) in file_names}
+
+    def get_files_after(
+        self, file_id: Union[UUID, None], created_before: datetime, limit: int
+    ) -> List[FileObject]:
+        """The next `limit` files in id order, created before `created_before`."""
+
+        search_filter = self.db.query(FileObject).filter(
+            FileObject.date_created < created_before
+        )
+        if file_id is not None:
+            search_filter = search_filter.filter(FileObject.id > file_id)
+
+        return search_filter.order_by(FileObject.id.asc()).limit(limit).all()
+
+    def get_checkpoint(self, name: str) -> Union[ReconcilerCheckpoint, None]:
+        return self.db.query(ReconcilerCheckpoint).get(name)
+
+    def save_checkpoint(
+        self, name: str, bucket_name: Union[str, None], marker: Union[str, None]
+    ) -> None:
+        values = {"bucket_name": bucket_name, "marker": marker}
+        self.db.execute(
+            insert(ReconcilerCheckpoint)
+            .values(name=name, **values)
+            .on_conflict_do_update(
+                index_elements=[ReconcilerCheckpoint.name],
+                set_={**values, "date_updated": func.now()},
+            )
+        )
+        self.db.commit()
+
+    def create_upload_session(self, **values) -> UploadSession:
+        db_upload_session = UploadSession(**values)
+        self.db.add(db_upload_session)
+        self.db.commit()
+        self.db.refresh(db_upload_session)
+
+        return db_upload_session
+
+    def get_upload_session(
+        self, upload_session_id: UUID, owner_id: UUID, for_update: bool = False
+    ) -> Union[UploadSession, None]:
+        """The owner's upload session, locked until the transaction ends with `for_update`."""
+
+        search_filter = self.db.query(UploadSession).filter(
+            UploadSession.id == upload_session_id,
+            UploadSession.owner_id == owner_id,
+        )
+        if for_update:
+            search_filter = search_filter.with_for_update()
+
+        return search_filter.first()
+
+    def touch_upload_session(self, upload_session_id: UUID) -> bool:
+        """Moves the session's expiry forward in the caller's transaction, False if it is gone."""
+
+        touched_id = self.db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload_session_id)
+            .values(date_updated=func.now())
+            .returning(UploadSession.id)
+        ).scalar()
+
+        return touched_id is not None
+
+    def start_upload_session(
+        self, upload_session_id: UUID, upload_id: str, mime_type: str, extension: str
+    ) -> bool:
+        """Records the storage multipart upload, False when another request recorded one first."""
+
+        started_id = self.db.execute(
+            update(UploadSession)
+            .where(
+                UploadSession.id == upload_session_id,
+                UploadSession.upload_id.is_(None),
+            )
+            .values(upload_id=upload_id, mime_type=mime_type, extension=extension)
+            .returning(UploadSession.id)
+        ).scalar()
+        self.db.commit()
+
+        return started_id is not None
+
+    def save_upload_part(
+        self,
+        upload_session_id: UUID,
+        offset: int,
+        part_number: int,
+        data_size: int,
+        etag: str,
+    ) -> bool:
+        """
+        Records a received part and moves the session's offset past it, in the
+        caller's transaction. False when the offset is no longer `offset`, as
+        another request recorded this chunk first.
+        """
+
+        advanced_id = self.db.execute(
+            update(UploadSession)
+            .where(
+                UploadSession.id == upload_session_id,
+                UploadSession.received_bytes == offset,
+            )
+            .values(received_bytes=offset + data_size, date_updated=func.now())
+            .returning(UploadSession.id)
+        ).scalar()
+        if advanced_id is None:
+            return False
+
+        self.db.execute(
+            insert(UploadSessionPart).values(
+                id=uuid4(),
+                upload_session_id=upload_session_id,
+                part_number=part_number,
+                etag=etag,
+            )
+            # * A part sent again after a lost response replaces the first one.
+            .on_conflict_do_update(
+                index_elements=[
+                    UploadSessionPart.upload_session_id,
+                    UploadSessionPart.part_number,
+                ],
+                set_={"etag": etag},
+            )
+        )
+        return True
+
+    def get_upload_parts(self, upload_session_id: UUID) -> List[Tuple[int, str]]:
+        return [
+            (part_number, etag)
+            for part_number, etag in self.db.query(
+                UploadSessionPart.part_number, UploadSessionPart.etag
+            )
+            .filter(UploadSessionPart.upload_session_id == upload_session_id)
+            .order_by(UploadSessionPart.part_number.asc())
+        ]
+
+    def get_user_upload_sessions(self, owner_id: UUID) -> List[UploadSession]:
+        return (
+            self.db.query(UploadSession)
+            .filter(UploadSession.owner_id == owner_id)
+            .all()
+        )
+
+    def remove_upload_session(self, upload_session_id: UUID) -> int:
+        return (
+            self.db.query(UploadSession)
+            .filter(UploadSession.id == upload_session_id)
+            .delete(synchronize_session=False)
+        )
+
+    def get_expired_upload_sessions(
+        self, updated_before: datetime, limit: int
+    ) -> List[UploadSession]:
+        """
+        Sessions untouched since `updated_before`, skipping the ones another
+        sweeper is holding. A chunk being sent has touched its session first.
+        """
+
+        return (
+            self.db.query(UploadSession)
+            .filter(UploadSession.date_updated < updated_before)
+            .order_by(UploadSession.date_updated.asc())
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
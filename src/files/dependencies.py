@@ -0,0 +1,17 @@
+from fastapi import Depends
+from sqlalchemy.orm import Session
+
+from src.auth.dependencies import get_current_active_user
+from src.config import Settings
+from src.database import get_db_sess
+from src.files.service import FileService
+from src.service import get_settings
+from src.users.schemas import UserOut
+
+
+def initiate_file_service(
+    current_user: UserOut = Depends(get_current_active_user),
+    db: Session = Depends(get_db_sess),
+    app_settings: Settings = Depends(get_settings),
+):
+    return FileService(requesting_user=current_user, db=db, app_settings=app_settings)
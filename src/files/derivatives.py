@@ -0,0 +1,130 @@
+"""Image Derivatives"""
+
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+# * Square sizes, in px, rendered for every uploaded photo.
+IMAGE_DERIVATIVE_SIZES = (32, 64, 128, 300)
+
+# * Served when the client accepts them, in this order of preference.
+NEGOTIABLE_IMAGE_FORMATS = {"avif": "image/avif", "webp": "image/webp"}
+
+FALLBACK_IMAGE_FORMATS = {"jpeg": "image/jpeg", "png": "image/png"}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class RenderedDerivative:
+    size: int
+    format: str
+    mime_type: str
+    body: bytes
+
+    def __init__(self, size: int, format: str, mime_type: str, body: bytes) -> None:
+        self.size = size
+        self.format = format
+        self.mime_type = mime_type
+        self.body = body
+
+
+def is_avif_supported() -> bool:
+    try:
+        # * Registers the AVIF codec with Pillow.
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        return False
+
+    return True
+
+
+def get_accepted_image_formats(accept_header: Optional[str]) -> List[str]:
+    """The negotiable formats the `Accept` header allows, most preferred first."""
+
+    accepted_mime_types = set()
+    for media_range in (accept_header or "").split(","):
+        mime_type, *params = [part.strip() for part in media_range.split(";")]
+        if any(param.replace(" ", "") in ("q=0", "q=0.0") for param in params):
+            continue
+        accepted_mime_types.add(mime_type.lower())
+
+    return [
+        image_format
+        for image_format, mime_type in NEGOTIABLE_IMAGE_FORMATS.items()
+        if mime_type in accepted_mime_types
+    ]
+
+
+def render_image_derivatives(
+    content: bytes, sizes: Sequence[int] = IMAGE_DERIVATIVE_SIZES
+) -> List[RenderedDerivative]:
+    """
+    Renders square, center cropped copies of the image at every size it is
+    large enough for, as WebP (and AVIF when available) plus JPEG, or PNG for
+    images with transparency.
+
+    The EXIF orientation is applied and then every metadata but the colour
+    profile is dropped, which strips location and camera data too.
+    """
+
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(content))
+    # * Lets the JPEG decoder downscale while decoding, far cheaper than a full decode.
+    image.draft("RGB", (max(sizes), max(sizes)))
+    image = ImageOps.exif_transpose(image)
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    icc_profile = image.info.get("icc_profile")
+    image.info = {}
+
+    image_formats = {"webp": NEGOTIABLE_IMAGE_FORMATS["webp"]}
+    if is_avif_supported():
+        image_formats["avif"] = NEGOTIABLE_IMAGE_FORMATS["avif"]
+    fallback_format = "png" if has_alpha else "jpeg"
+    image_formats[fallback_format] = FALLBACK_IMAGE_FORMATS[fallback_format]
+
+    derivatives = []
+    for size in sizes:
+        if size > min(image.size):
+            continue
+
+        resized_image = ImageOps.fit(
+            image, (size, size), method=Image.Resampling.LANCZOS
+        )
+        for image_format, mime_type in image_formats.items():
+            buffer = io.BytesIO()
+            save_options = {"quality": 80} if image_format != "png" else {}
+            if icc_profile:
+                save_options["icc_profile"] = icc_profile
+            resized_image.save(buffer, format=image_format.upper(), **save_options)
+            derivatives.append(
+                RenderedDerivative(size, image_format, mime_type, buffer.getvalue())
+            )
+
+    return derivatives
+
+
+def get_derivatives_executor(max_workers: int) -> ThreadPoolExecutor:
+    """The process-wide pool derivatives are rendered on, away from the request threads."""
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="image-derivatives"
+            )
+        return _executor
+
+
+def shutdown_derivatives_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -0,0 +1,226 @@
+"""Read-through Disk Cache"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+
+from src.metrics import register_stats
+
+# * Where fills are written before they are moved into place, inside the cache directory.
+INCOMING_DIRECTORY = ".incoming"
+
+
+class DiskFileCache:
+    """
+    Keeps copies of stored objects on the local disk (or a tmpfs), so hot
+    files are not fetched from the backend storage on every read.
+
+    Stored object names never get new content, so entries are never stale
+    and only have to be dropped when the object is removed. The cache holds
+    up to `max_bytes`, least recently used first out, and objects larger
+    than `max_file_bytes` are not cached at all. A fill is written aside and
+    renamed into place, and concurrent misses of one object fetch it once.
+
+    Every worker process keeps its own index over the shared directory and
+    enforces `max_bytes` for the entries it knows about.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_file_bytes: int) -> None:
+        self.directory = os.path.abspath(directory)
+        self.incoming = os.path.join(self.directory, INCOMING_DIRECTORY)
+        self.max_bytes = max_bytes
+        self.max_file_bytes = min(max_file_bytes, max_bytes)
+
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+        self.fill_errors = 0
+        self.bytes_saved = 0
+
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._fills: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(self.incoming, exist_ok=True)
+        self._load_entries()
+
+    def _get_path(self, bucket_name: str, file_name: str) -> str:
+        digest = hashlib.sha256(
+            f"{bucket_name}/{file_name}".encode("utf-8")
+        ).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _load_entries(self):
+        """Indexes what a previous run left behind, oldest first."""
+
+        found = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir() or shard.name == INCOMING_DIRECTORY:
+                continue
+            for entry in os.scandir(shard.path):
+                file_stat = entry.stat()
+                found.append((file_stat.st_mtime, entry.path, file_stat.st_size))
+
+        with self._lock:
+            for _, path, size in sorted(found):
+                self._add_entry(path, size)
+
+    def _add_entry(self, path: str, size: int):
+        if path in self._entries:
+            self.total_bytes -= self._entries.pop(path)
+        self._entries[path] = size
+        self.total_bytes += size
+
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            evicted_path, evicted_size = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+            # * Open readers keep the content until they are done.
+            try:
+                os.remove(evicted_path)
+            except FileNotFoundError:
+                pass
+
+    def _drop_entry(self, path: str):
+        if path in self._entries:
+            self.total_bytes -= self._entries.pop(path)
+
+    def _open_entry(self, path: str) -> Optional[BinaryIO]:
+        """Opens a cached copy, also one another worker process filled."""
+
+        try:
+            cached_file = open(path, "rb")
+        except FileNotFoundError:
+            with self._lock:
+                self._drop_entry(path)
+            return None
+
+        size = os.fstat(cached_file.fileno()).st_size
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+            else:
+                self._add_entry(path, size)
+            self.hits += 1
+            # * Every hit is a fetch from the backend storage saved.
+            self.bytes_saved += size
+
+        return cached_file
+
+    def open(
+        self,
+        bucket_name: str,
+        file_name: str,
+        get_size: Callable[[], int],
+        fill: Callable[[BinaryIO], None],
+    ) -> Optional[BinaryIO]:
+        """
+        Opens the cached copy of the object, filling it on a miss.
+
+        Args:
+            get_size (Callable): Returns the size of the stored object.
+            fill (Callable): Writes the stored object into the given file.
+
+        Returns:
+            BinaryIO: The cached copy, to be closed by the caller. None if the
+                object is too large to be cached.
+        """
+
+        path = self._get_path(bucket_name, file_name)
+        cached_file = self._open_entry(path)
+        if cached_file is not None:
+            return cached_file
+
+        with self._lock:
+            fill_lock = self._fills.setdefault(path, threading.Lock())
+
+        with fill_lock:
+            try:
+                # * Another thread might have filled it while this one waited.
+                cached_file = self._open_entry(path)
+                if cached_file is not None:
+                    return cached_file
+
+                if get_size() > self.max_file_bytes:
+                    with self._lock:
+                        self.bypasses += 1
+                    return None
+
+                with self._lock:
+                    self.misses += 1
+                cached_file = self._fill(path, fill)
+                with self._lock:
+                    self._add_entry(path, os.fstat(cached_file.fileno()).st_size)
+                return cached_file
+            finally:
+                with self._lock:
+                    self._fills.pop(path, None)
+
+    def _fill(self, path: str, fill: Callable[[BinaryIO], None]) -> BinaryIO:
+        """Writes the object aside and moves it into place, returns it opened for reading."""
+
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.incoming)
+        cached_file = None
+        try:
+            with os.fdopen(file_descriptor, "wb") as temporary_file:
+                fill(temporary_file)
+            # * Opened before it is visible, so an eviction can not get in between.
+            cached_file = open(temporary_path, "rb")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temporary_path, path)
+        except BaseException:
+            with self._lock:
+                self.fill_errors += 1
+            if cached_file is not None:
+                cached_file.close()
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+        return cached_file
+
+    def remove(self, bucket_name: str, file_name: str):
+        path = self._get_path(bucket_name, file_name)
+        with self._lock:
+            self._drop_entry(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "evictions": self.evictions,
+                "fill_errors": self.fill_errors,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "total_bytes": self.total_bytes,
+                "entries": len(self._entries),
+            }
+
+
+_file_caches: Dict[Tuple[str, int, int], DiskFileCache] = {}
+_file_caches_lock = threading.Lock()
+
+
+def get_file_cache(
+    directory: str, max_bytes: int, max_file_bytes: int
+) -> DiskFileCache:
+    """The process-wide cache for this directory, created on first use."""
+
+    key = (os.path.abspath(directory), max_bytes, max_file_bytes)
+    with _file_caches_lock:
+        if key not in _file_caches:
+            _file_caches[key] = DiskFileCache(directory, max_bytes, max_file_bytes)
+            register_stats("file_cache", _file_caches[key].stats)
+        return _file_caches[key]
@@ -0,0 +1,137 @@
+"""Parallel Multipart Uploads"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import chain
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+from src.config import setup_logger
+
+
+class MultipartUpload:
+    """
+    Sends a stream of unknown length to the storage in parts of `part_size`
+    bytes, with up to `max_in_flight` parts being sent at the same time.
+
+    The stream is read on the calling thread, one part ahead of the uploads,
+    so at most `max_in_flight + 1` parts are held in memory. A failed part is
+    retried on its own, and the multipart upload is aborted if a part keeps
+    failing or the stream raises, e.g. once it goes over its size limit.
+
+    A stream that fits in a single part is sent with one plain request.
+    Subclasses implement the calls to the storage.
+    """
+
+    def __init__(
+        self,
+        part_size: int,
+        max_in_flight: int,
+        max_attempts: int = 3,
+        retry_backoff_seconds: float = 0.5,
+    ) -> None:
+        self.part_size = part_size
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.logger = setup_logger()
+
+    def put_object(self, data: bytes):
+        raise NotImplementedError
+
+    def create(self) -> str:
+        """Starts a multipart upload and returns its id."""
+
+        raise NotImplementedError
+
+    def upload_part(self, upload_id: str, part_number: int, data: bytes) -> str:
+        """Sends one part and returns its ETag."""
+
+        raise NotImplementedError
+
+    def complete(self, upload_id: str, parts: List[Tuple[int, str]]):
+        raise NotImplementedError
+
+    def abort(self, upload_id: str):
+        raise NotImplementedError
+
+    def _iter_parts(self, source: BinaryIO) -> Iterator[bytes]:
+        while True:
+            chunks = []
+            missing = self.part_size
+            while missing > 0:
+                chunk = source.read(missing)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                missing -= len(chunk)
+
+            if chunks:
+                yield b"".join(chunks)
+            if missing > 0:
+                return
+
+    def _upload_part_with_retries(
+        self, upload_id: str, part_number: int, data: bytes
+    ) -> str:
+        attempt = 1
+        while True:
+            try:
+                return self.upload_part(upload_id, part_number, data)
+            except Exception as raised_exception:
+                if attempt >= self.max_attempts:
+                    raise
+                self.logger.warning(
+                    f"Part {part_number} failed on attempt {attempt}, retrying: {raised_exception}"
+                )
+                time.sleep(self.retry_backoff_seconds * 2 ** (attempt - 1))
+                attempt += 1
+
+    def upload(self, source: BinaryIO):
+        parts = self._iter_parts(source)
+        first_part = next(parts, b"")
+        second_part = next(parts, None)
+        if second_part is None:
+            self.put_object(first_part)
+            return
+
+        upload_id = self.create()
+        try:
+            etags = self._upload_parts(
+                upload_id, chain([first_part, second_part], parts)
+            )
+            self.complete(upload_id, sorted(etags.items()))
+        except BaseException:
+            try:
+                self.abort(upload_id)
+            except Exception as raised_exception:
+                # ? The storage's lifecycle rules have to clean this one up.
+                self.logger.exception(raised_exception)
+            raise
+
+    def _upload_parts(self, upload_id: str, parts: Iterator[bytes]) -> Dict[int, str]:
+        etags: Dict[int, str] = {}
+        in_flight: Dict[Future, int] = {}
+
+        def collect(futures):
+            for future in futures:
+                etags[in_flight.pop(future)] = future.result()
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="multipart-upload"
+        )
+        try:
+            for part_number, data in enumerate(parts, start=1):
+                while len(in_flight) >= self.max_in_flight:
+                    collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+                in_flight[
+                    executor.submit(
+                        self._upload_part_with_retries, upload_id, part_number, data
+                    )
+                ] = part_number
+
+            collect(wait(in_flight).done)
+        finally:
+            # * Parts already being sent finish, the queued ones are dropped.
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return etags
@@ -0,0 +1,225 @@
+import hashlib
+from typing import Any, BinaryIO, Iterator, Union
+
+from src.exceptions import FileTooLargeException
+from src.files.utils import ONE_KB, ONE_MEGA_BYTE
+
+# * Bytes read from the source at a time. The first chunk is also used to sniff
+# * the file type, so it must hold at least the 8 KiB filetype looks at.
+UPLOAD_CHUNK_SIZE = 64 * ONE_KB
+
+# * The number of leading bytes filetype needs to recognise a file.
+FILE_TYPE_HEAD_SIZE = 8 * ONE_KB
+
+
+def format_file_size_limit(max_bytes: int) -> str:
+    if max_bytes < ONE_MEGA_BYTE:
+        return f"{max_bytes / ONE_KB} kb"
+    return f"{max_bytes / ONE_MEGA_BYTE} mb"
+
+
+def iter_file_chunks(
+    opened_file: BinaryIO,
+    offset: int = 0,
+    length: int = 0,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Yields `length` bytes of the file from `offset`, to the end if `length` is 0, and closes it."""
+
+    with opened_file:
+        opened_file.seek(offset)
+        remaining = length if length > 0 else None
+        while remaining is None or remaining > 0:
+            chunk = opened_file.read(
+                chunk_size if remaining is None else min(chunk_size, remaining)
+            )
+            if not chunk:
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def sniff_file_type(head: bytes) -> Any:
+    """Returns the filetype match for the first bytes of a file, None if it is unknown."""
+
+    from filetype import filetype
+
+    return filetype.guess(head)
+
+
+class FileInspection:
+    """
+    What the upload path knows about a file: its type, sniffed once from the
+    first bytes, and the size and SHA-256 of the bytes read so far.
+
+    Every validation step reads it instead of looking at the file again.
+    """
+
+    def __init__(self) -> None:
+        self.kind: Any = None
+        self.total_bytes = 0
+        self._digest = hashlib.sha256()
+
+    @classmethod
+    def from_head(cls, head: bytes) -> "FileInspection":
+        """The type of a file that is not read through, from its first bytes."""
+
+        inspection = cls()
+        inspection.sniff(head)
+        return inspection
+
+    def sniff(self, head: bytes):
+        self.kind = sniff_file_type(head)
+
+    def update(self, chunk: bytes):
+        self.total_bytes += len(chunk)
+        self._digest.update(chunk)
+
+    @property
+    def extension(self) -> Union[str, None]:
+        return self.kind.extension if self.kind else None
+
+    @property
+    def mime_type(self) -> Union[str, None]:
+        return self.kind.mime if self.kind else None
+
+    @property
+    def is_image(self) -> bool:
+        return self.mime_type is not None and self.mime_type.startswith("image/")
+
+    @property
+    def checksum(self) -> str:
+        """The SHA-256 of the bytes read so far, the whole file once the stream is exhausted."""
+
+        return self._digest.hexdigest()
+
+
+class UploadStream:
+    """
+    A single pass over an uploaded file.
+
+    The first bytes are read up front to sniff the file type, then every read
+    counts the bytes, enforces the size limit and updates the checksum, so the
+    storage backend can consume it as a plain stream without the file being
+    copied to disk, measured with fstat or read more than once. What is
+    learned along the way is kept in `inspection`.
+    """
+
+    def __init__(
+        self, source: BinaryIO, max_bytes: int, chunk_size: int = UPLOAD_CHUNK_SIZE
+    ) -> None:
+        self.source = source
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.inspection = FileInspection()
+
+        self._pending = self._read_head()
+        self.head = self._pending
+        self.inspection.sniff(self.head)
+
+    @property
+    def kind(self) -> Any:
+        return self.inspection.kind
+
+    @property
+    def extension(self) -> Union[str, None]:
+        return self.inspection.extension
+
+    @property
+    def mime_type(self) -> Union[str, None]:
+        return self.inspection.mime_type
+
+    @property
+    def is_image(self) -> bool:
+        return self.inspection.is_image
+
+    @property
+    def total_bytes(self) -> int:
+        return self.inspection.total_bytes
+
+    @property
+    def checksum(self) -> str:
+        return self.inspection.checksum
+
+    def _read_source(self, size: int) -> bytes:
+        chunk = self.source.read(size)
+        self.inspection.update(chunk)
+        return chunk
+
+    def _read_head(self) -> bytes:
+        """
+        Reads the first chunk, and more if it is too short to sniff the type.
+        Streams such as request bodies may return less than asked for.
+
+        Never reads past the limit, so going over it is raised by `read`.
+        """
+
+        parts = [self._read_source(min(self.chunk_size, self.max_bytes))]
+        buffered = len(parts[0])
+        while parts[-1] and buffered < min(FILE_TYPE_HEAD_SIZE, self.max_bytes):
+            parts.append(
+                self._read_source(min(FILE_TYPE_HEAD_SIZE, self.max_bytes) - buffered)
+            )
+            buffered += len(parts[-1])
+
+        return b"".join(parts)
+
+    def buffer_ahead(self, size: int) -> bool:
+        """
+        Reads up to `size` bytes ahead into memory, later reads replay them.
+
+        Returns:
+            bool: True if the whole file is buffered, its checksum and size are
+                then final before anything is sent anywhere.
+        """
+
+        parts = [self._pending]
+        buffered = len(self._pending)
+        is_complete = False
+        while buffered < size and self.total_bytes <= self.max_bytes:
+            chunk = self._read_source(
+                min(
+                    self.chunk_size,
+                    size - buffered,
+                    self.max_bytes + 1 - self.total_bytes,
+                )
+            )
+            if not chunk:
+                is_complete = True
+                break
+            parts.append(chunk)
+            buffered += len(chunk)
+
+        self._pending = b"".join(parts)
+
+        if self.total_bytes > self.max_bytes:
+            raise FileTooLargeException(
+                f"Your file size can not be more than {format_file_size_limit(self.max_bytes)}."
+            )
+
+        return is_complete
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.max_bytes + 1
+
+        parts = [self._pending[:size]]
+        self._pending = self._pending[size:]
+        missing = size - len(parts[0])
+        while missing > 0 and self.total_bytes <= self.max_bytes:
+            # * Never read more than one byte past the limit.
+            chunk = self._read_source(
+                min(missing, self.max_bytes + 1 - self.total_bytes)
+            )
+            if not chunk:
+                break
+            parts.append(chunk)
+            missing -= len(chunk)
+
+        if self.total_bytes > self.max_bytes:
+            raise FileTooLargeException(
+                f"Your file size can not be more than {format_file_size_limit(self.max_bytes)}."
+            )
+
+        return b"".join(parts)
@@ -0,0 +1,70 @@
+"""Presigned URL Cache"""
+
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Callable, Tuple
+
+
+class PresignedUrlCache:
+    """
+    Keeps presigned URLs per object until they are close to expiring.
+
+    Signing is cheap, but MinIO may look up the bucket region first, and a
+    stable URL lets browsers reuse what they already downloaded. The cache is
+    shared by the whole process and bounded to `max_entries`, least recently
+    used first out.
+    """
+
+    def __init__(self, max_entries: int = 4096) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, datetime.datetime]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def refresh_margin(expires_in: datetime.timedelta) -> datetime.timedelta:
+        """A URL is replaced once less than a fifth of its lifetime, and at least a minute, is left."""
+
+        return max(expires_in / 5, datetime.timedelta(minutes=1))
+
+    def get_or_sign(
+        self,
+        bucket_name: str,
+        file_name: str,
+        expires_in: datetime.timedelta,
+        sign: Callable[[], str],
+    ) -> Tuple[str, datetime.datetime]:
+        """Returns the cached URL and its expiry, calling `sign` only if there is none left worth handing out."""
+
+        key = (bucket_name, file_name)
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] - now > self.refresh_margin(expires_in):
+                self._entries.move_to_end(key)
+                return entry
+
+        url = sign()
+        entry = (url, now + expires_in)
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return entry
+
+    def invalidate(self, bucket_name: str, file_name: str):
+        with self._lock:
+            self._entries.pop((bucket_name, file_name), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+presigned_download_urls = PresignedUrlCache()
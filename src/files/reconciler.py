@@ -0,0 +1,285 @@
+"""Orphan Reconciler"""
+
+import argparse
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Union
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.config import Settings, setup_logger
+from src.exceptions import BaseNotFoundException, GeneralException
+from src.files.crud import FileCRUD
+from src.files.schemas import FileObjectOut
+from src.files.service import get_stored_file_data
+from src.files.storage import BackendStorage
+from src.files.utils import OrphanAction
+
+# * Checkpoints of the two walks, the objects of the buckets and the file rows.
+OBJECTS_CHECKPOINT = "objects"
+FILES_CHECKPOINT = "files"
+
+# * Held for a whole run, so only one worker process reconciles at a time.
+RECONCILER_LOCK_KEY = 7_340_001
+
+# * How many ids of files without an object a report keeps.
+MAX_REPORTED_FILE_IDS = 100
+
+_reconciler_thread: Optional[threading.Thread] = None
+_reconciler_stop = threading.Event()
+_reconciler_lock = threading.Lock()
+
+
+class ReconcileReport:
+    def __init__(self) -> None:
+        self.pages = 0
+        self.objects_scanned = 0
+        self.orphaned_objects = 0
+        self.orphaned_bytes = 0
+        self.removed_objects = 0
+        self.reclaimed_bytes = 0
+        self.files_checked = 0
+        self.missing_file_ids: List[str] = []
+        self.missing_files = 0
+
+    def to_dict(self) -> Dict[str, Union[int, List[str]]]:
+        return dict(self.__dict__)
+
+
+class OrphanReconciler:
+    """
+    Finds stored objects no file, blob or derivative row points to, and file
+    rows whose object is gone.
+
+    Both are walked a page at a time from a checkpoint kept in the database,
+    so a run picks up where the previous one stopped, and a run stops after
+    `orphan_reconciler_pages_per_run` pages with a pause between pages, to
+    stay out of the way of user traffic. Each page is diffed against the rows
+    with one query.
+
+    Objects younger than the grace period are left alone, they might belong
+    to an upload still in progress. Older orphans are removed with
+    `OrphanAction.DELETE`, and only reported with `OrphanAction.REPORT`.
+    File rows without an object are always only reported, they are what the
+    users see and an admin has to decide what happens to them.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        app_settings: Settings,
+        stop_event: Optional[threading.Event] = None,
+    ) -> None:
+        self.db = db
+        self.app_settings = app_settings
+        self.crud = FileCRUD(db)
+        self.backend_storage = BackendStorage(app_settings)
+        self.stop_event = stop_event or threading.Event()
+        self.logger = setup_logger()
+
+        # ? A direct upload has no row until it is finalized, which can take
+        # ? until its presigned URL expires.
+        self.grace_period = timedelta(
+            minutes=max(
+                app_settings.orphan_grace_period_minutes,
+                app_settings.presigned_url_expire_minutes,
+            )
+        )
+
+    def _pause(self) -> bool:
+        """Waits between two pages, returns True if the reconciler is being stopped."""
+
+        return self.stop_event.wait(self.app_settings.orphan_reconciler_pause_seconds)
+
+    def _get_next_bucket_name(self, bucket_name: Optional[str]) -> Optional[str]:
+        """The bucket walked after this one, the first one again after the last."""
+
+        bucket_names = sorted(self.crud.get_storage_bucket_names())
+        if not bucket_names:
+            return None
+
+        for next_bucket_name in bucket_names:
+            if bucket_name is None or next_bucket_name > bucket_name:
+                return next_bucket_name
+        return bucket_names[0]
+
+    def reconcile_objects_page(self, report: ReconcileReport):
+        """Lists the next page of objects and removes, or reports, the orphans in it."""
+
+        checkpoint = self.crud.get_checkpoint(OBJECTS_CHECKPOINT)
+        bucket_name = checkpoint.bucket_name if checkpoint else None
+        marker = checkpoint.marker if checkpoint else None
+        if bucket_name is None:
+            bucket_name = self._get_next_bucket_name(None)
+            if bucket_name is None:
+                return
+
+        stored_objects, next_marker = self.backend_storage.list_files(
+            bucket_name, marker, self.app_settings.orphan_reconciler_page_size
+        )
+        report.objects_scanned += len(stored_objects)
+
+        referenced_names = self.crud.get_referenced_object_names(
+            bucket_name, [stored_object.name for stored_object in stored_objects]
+        )
+        created_before = datetime.now(timezone.utc) - self.grace_period
+        orphans = [
+            stored_object
+            for stored_object in stored_objects
+            if stored_object.name not in referenced_names
+            and stored_object.last_modified < created_before
+        ]
+
+        report.orphaned_objects += len(orphans)
+        report.orphaned_bytes += sum(orphan.total_bytes for orphan in orphans)
+        for orphan in orphans:
+            self.logger.warning(
+                f"Orphaned object {bucket_name}/{orphan.name} ({orphan.total_bytes} bytes)"
+            )
+
+        if orphans and self.app_settings.orphan_action == OrphanAction.DELETE.value:
+            failed_names = set(
+                self.backend_storage.remove_files(
+                    bucket_name, [orphan.name for orphan in orphans]
+                )
+            )
+            removed = [orphan for orphan in orphans if orphan.name not in failed_names]
+            report.removed_objects += len(removed)
+            report.reclaimed_bytes += sum(orphan.total_bytes for orphan in removed)
+
+        if next_marker is None:
+            # * Done with this bucket, the next run starts on the next one.
+            bucket_name = self._get_next_bucket_name(bucket_name)
+        self.crud.save_checkpoint(OBJECTS_CHECKPOINT, bucket_name, next_marker)
+
+    def check_files_page(self, report: ReconcileReport):
+        """Looks up the objects of the next page of file rows, and reports the missing ones."""
+
+        checkpoint = self.crud.get_checkpoint(FILES_CHECKPOINT)
+        last_file_id = (
+            UUID(checkpoint.marker) if checkpoint and checkpoint.marker else None
+        )
+
+        file_objects = self.crud.get_files_after(
+            last_file_id,
+            created_before=datetime.now(timezone.utc) - self.grace_period,
+            limit=self.app_settings.orphan_reconciler_page_size,
+        )
+        for file_object in file_objects:
+            s3_file_data = get_stored_file_data(FileObjectOut.from_orm(file_object))
+            try:
+                self.backend_storage.get_file_info(s3_file_data)
+            except BaseNotFoundException:
+                self.logger.warning(
+                    f"File {file_object.id} has no object at {s3_file_data.bucket_name}/{s3_file_data.file_name}"
+                )
+                report.missing_files += 1
+                if len(report.missing_file_ids) < MAX_REPORTED_FILE_IDS:
+                    report.missing_file_ids.append(str(file_object.id))
+        report.files_checked += len(file_objects)
+
+        # * Starts over once every file has been checked.
+        next_marker = str(file_objects[-1].id) if file_objects else None
+        self.crud.save_checkpoint(FILES_CHECKPOINT, None, next_marker)
+
+    def run(self, max_pages: Optional[int] = None) -> ReconcileReport:
+        """Walks up to `max_pages` pages of objects, and as many pages of file rows."""
+
+        report = ReconcileReport()
+        max_pages = max_pages or self.app_settings.orphan_reconciler_pages_per_run
+        while report.pages < max_pages:
+            try:
+                self.reconcile_objects_page(report)
+                self.check_files_page(report)
+            except GeneralException as raised_exception:
+                self.logger.error(raised_exception)
+                self.db.rollback()
+                break
+
+            report.pages += 1
+            if report.pages < max_pages and self._pause():
+                break
+
+        self.logger.info(f"Orphan reconciler run: {json.dumps(report.to_dict())}")
+        return report
+
+
+def run_orphan_reconciler(
+    app_settings: Settings,
+    stop_event: Optional[threading.Event] = None,
+    max_pages: Optional[int] = None,
+) -> Optional[ReconcileReport]:
+    """Runs the reconciler once, unless another process is already running it."""
+
+    from src.database import get_db_conn
+
+    # * The lock belongs to the connection, so the whole run keeps to one.
+    with get_db_conn().connect() as connection:
+        if not connection.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": RECONCILER_LOCK_KEY}
+        ).scalar():
+            return None
+
+        try:
+            with Session(bind=connection) as db:
+                return OrphanReconciler(db, app_settings, stop_event).run(max_pages)
+        finally:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": RECONCILER_LOCK_KEY}
+            )
+
+
+def start_orphan_reconciler(app_settings: Settings):
+    """Runs the reconciler every `orphan_reconciler_interval_minutes` on a background thread."""
+
+    global _reconciler_thread
+
+    def run_forever():
+        while not _reconciler_stop.wait(
+            app_settings.orphan_reconciler_interval_minutes * 60
+        ):
+            try:
+                run_orphan_reconciler(app_settings, _reconciler_stop)
+            except Exception as raised_exception:
+                setup_logger().exception(raised_exception)
+
+    with _reconciler_lock:
+        if _reconciler_thread is None:
+            _reconciler_stop.clear()
+            _reconciler_thread = threading.Thread(
+                target=run_forever, name="orphan-reconciler", daemon=True
+            )
+            _reconciler_thread.start()
+
+
+def stop_orphan_reconciler():
+    global _reconciler_thread
+    with _reconciler_lock:
+        if _reconciler_thread is not None:
+            _reconciler_stop.set()
+            _reconciler_thread.join()
+            _reconciler_thread = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Runs the orphan reconciler once and prints its report."
+    )
+    parser.add_argument("--pages", type=int, default=None)
+    args = parser.parse_args()
+
+    from src.database import close_db_connections, open_db_connections
+
+    open_db_connections()
+    try:
+        report = run_orphan_reconciler(Settings(), max_pages=args.pages)
+    finally:
+        close_db_connections()
+
+    if report is None:
+        print("The orphan reconciler is already running in another process.")
+    else:
+        print(json.dumps(report.to_dict(), indent=2))
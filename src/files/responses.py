@@ -0,0 +1,252 @@
+"""Streaming File Responses"""
+
+import os
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
+from starlette.types import Receive, Scope, Send
+
+from src.exceptions import (
+    BaseNotFoundException,
+    RangeNotSatisfiableException,
+    handle_range_not_satisfiable_exception,
+)
+from src.files.schemas import FileObjectOut
+from src.files.service import FileService
+from src.files.utils import FileDeliveryMode, parse_range_header
+from src.service import failed_service_result, handle_result
+
+
+# * Stored file names are unique, so the content behind a file record never changes.
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+class LocalFileResponse(FileResponse):
+    """
+    Sends `count` bytes of a local file, starting at `offset`.
+
+    Servers offering the ASGI zero-copy send extension are handed the open
+    file and send it with sendfile, without the bytes passing through Python.
+    Otherwise the file is read in chunks off the event loop, like FileResponse.
+    """
+
+    def __init__(self, path: str, offset: int, count: int, **kw) -> None:
+        super().__init__(path, **kw)
+        self.offset = offset
+        self.count = count
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": file.wrapped,
+                        "offset": self.offset,
+                        "count": self.count,
+                    }
+                )
+                return
+
+            await file.seek(self.offset)
+            remaining = self.count
+            more_body = True
+            while more_body:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                remaining -= len(chunk)
+                more_body = remaining > 0 and len(chunk) > 0
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": more_body,
+                    }
+                )
+
+
+def make_attachment_headers(file_object: FileObjectOut) -> Dict[str, str]:
+    """Asks the browser to save the file under its original name, which may hold any character."""
+
+    return {
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(file_object.original_file_name)}"
+    }
+
+
+def make_file_etag(file_object: FileObjectOut) -> str:
+    return f'"{file_object.checksum or file_object.id.hex}"'
+
+
+def is_not_modified(request: Request, file_object: FileObjectOut, etag: str) -> bool:
+    """Checks `If-None-Match`, or `If-Modified-Since` when it is absent, as the RFC orders it."""
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # * Weak comparison, a W/ prefix added by a proxy still matches.
+        return etag in (
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        )
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or file_object.date_created is None:
+        return False
+
+    try:
+        modified_since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+    if modified_since.tzinfo is None:
+        modified_since = modified_since.replace(tzinfo=timezone.utc)
+
+    return file_object.date_created.replace(microsecond=0) <= modified_since
+
+
+def make_file_response(
+    request: Request,
+    file_object: FileObjectOut,
+    file_service: FileService,
+    cache_control: str = REVALIDATE_CACHE_CONTROL,
+    extra_headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Serves the file straight from the backend storage, one chunk at a time.
+
+    A single `Range` is answered with `206 Partial Content` and only that part
+    is requested from the storage, a `HEAD` request or a conditional request
+    answered with `304 Not Modified` gets the headers without the storage
+    being touched at all.
+    """
+
+    etag = make_file_etag(file_object)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+        "ETag": etag,
+        **(extra_headers or {}),
+    }
+    if file_object.date_created is not None:
+        headers["Last-Modified"] = format_datetime(
+            file_object.date_created.astimezone(timezone.utc), usegmt=True
+        )
+
+    if is_not_modified(request, file_object, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    status_code = status.HTTP_200_OK
+    byte_range = None
+
+    # ? Files saved before their size was recorded can only be sent whole, and
+    # ? so is a range whose If-Range no longer matches.
+    if file_object.total_bytes is not None:
+        if request.headers.get("if-range", etag) == etag:
+            try:
+                byte_range = parse_range_header(
+                    request.headers.get("range"), file_object.total_bytes
+                )
+            except RangeNotSatisfiableException as raised_exception:
+                handle_range_not_satisfiable_exception(raised_exception)
+
+        if byte_range is None:
+            headers["Content-Length"] = str(file_object.total_bytes)
+        else:
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Length"] = str(byte_range.length)
+            headers["Content-Range"] = byte_range.content_range(file_object.total_bytes)
+
+    if request.method == "HEAD":
+        return Response(
+            status_code=status_code, headers=headers, media_type=file_object.mime_type
+        )
+
+    # * LOCAL_STORAGE files are sent straight from the disk.
+    local_file_path = file_service.get_local_file_path(file_object)
+    if local_file_path is not None:
+        try:
+            file_size = os.path.getsize(local_file_path)
+        except FileNotFoundError:
+            handle_result(
+                failed_service_result(
+                    BaseNotFoundException("The file was not found in the storage.")
+                )
+            )
+
+        offset, count = (
+            (0, file_size)
+            if byte_range is None
+            else (byte_range.start, byte_range.length)
+        )
+        headers["Content-Length"] = str(count)
+        return LocalFileResponse(
+            local_file_path,
+            offset,
+            count,
+            status_code=status_code,
+            headers=headers,
+            media_type=file_object.mime_type,
+        )
+
+    stream_result = file_service.open_file_stream(file_object, byte_range)
+    if not stream_result.success:
+        handle_result(stream_result)
+
+    return StreamingResponse(
+        stream_result.data,
+        status_code=status_code,
+        headers=headers,
+        media_type=file_object.mime_type,
+    )
+
+
+def make_file_delivery_response(
+    request: Request,
+    file_object: FileObjectOut,
+    file_service: FileService,
+    cache_control: str = REVALIDATE_CACHE_CONTROL,
+    extra_headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Sends the file the way `file_delivery_mode` says: streamed through the API
+    (PROXY), as a redirect to a presigned URL (REDIRECT) or as a JSON body
+    holding the presigned URL (PRESIGNED_URL).
+    """
+
+    delivery_mode = file_service.app_settings.file_delivery_mode
+    if delivery_mode == FileDeliveryMode.PROXY.value:
+        return make_file_response(
+            request, file_object, file_service, cache_control, extra_headers
+        )
+
+    signed_url_result = file_service.get_signed_download_url(file_object)
+    if not signed_url_result.success:
+        handle_result(signed_url_result)
+
+    if delivery_mode == FileDeliveryMode.REDIRECT.value:
+        return RedirectResponse(
+            signed_url_result.data.url,
+            status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+            headers={"Cache-Control": "private, max-age=0", **(extra_headers or {})},
+        )
+
+    return JSONResponse(jsonable_encoder(signed_url_result.data), headers=extra_headers)
@@ -0,0 +1,203 @@
+"""File's Router"""
+
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Header, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from src.config import setup_logger
+from src.files.dependencies import initiate_file_service
+from src.files.responses import make_attachment_headers, make_file_delivery_response
+from src.exceptions import FileTooLargeException
+from src.files.pipeline import format_file_size_limit
+from src.files.schemas import (
+    FileIdsIn,
+    FileObjectOut,
+    ManyFileObjectsOut,
+    UploadSessionIn,
+    UploadSessionOut,
+)
+from src.files.service import FileService
+from src.pagination import CommonQueryParams
+from src.service import (
+    AppResponseModel,
+    failed_service_result,
+    handle_json_result,
+    handle_result,
+)
+
+router = APIRouter(tags=["Files"], prefix="/files")
+
+
+logger = setup_logger()
+
+
+@router.get("/", response_model=ManyFileObjectsOut)
+def read_files(
+    common: CommonQueryParams = Depends(),
+    extension: Optional[str] = Query(None, description="Such as `pdf`."),
+    mime_type: Optional[str] = Query(
+        None, description="Such as `image/png`, or `image/*` for every image."
+    ),
+    file_service: FileService = Depends(initiate_file_service),
+):
+    """Lists the files of the current user, newest first. `total` and `total_bytes` cover every file matching the filters."""
+
+    result = file_service.get_files(
+        file_service.requesting_user.id,
+        skip=common.skip,
+        limit=common.limit,
+        extension=extension,
+        mime_type=mime_type,
+    )
+    return handle_json_result(result, ManyFileObjectsOut)  # type: ignore
+
+
+async def read_chunk(request: Request, max_bytes: int) -> bytes:
+    """Reads the request body, refusing it as soon as it goes over `max_bytes`."""
+
+    parts = []
+    total_bytes = 0
+    async for part in request.stream():
+        total_bytes += len(part)
+        if total_bytes > max_bytes:
+            handle_result(
+                failed_service_result(
+                    FileTooLargeException(
+                        f"A chunk can not be more than {format_file_size_limit(max_bytes)}."
+                    )
+                )
+            )
+        parts.append(part)
+
+    return b"".join(parts)
+
+
+@router.post("/uploads", response_model=UploadSessionOut)
+def create_upload_session(
+    data: UploadSessionIn,
+    file_service: FileService = Depends(initiate_file_service),
+):
+    """
+    Starts a resumable upload. The file is then sent with `PATCH /files/uploads/{upload_id}`
+    in chunks of `part_size` bytes, only the last one can be shorter, and recorded with
+    `POST /files/uploads/{upload_id}/finalize`. An upload no chunk is sent to expires.
+    """
+
+    result = file_service.create_upload_session(
+        file_service.requesting_user.id, data.file_name, data.total_bytes
+    )
+    return handle_result(result, UploadSessionOut)  # type: ignore
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionOut)
+def read_upload_session(
+    upload_id: UUID,
+    file_service: FileService = Depends(initiate_file_service),
+):
+    """`received_bytes` is the offset to resume the upload from."""
+
+    result = file_service.get_upload_session(file_service.requesting_user.id, upload_id)
+    return handle_result(result, UploadSessionOut)  # type: ignore
+
+
+@router.patch("/uploads/{upload_id}", response_model=UploadSessionOut)
+async def upload_chunk(
+    request: Request,
+    upload_id: UUID,
+    upload_offset: int = Header(..., ge=0),
+    file_service: FileService = Depends(initiate_file_service),
+):
+    """Sends the chunk in the body at `Upload-Offset`, which has to be the `received_bytes` of the upload. 409 Conflict otherwise."""
+
+    data = await read_chunk(request, file_service.get_upload_part_size())
+    result = await run_in_threadpool(
+        file_service.upload_chunk,
+        file_service.requesting_user.id,
+        upload_id,
+        upload_offset,
+        data,
+    )
+    return handle_result(result, UploadSessionOut)  # type: ignore
+
+
+@router.post("/uploads/{upload_id}/finalize", response_model=FileObjectOut)
+def finalize_upload_session(
+    upload_id: UUID,
+    file_service: FileService = Depends(initiate_file_service),
+):
+    result = file_service.finalize_upload_session(
+        file_service.requesting_user.id, upload_id
+    )
+    return handle_result(result, FileObjectOut)  # type: ignore
+
+
+@router.delete("/uploads/{upload_id}", response_model=AppResponseModel)
+def cancel_upload_session(
+    upload_id: UUID,
+    file_service: FileService = Depends(initiate_file_service),
+):
+    result = file_service.cancel_upload_session(
+        file_service.requesting_user.id, upload_id
+    )
+    return handle_result(result)  # type: ignore
+
+
+@router.get("/{file_id}", response_model=FileObjectOut)
+def read_file(
+    file_id: UUID,
+    file_service: FileService = Depends(initiate_file_service),
+):
+    result = file_service.get_user_file(file_id)
+    return handle_json_result(result, FileObjectOut)  # type: ignore
+
+
+@router.get("/{file_id}/download", response_class=StreamingResponse)
+def download_file(
+    request: Request,
+    file_id: UUID,
+    file_service: FileService = Depends(initiate_file_service),
+):
+    """
+    Streams the file, a single `Range` is answered with 206 Partial Content.
+    Depending on `FILE_DELIVERY_MODE` a presigned URL is redirected to or returned instead.
+    """
+
+    file_object: FileObjectOut = handle_result(
+        file_service.get_user_file(file_id), FileObjectOut
+    )
+    return make_file_delivery_response(
+        request,
+        file_object,
+        file_service,
+        extra_headers=make_attachment_headers(file_object),
+    )
+
+
+@router.delete("/{file_id}", response_model=AppResponseModel)
+def delete_file(
+    file_id: UUID,
+    file_service: FileService = Depends(initiate_file_service),
+):
+    file_object: FileObjectOut = handle_result(
+        file_service.get_user_file(file_id), FileObjectOut
+    )
+    result = file_service.delete_files([file_object.id])
+    return handle_result(result)  # type: ignore
+
+
+@router.post("/bulk-delete", response_model=AppResponseModel)
+def bulk_delete_files(
+    data: FileIdsIn,
+    file_service: FileService = Depends(initiate_file_service),
+):
+    """Deletes up to a thousand files at once, admins can delete any file and other users only their own. The integer returned is the number of files deleted, ids of missing files are skipped."""
+
+    requesting_user = file_service.requesting_user
+    result = file_service.delete_files(
+        data.file_ids,
+        owner_id=None if requesting_user.is_super_admin else requesting_user.id,
+    )
+    return handle_result(result)  # type: ignore
@@ -1,6 +1,9 @@
-from typing import List
+import datetime
+from typing import List, Optional
 from uuid import UUID
 
+from pydantic import Field
+
 from src.schemas import ParentPydanticModel
 
 
@@ -8,13 +11,23 @@ class BucketOut(ParentPydanticModel):
     name: str
 
 
+class FileBlobOut(ParentPydanticModel):
+    bucket_name: str
+    object_name: str
+
+
 class FileObjectOut(ParentPydanticModel):
     id: UUID
     file_name: str
     original_file_name: str
     bucket: BucketOut
+    storage_bucket: Optional[str]
     mime_type: str
     extension: str
+    total_bytes: Optional[int]
+    checksum: Optional[str]
+    date_created: Optional[datetime.datetime]
+    blob: Optional[FileBlobOut]
 
 
 class MiniFileObjectOut(ParentPydanticModel):
@@ -26,3 +39,41 @@ class ManyFileObjectsOut(ParentPydanticModel):
     total: int
     total_bytes: int
     file_objects: List[FileObjectOut]
+
+
+class PresignedUrlOut(ParentPydanticModel):
+    url: str
+    expires_at: datetime.datetime
+
+
+class DirectUploadInitiate(ParentPydanticModel):
+    file_name: str
+
+
+class DirectUploadOut(ParentPydanticModel):
+    object_name: str
+    upload_url: str
+    expires_at: datetime.datetime
+
+
+class DirectUploadFinalize(ParentPydanticModel):
+    object_name: str
+    file_name: str
+
+
+class UploadSessionIn(ParentPydanticModel):
+    file_name: str
+    total_bytes: int = Field(..., gt=0)
+
+
+class UploadSessionOut(ParentPydanticModel):
+    id: UUID
+    original_file_name: str
+    total_bytes: int
+    received_bytes: int
+    part_size: int
+    expires_at: datetime.datetime
+
+
+class FileIdsIn(ParentPydanticModel):
+    file_ids: List[UUID] = Field(..., min_items=1, max_items=1000)
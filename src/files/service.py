@@ -1,28 +1,108 @@
-from typing import BinaryIO, Union
+import os
+import posixpath
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from collections import Counter, defaultdict
+from typing import BinaryIO, DefaultDict, Iterator, List, Optional, Union
 from uuid import UUID
 from sqlalchemy.orm import Session
 
-from io import BufferedReader, BytesIO
-from filetype import filetype
-from src.files.schemas import FileObjectOut, ManyFileObjectsOut
+from io import BytesIO
+from src.files.schemas import (
+    DirectUploadOut,
+    FileObjectOut,
+    ManyFileObjectsOut,
+    PresignedUrlOut,
+    UploadSessionOut,
+)
 from src.service import ServiceResult, success_service_result, failed_service_result
 
-from src.models import Bucket, FileObject
+from src.database import get_db_conn
+from src.models import Bucket, FileBlob, FileObject, UploadSession
 from src.exceptions import FILE_DOES_NOT_EXIST_ERROR_MESSAGE, FileTooLargeException
 
+from src.files.pipeline import (
+    FILE_TYPE_HEAD_SIZE,
+    FileInspection,
+    UploadStream,
+    format_file_size_limit,
+)
+from src.files.buckets import bucket_registry
+from src.files.derivatives import (
+    FALLBACK_IMAGE_FORMATS,
+    get_accepted_image_formats,
+    get_derivatives_executor,
+    render_image_derivatives,
+)
 from src.files.storage import BackendStorage
-from src.files.utils import S3FileData, format_bucket_name, make_custom_id
+from src.files.uploads import get_upload_session_file_data, remove_upload_session
+from src.files.utils import (
+    ONE_MEGA_BYTE,
+    ByteRange,
+    S3FileData,
+    StorageLayout,
+    format_bucket_name,
+    make_custom_id,
+    megabytes_to_bytes,
+)
 from src.service import BaseService
 from src.users import schemas
 from src.config import Settings, setup_logger
 from src.exceptions import (
     GeneralException,
+    BaseForbiddenException,
     BaseNotFoundException,
     BaseConflictException,
 )
 from src.files.crud import FileCRUD
 
 
+# * Files up to this size are hashed before they are sent, so content that is
+# * already stored is not sent again.
+CONTENT_ADDRESSED_BUFFER_SIZE = 8 * ONE_MEGA_BYTE
+
+# * Files deleted per statement when all of a user's files are removed.
+DELETE_BATCH_SIZE = 1000
+
+# * The S3 limits on multipart uploads, every chunk of a resumable upload is one part.
+MIN_UPLOAD_PART_SIZE = 5 * ONE_MEGA_BYTE
+MAX_UPLOAD_PARTS = 10_000
+
+
+def get_stored_file_data(file_object: FileObjectOut) -> S3FileData:
+    """Where the content of the file is stored."""
+
+    if file_object.blob is not None:
+        return S3FileData(
+            file_name=file_object.blob.object_name,
+            original_file_name=file_object.original_file_name,
+            bucket_name=file_object.blob.bucket_name,
+            total_bytes=file_object.total_bytes,
+        )
+
+    # ? Files uploaded before the storage bucket was recorded are in the owner's bucket.
+    return S3FileData(
+        file_name=file_object.file_name,
+        original_file_name=file_object.original_file_name,
+        bucket_name=file_object.storage_bucket or file_object.bucket.name,
+        total_bytes=file_object.total_bytes,
+    )
+
+
+def get_upload_part_size(app_settings: Settings, total_bytes: int = -1) -> int:
+    """The chunk size of a resumable upload of `total_bytes`, the largest one without it."""
+
+    if total_bytes < 0:
+        total_bytes = megabytes_to_bytes(app_settings.max_size_of_a_file)
+
+    return max(
+        megabytes_to_bytes(app_settings.upload_file_bytes_per_stream),
+        MIN_UPLOAD_PART_SIZE,
+        # * The whole file has to fit in the maximum number of parts.
+        -(-total_bytes // MAX_UPLOAD_PARTS),
+    )
+
+
 class FileService(BaseService):
     def __init__(
         self, requesting_user: schemas.UserOut, db: Session, app_settings: Settings
@@ -36,115 +116,614 @@ class FileService(BaseService):
         if requesting_user is None:
             raise GeneralException("Requesting User was not provided.")
 
-    def _ensure_s3_bucket_exists(self, owner_id):
-        bucket_name = format_bucket_name(owner_id)
+    def _get_storage_bucket_name(self, owner_id) -> str:
+        """The storage bucket the owner's files are uploaded to."""
+
+        if self.app_settings.storage_layout == StorageLayout.SHARED_BUCKET.value:
+            return self.app_settings.shared_bucket_name
+        return format_bucket_name(owner_id)
+
+    def _make_object_name(self, owner_id, file_name: str) -> str:
+        """The key of the file in its storage bucket, prefixed by the owner in a shared bucket."""
+
+        if self.app_settings.storage_layout == StorageLayout.SHARED_BUCKET.value:
+            return f"{format_bucket_name(owner_id)}/{file_name}"
+        return file_name
+
+    def _ensure_storage_bucket_exists(self, bucket_name: str):
+        if bucket_registry.has_storage_bucket(bucket_name):
+            return
+
         if not self.backend_storage.bucket_exists(bucket_name):
-            if self.crud.get_owner_bucket(owner_id) is None:
-                self.crud.create_bucket(owner_id)
-            else:
-                self.crud.get_owner_bucket(owner_id)
+            try:
+                self.backend_storage.create_bucket(bucket_name)
+            except GeneralException:
+                # * Another worker might have created it in the meantime.
+                if not self.backend_storage.bucket_exists(bucket_name):
+                    raise
 
-            self.backend_storage.create_bucket(bucket_name)
+        bucket_registry.add_storage_bucket(bucket_name)
 
-    def init_buckets_for_user(self, user_id: UUID):
-        """Ensures the database bucket and the s3 bucket for this user exists."""
+    def get_bucket_id(self, owner_id) -> UUID:
+        """The id of the owner's bucket row, created if needed and remembered for the process."""
 
-        try:
-            db_bucket = self.crud.create_bucket(user_id)
-        except BaseConflictException:
-            db_bucket = self.crud.get_owner_bucket(user_id)
+        bucket_id = bucket_registry.get_bucket_id(owner_id)
+        if bucket_id is None:
+            bucket_id = self.crud.upsert_bucket(owner_id)
+            bucket_registry.set_bucket_id(owner_id, bucket_id)
+
+        return bucket_id
+
+    def init_buckets_for_user(self, user_id: UUID) -> UUID:
+        """Ensures the database bucket and the storage bucket for this user exist, returns the id of the bucket row."""
+
+        bucket_id = self.get_bucket_id(user_id)
 
         try:
-            self._ensure_s3_bucket_exists(user_id)
+            self._ensure_storage_bucket_exists(self._get_storage_bucket_name(user_id))
         except Exception as raised_exception:
             self.logger.exception(raised_exception)
             raise GeneralException(
                 "The API is unable to create an S3 Bucket for this user."
             )
 
-        return db_bucket
+        return bucket_id
+
+    def _make_file_name(self, file_name: str, extension: str) -> str:
+        """The unique name the file is stored under, i.e. <file-name>-<custom-id>.<extension>."""
+
+        original_file_name_without_extension = file_name.split(f".{extension}")[0]
+        return f"{original_file_name_without_extension}-{make_custom_id()}.{extension}"
+
+    def _get_file_size_limit_in_bytes(self, file_size_limit: float = -1) -> int:
+        return megabytes_to_bytes(
+            self.app_settings.max_size_of_a_file
+            if file_size_limit <= 0
+            else file_size_limit
+        )
+
+    def _store_blob(self, upload_stream: UploadStream, mime_type: str) -> FileBlob:
+        """
+        Stores the content once and returns its blob with a reference added.
+
+        Small files are buffered first, so content that is already stored is
+        never sent again. Larger ones are streamed and hashed on the way, and
+        the copy is dropped if the content turns out to be stored already.
+        """
+
+        if upload_stream.buffer_ahead(CONTENT_ADDRESSED_BUFFER_SIZE):
+            blob = self.crud.acquire_blob(upload_stream.checksum)
+            if blob is not None:
+                return blob
+
+        self._ensure_storage_bucket_exists(self.app_settings.blob_bucket_name)
+
+        # ? The checksum is not known before the bytes are sent.
+        s3_file_data = S3FileData(
+            file_name=make_custom_id(),
+            original_file_name="",
+            bucket_name=self.app_settings.blob_bucket_name,
+        )
+        self.backend_storage.upload_file(
+            upload_stream=upload_stream, s3_file_data=s3_file_data, mime_type=mime_type
+        )
+
+        blob, is_created = self.crud.create_blob(
+            checksum=upload_stream.checksum,
+            bucket_name=s3_file_data.bucket_name,
+            object_name=s3_file_data.file_name,
+            total_bytes=upload_stream.total_bytes,
+        )
+        if not is_created:
+            self.backend_storage.remove_file(
+                s3_file_data.bucket_name, s3_file_data.file_name
+            )
+        if blob is None:
+            raise GeneralException("There was a problem uploading the file.")
+
+        return blob
+
+    def _release_blob(self, blob_id: UUID):
+        """Drops a reference to the blob, its content is only removed with the last one."""
+
+        removed_blob = self.crud.release_blob(blob_id)
+        self.db.commit()
+        if removed_blob is not None:
+            self.backend_storage.remove_file(
+                removed_blob.bucket_name, removed_blob.object_name
+            )
+
+    def _get_s3_file_data(self, file_object: FileObjectOut) -> S3FileData:
+        return get_stored_file_data(file_object)
+
+    def open_upload_stream(
+        self, file_to_upload: BinaryIO, file_size_limit: float = -1
+    ) -> UploadStream:
+        """Wraps the file in a single pass stream, `file_size_limit` is in mb and defaults to `max_size_of_a_file`."""
+
+        return UploadStream(
+            file_to_upload,
+            max_bytes=self._get_file_size_limit_in_bytes(file_size_limit),
+        )
 
     def upload_file(
         self,
-        file_to_upload: BinaryIO,
+        file_to_upload: Union[BinaryIO, UploadStream],
         user_id: UUID,
         file_name: str,
-        file_size_limit: int = -1,
+        file_size_limit: float = -1,
     ) -> ServiceResult[Union[FileObjectOut, GeneralException]]:
-        try:
-            extension = str(filetype.guess_extension(file_to_upload))
-        except TypeError:
+        upload_stream = (
+            file_to_upload
+            if isinstance(file_to_upload, UploadStream)
+            else self.open_upload_stream(file_to_upload, file_size_limit)
+        )
+
+        extension = upload_stream.extension or os.path.splitext(file_name)[1][1:]
+        if not extension:
             return failed_service_result(
                 GeneralException(
                     "Unable to determine extension of file. Ensure the uploaded file is a file-object."
                 )
             )
 
-        file_name_split = file_name.split(f".{extension}")
-        if len(file_name_split) > 0:
-            original_file_name_without_extension = file_name_split[0]
-        else:
+        new_file_name = self._make_file_name(file_name, extension)
+
+        try:
+            # * Content addressed files live in the shared blob bucket.
+            if self.app_settings.content_addressed_storage:
+                bucket_id = self.get_bucket_id(user_id)
+            else:
+                bucket_id = self.init_buckets_for_user(user_id)
+        except GeneralException as raised_exception:
+            return failed_service_result(raised_exception)
+
+        mime_type = upload_stream.mime_type
+        if mime_type is None:
+            self.logger.info(
+                "Unable to detect the mime type of this file, resetting it to application/octet-stream"
+            )
+            mime_type = "application/octet-stream"
+
+        blob = None
+        s3_file_data = S3FileData(
+            file_name=new_file_name,
+            original_file_name=file_name,
+            bucket_name=None,  # type: ignore
+        )
+        try:
+            if self.app_settings.content_addressed_storage:
+                blob = self._store_blob(upload_stream, mime_type)
+                total_bytes = upload_stream.total_bytes
+            else:
+                s3_file_data.file_name = self._make_object_name(user_id, new_file_name)
+                s3_file_data.bucket_name = self._get_storage_bucket_name(user_id)
+                total_bytes = self.backend_storage.upload_file(
+                    upload_stream=upload_stream,
+                    s3_file_data=s3_file_data,
+                    mime_type=mime_type,
+                )
+        except FileTooLargeException as raised_exception:
+            self.logger.error(raised_exception)
+            return failed_service_result(raised_exception)
+        except GeneralException as raised_exception:
+            return failed_service_result(raised_exception)
+
+        try:
+
+            file_object = self.crud.save_file(
+                file_name=s3_file_data.file_name,
+                original_file_name=file_name,
+                owner_id=user_id,
+                total_bytes=total_bytes,
+                mime_type=mime_type,
+                extension=extension,
+                backend_storage=self.app_settings.backend_storage_option,
+                checksum=upload_stream.checksum,
+                blob_id=blob.id if blob else None,  # type: ignore
+                bucket_id=bucket_id,
+                storage_bucket=s3_file_data.bucket_name,
+            )
+            return success_service_result(FileObjectOut.parse_obj(file_object.__dict__))
+        except Exception as raised_exception:
+            self.logger.exception(raised_exception)
+            if blob is not None:
+                self.db.rollback()
+                self._release_blob(blob.id)  # type: ignore
+            return failed_service_result(
+                GeneralException("There was a problem uploading the file.")
+            )
+
+    def initiate_direct_upload(
+        self, user_id: UUID, file_name: str
+    ) -> ServiceResult[Union[DirectUploadOut, GeneralException]]:
+        """
+        Hands out a presigned PUT URL so the client uploads the file straight
+        to the storage, `finalize_direct_upload` then records it.
+        """
+
+        extension = os.path.splitext(file_name)[1][1:]
+        if not extension:
             return failed_service_result(
                 GeneralException(
                     "Unable to pick the name of this file, ensure the file has extension, i.e. <file-name>.<extension>."
                 )
             )
 
-        new_file_name = (
-            f"{original_file_name_without_extension}-{make_custom_id()}.{extension}"
-        )
-
         try:
             self.init_buckets_for_user(user_id)
         except GeneralException as raised_exception:
             return failed_service_result(raised_exception)
 
+        new_file_name = self._make_object_name(
+            user_id, self._make_file_name(file_name, extension)
+        )
+        expires_in = timedelta(minutes=self.app_settings.presigned_url_expire_minutes)
         try:
-            mime_type = filetype.guess_mime(file_to_upload)
-            if mime_type is None:
-                raise TypeError()
-        except TypeError:
-            file_to_upload.close()
-            self.logger.info(
-                "Unable to detect the mime type of this file, resetting it to application/octet-stream"
+            upload_url = self.backend_storage.get_signed_upload_url(
+                self._get_storage_bucket_name(user_id), new_file_name, expires_in
+            )
+        except GeneralException as raised_exception:
+            return failed_service_result(raised_exception)
+
+        return success_service_result(
+            DirectUploadOut(
+                object_name=new_file_name,
+                upload_url=upload_url,
+                expires_at=datetime.now(timezone.utc) + expires_in,
+            )
+        )
+
+    def finalize_direct_upload(
+        self,
+        user_id: UUID,
+        object_name: str,
+        file_name: str,
+        file_size_limit: float = -1,
+        images_only: bool = False,
+    ) -> ServiceResult[Union[FileObjectOut, Exception]]:
+        """
+        Records a file the client uploaded with a presigned URL.
+
+        The size comes from the object's metadata and the type is sniffed from
+        its first bytes, an object that breaks the rules is removed again.
+        """
+
+        # * Only objects named the way `initiate_direct_upload` names them for this user.
+        if object_name != self._make_object_name(
+            user_id, os.path.basename(object_name)
+        ):
+            return failed_service_result(
+                BaseForbiddenException("You are not allowed to perform this request.")
             )
-            mime_type = "application/octet-stream"
 
         s3_file_data = S3FileData(
-            file_name=new_file_name,
-            bucket_name=format_bucket_name(user_id),
+            file_name=object_name,
             original_file_name=file_name,
+            bucket_name=self._get_storage_bucket_name(user_id),
         )
 
+        if self.crud.get_file_by_name(object_name) is not None:
+            return failed_service_result(
+                BaseConflictException("This file has already been saved.")
+            )
+
         try:
-            total_bytes = self.backend_storage.upload_file(
-                file_to_upload=file_to_upload,
-                s3_file_data=s3_file_data,
-                file_size_limit=file_size_limit,
-                mime_type=mime_type,
+            file_info = self.backend_storage.get_file_info(s3_file_data)
+            inspection = FileInspection.from_head(
+                self.backend_storage.read_file_head(s3_file_data, FILE_TYPE_HEAD_SIZE)
             )
-        except FileTooLargeException as raised_exception:
-            self.logger.error(raised_exception)
+        except (BaseNotFoundException, GeneralException) as raised_exception:
             return failed_service_result(raised_exception)
 
-        try:
+        max_bytes = self._get_file_size_limit_in_bytes(file_size_limit)
+        rejection = None
+        if file_info.total_bytes > max_bytes:
+            rejection = FileTooLargeException(
+                f"Your file size can not be more than {format_file_size_limit(max_bytes)}."
+            )
+        elif images_only and not inspection.is_image:
+            rejection = GeneralException("Only images are allowed to be uploaded.")
+
+        if rejection is not None:
+            self.backend_storage.remove_file(s3_file_data.bucket_name, object_name)
+            return failed_service_result(rejection)
+
+        extension = inspection.extension or os.path.splitext(object_name)[1][1:]
+        mime_type = (
+            inspection.mime_type or file_info.content_type or "application/octet-stream"
+        )
 
+        try:
             file_object = self.crud.save_file(
-                file_name=new_file_name,
+                file_name=object_name,
                 original_file_name=file_name,
                 owner_id=user_id,
-                total_bytes=total_bytes,
+                total_bytes=file_info.total_bytes,
                 mime_type=mime_type,
                 extension=extension,
                 backend_storage=self.app_settings.backend_storage_option,
+                bucket_id=self.get_bucket_id(user_id),
+                storage_bucket=s3_file_data.bucket_name,
+            )
+            return success_service_result(FileObjectOut.parse_obj(file_object.__dict__))
+        except Exception as raised_exception:
+            self.logger.exception(raised_exception)
+            return failed_service_result(
+                GeneralException("There was a problem uploading the file.")
+            )
+
+    def _make_upload_session_out(
+        self, upload_session: UploadSession
+    ) -> UploadSessionOut:
+        return UploadSessionOut(
+            id=upload_session.id,
+            original_file_name=upload_session.original_file_name,
+            total_bytes=upload_session.total_bytes,
+            received_bytes=upload_session.received_bytes,
+            part_size=upload_session.part_size,
+            expires_at=upload_session.date_updated
+            + timedelta(minutes=self.app_settings.resumable_upload_expire_minutes),
+        )
+
+    def _get_upload_session(
+        self, user_id: UUID, upload_session_id: UUID, for_update: bool = False
+    ) -> UploadSession:
+        upload_session = self.crud.get_upload_session(
+            upload_session_id, user_id, for_update=for_update
+        )
+        if upload_session is None:
+            raise BaseNotFoundException("This upload does not exist.")
+        return upload_session
+
+    def get_upload_part_size(self, total_bytes: int = -1) -> int:
+        return get_upload_part_size(self.app_settings, total_bytes)
+
+    def create_upload_session(
+        self, user_id: UUID, file_name: str, total_bytes: int
+    ) -> ServiceResult[Union[UploadSessionOut, Exception]]:
+        """
+        Starts a resumable upload of `total_bytes`, sent with `upload_chunk` in
+        chunks of the returned `part_size` and recorded by `finalize_upload_session`.
+        """
+
+        extension = os.path.splitext(file_name)[1][1:]
+        if not extension:
+            return failed_service_result(
+                GeneralException(
+                    "Unable to pick the name of this file, ensure the file has extension, i.e. <file-name>.<extension>."
+                )
+            )
+
+        max_bytes = self._get_file_size_limit_in_bytes()
+        if total_bytes > max_bytes:
+            return failed_service_result(
+                FileTooLargeException(
+                    f"Your file size can not be more than {format_file_size_limit(max_bytes)}."
+                )
+            )
+
+        try:
+            bucket_id = self.init_buckets_for_user(user_id)
+        except GeneralException as raised_exception:
+            return failed_service_result(raised_exception)
+
+        upload_session = self.crud.create_upload_session(
+            owner_id=user_id,
+            bucket_id=bucket_id,
+            original_file_name=file_name,
+            storage_bucket=self._get_storage_bucket_name(user_id),
+            object_name=self._make_object_name(
+                user_id, self._make_file_name(file_name, extension)
+            ),
+            total_bytes=total_bytes,
+            received_bytes=0,
+            part_size=self.get_upload_part_size(total_bytes),
+        )
+
+        return success_service_result(self._make_upload_session_out(upload_session))
+
+    def get_upload_session(
+        self, user_id: UUID, upload_session_id: UUID
+    ) -> ServiceResult[Union[UploadSessionOut, BaseNotFoundException]]:
+        """The session, its `received_bytes` is the offset the next chunk starts at."""
+
+        try:
+            upload_session = self._get_upload_session(user_id, upload_session_id)
+        except BaseNotFoundException as raised_exception:
+            return failed_service_result(raised_exception)
+
+        return success_service_result(self._make_upload_session_out(upload_session))
+
+    def _fail_chunk(
+        self, user_id: UUID, upload_session_id: UUID, exception: Exception
+    ) -> ServiceResult[Exception]:
+        """Fails the chunk with `exception`, or as not found when the session was removed while it was sent."""
+
+        self.db.rollback()
+        try:
+            self._get_upload_session(user_id, upload_session_id)
+        except BaseNotFoundException as raised_exception:
+            exception = raised_exception
+        self.db.rollback()
+        return failed_service_result(exception)
+
+    def upload_chunk(
+        self, user_id: UUID, upload_session_id: UUID, offset: int, data: bytes
+    ) -> ServiceResult[Union[UploadSessionOut, Exception]]:
+        """
+        Sends the chunk at `offset` to the storage as the next part of the upload.
+
+        A chunk has to start where the previous one ended and be `part_size`
+        bytes, only the last one is shorter. The file type is sniffed from the
+        first chunk, before the storage upload is started with it.
+
+        No row is locked and no connection is held while the part is sent, the
+        offset is only moved if no other request moved it in the meantime.
+        """
+
+        try:
+            upload_session = self._get_upload_session(user_id, upload_session_id)
+        except BaseNotFoundException as raised_exception:
+            return failed_service_result(raised_exception)
+
+        expected_bytes = min(
+            upload_session.part_size,
+            upload_session.total_bytes - upload_session.received_bytes,
+        )
+        rejection = None
+        if offset != upload_session.received_bytes:
+            rejection = BaseConflictException(
+                f"The upload continues at offset {upload_session.received_bytes}."
+            )
+        elif expected_bytes <= 0:
+            rejection = BaseConflictException("The whole file has been received.")
+        elif len(data) != expected_bytes:
+            rejection = GeneralException(
+                f"The chunk at offset {offset} has to be {expected_bytes} bytes."
+            )
+
+        if rejection is not None:
+            self.db.rollback()
+            return failed_service_result(rejection)
+
+        s3_file_data = get_upload_session_file_data(upload_session)
+        part_number = offset // upload_session.part_size + 1
+        upload_id = upload_session.upload_id
+        # * Keeps the sweeper of expired uploads off the session while the part is sent.
+        if not self.crud.touch_upload_session(upload_session_id):
+            self.db.rollback()
+            return failed_service_result(
+                BaseNotFoundException("This upload does not exist.")
+            )
+        # * Ends the transaction, so the connection is back in the pool while the part is sent.
+        self.db.commit()
+
+        try:
+            if upload_id is None:
+                inspection = FileInspection.from_head(data[:FILE_TYPE_HEAD_SIZE])
+                mime_type = inspection.mime_type or "application/octet-stream"
+                extension = (
+                    inspection.extension
+                    or os.path.splitext(s3_file_data.file_name)[1][1:]
+                )
+                upload_id = self.backend_storage.create_multipart_upload(
+                    s3_file_data, mime_type
+                )
+                if not self.crud.start_upload_session(
+                    upload_session_id, upload_id, mime_type, extension
+                ):
+                    # ? Another request sent the first chunk at the same time.
+                    self.backend_storage.abort_multipart_upload(s3_file_data, upload_id)
+                    return self._fail_chunk(
+                        user_id,
+                        upload_session_id,
+                        BaseConflictException("This chunk is being received already."),
+                    )
+
+            # * A chunk sent twice is the same bytes, so the storage keeps the same part.
+            etag = self.backend_storage.upload_part(
+                s3_file_data, upload_id, part_number, data
+            )
+        except (BaseNotFoundException, GeneralException) as raised_exception:
+            return self._fail_chunk(user_id, upload_session_id, raised_exception)
+
+        if not self.crud.save_upload_part(
+            upload_session_id, offset, part_number, len(data), etag
+        ):
+            return self._fail_chunk(
+                user_id,
+                upload_session_id,
+                BaseConflictException("This chunk has been received already."),
+            )
+        self.db.commit()
+
+        return success_service_result(self._make_upload_session_out(upload_session))
+
+    def finalize_upload_session(
+        self, user_id: UUID, upload_session_id: UUID
+    ) -> ServiceResult[Union[FileObjectOut, Exception]]:
+        """Joins the received parts into the stored object and records the file."""
+
+        try:
+            upload_session = self._get_upload_session(
+                user_id, upload_session_id, for_update=True
+            )
+        except BaseNotFoundException as raised_exception:
+            return failed_service_result(raised_exception)
+
+        if upload_session.received_bytes != upload_session.total_bytes:
+            self.db.rollback()
+            return failed_service_result(
+                BaseConflictException(
+                    f"Only {upload_session.received_bytes} of {upload_session.total_bytes} bytes have been received."
+                )
+            )
+
+        s3_file_data = get_upload_session_file_data(upload_session)
+        try:
+            self.backend_storage.complete_multipart_upload(
+                s3_file_data,
+                upload_session.upload_id,  # type: ignore
+                self.crud.get_upload_parts(upload_session.id),  # type: ignore
+            )
+        except (BaseNotFoundException, GeneralException) as raised_exception:
+            self.db.rollback()
+            return failed_service_result(raised_exception)
+
+        try:
+            self.crud.remove_upload_session(upload_session.id)  # type: ignore
+            # ? The checksum is not known, the chunks were hashed by separate requests.
+            file_object = self.crud.save_file(
+                file_name=s3_file_data.file_name,
+                original_file_name=s3_file_data.original_file_name,
+                owner_id=user_id,
+                total_bytes=upload_session.total_bytes,  # type: ignore
+                mime_type=upload_session.mime_type,  # type: ignore
+                extension=upload_session.extension,  # type: ignore
+                backend_storage=self.app_settings.backend_storage_option,
+                bucket_id=upload_session.bucket_id or self.get_bucket_id(user_id),  # type: ignore
+                storage_bucket=s3_file_data.bucket_name,
             )
             return success_service_result(FileObjectOut.parse_obj(file_object.__dict__))
         except Exception as raised_exception:
             self.logger.exception(raised_exception)
+            self.db.rollback()
             return failed_service_result(
                 GeneralException("There was a problem uploading the file.")
             )
 
+    def cancel_upload_session(
+        self, user_id: UUID, upload_session_id: UUID
+    ) -> ServiceResult[Union[None, Exception]]:
+        """Aborts the storage upload, dropping the parts received so far, and removes the session."""
+
+        try:
+            upload_session = self._get_upload_session(
+                user_id, upload_session_id, for_update=True
+            )
+        except BaseNotFoundException as raised_exception:
+            return failed_service_result(raised_exception)
+
+        remove_upload_session(self.crud, self.backend_storage, upload_session)
+        self.db.commit()
+
+        return success_service_result(None)
+
+    def get_signed_download_url(
+        self, file_object: FileObjectOut
+    ) -> ServiceResult[Union[PresignedUrlOut, GeneralException]]:
+        expires_in = timedelta(minutes=self.app_settings.presigned_url_expire_minutes)
+        try:
+            s3_file_data = self._get_s3_file_data(file_object)
+            url, expires_at = self.backend_storage.get_signed_download_url(
+                s3_file_data.bucket_name, s3_file_data.file_name, expires_in
+            )
+        except GeneralException as raised_exception:
+            return failed_service_result(raised_exception)
+
+        return success_service_result(PresignedUrlOut(url=url, expires_at=expires_at))
+
     def download_file(
         self, file_object_id: UUID
     ) -> ServiceResult[Union[BytesIO, GeneralException, BaseNotFoundException]]:
@@ -152,12 +731,7 @@ class FileService(BaseService):
         if not file_object_result.success:
             return failed_service_result(file_object_result.exception)
 
-        file_object_data: FileObject = file_object_result.data
-        s3_file_data = S3FileData(
-            file_name=str(file_object_data.file_name),
-            original_file_name=str(file_object_data.original_file_name),
-            bucket_name=file_object_data.bucket.name,
-        )
+        s3_file_data = self._get_s3_file_data(file_object_result.data)
         try:
             return success_service_result(
                 self.backend_storage.download_file(s3_file_data)
@@ -168,6 +742,243 @@ class FileService(BaseService):
                 GeneralException("There was a problem downloading the file.")
             )
 
+    def open_file_stream(
+        self, file_object: FileObjectOut, byte_range: Optional[ByteRange] = None
+    ) -> ServiceResult[Union[Iterator[bytes], GeneralException]]:
+        """Streams the file, or only `byte_range` of it, straight from the backend storage."""
+
+        s3_file_data = self._get_s3_file_data(file_object)
+        try:
+            if byte_range is None:
+                return success_service_result(
+                    self.backend_storage.open_file_stream(s3_file_data)
+                )
+
+            return success_service_result(
+                self.backend_storage.open_file_stream(
+                    s3_file_data, offset=byte_range.start, length=byte_range.length
+                )
+            )
+        except Exception as raised_exception:
+            self.logger.exception(raised_exception)
+            return failed_service_result(
+                GeneralException("There was a problem downloading the file.")
+            )
+
+    def create_image_derivatives(
+        self, file_object_id: UUID
+    ) -> ServiceResult[Union[int, BaseNotFoundException, GeneralException]]:
+        """
+        Renders the derivatives of an image and stores them next to it.
+
+        Returns:
+            int: The number of derivatives stored.
+        """
+
+        file_object_result = self.get_file(file_object_id)
+        if not file_object_result.success:
+            return failed_service_result(file_object_result.exception)
+
+        file_object: FileObjectOut = file_object_result.data
+        if not file_object.mime_type.startswith("image/"):
+            return failed_service_result(
+                GeneralException("Only images have derivatives.")
+            )
+
+        s3_file_data = self._get_s3_file_data(file_object)
+        try:
+            derivatives = render_image_derivatives(
+                self.backend_storage.download_file(s3_file_data).getvalue()
+            )
+        except Exception as raised_exception:
+            self.logger.exception(raised_exception)
+            return failed_service_result(
+                GeneralException("Unable to render the derivatives of this image.")
+            )
+
+        object_names = []
+        try:
+            for derivative in derivatives:
+                object_name = posixpath.join(
+                    posixpath.dirname(s3_file_data.file_name),
+                    f"{file_object.id.hex}-{derivative.size}.{derivative.format}",
+                )
+                upload_stream = UploadStream(
+                    BytesIO(derivative.body), max_bytes=len(derivative.body)
+                )
+                object_names.append(object_name)
+                self.backend_storage.upload_file(
+                    upload_stream=upload_stream,
+                    s3_file_data=S3FileData(
+                        file_name=object_name,
+                        original_file_name=file_object.original_file_name,
+                        bucket_name=s3_file_data.bucket_name,
+                    ),
+                    mime_type=derivative.mime_type,
+                )
+                self.crud.save_derivative(
+                    file_object_id=file_object.id,
+                    size=derivative.size,
+                    format=derivative.format,
+                    mime_type=derivative.mime_type,
+                    storage_bucket=s3_file_data.bucket_name,
+                    object_name=object_name,
+                    total_bytes=upload_stream.total_bytes,
+                    checksum=upload_stream.checksum,
+                )
+        except Exception as raised_exception:
+            # ? The image might have been deleted while its derivatives were rendered.
+            self.logger.exception(raised_exception)
+            self.db.rollback()
+            for object_name in object_names:
+                self.backend_storage.remove_file(s3_file_data.bucket_name, object_name)
+            return failed_service_result(
+                GeneralException("Unable to store the derivatives of this image.")
+            )
+
+        return success_service_result(len(derivatives))
+
+    def schedule_image_derivatives(self, file_object_id: UUID) -> Future:
+        """Renders the derivatives on the background pool, with a session of its own."""
+
+        requesting_user = self.requesting_user
+        app_settings = self.app_settings
+        logger = self.logger
+
+        def create_image_derivatives():
+            db = Session(bind=get_db_conn())
+            try:
+                result = FileService(
+                    requesting_user, db, app_settings
+                ).create_image_derivatives(file_object_id)
+                if not result.success:
+                    logger.error(result.exception)
+            except Exception as raised_exception:
+                logger.exception(raised_exception)
+            finally:
+                db.close()
+
+        return get_derivatives_executor(
+            self.app_settings.image_derivative_workers
+        ).submit(create_image_derivatives)
+
+    def select_image_variant(
+        self,
+        file_object: FileObjectOut,
+        size: Optional[int] = None,
+        accept: Optional[str] = None,
+    ) -> FileObjectOut:
+        """
+        The smallest derivative at least `size` px wide, in the best format
+        `accept` allows. The original is returned when no size is asked for,
+        it is larger than every derivative, or they are not rendered yet.
+        """
+
+        if size is None:
+            return file_object
+
+        derivatives = [
+            derivative
+            for derivative in self.crud.get_derivatives(file_object.id)
+            if derivative.size >= size
+        ]
+        if not derivatives:
+            return file_object
+
+        formats = {
+            derivative.format: derivative
+            for derivative in derivatives
+            if derivative.size == derivatives[0].size
+        }
+        for image_format in get_accepted_image_formats(accept) + list(
+            FALLBACK_IMAGE_FORMATS
+        ):
+            if image_format in formats:
+                derivative = formats[image_format]
+                return FileObjectOut(
+                    id=derivative.id,
+                    file_name=derivative.object_name,
+                    original_file_name=file_object.original_file_name,
+                    bucket=file_object.bucket,
+                    storage_bucket=derivative.storage_bucket,
+                    mime_type=derivative.mime_type,
+                    extension=derivative.format,
+                    total_bytes=derivative.total_bytes,
+                    checksum=derivative.checksum,
+                    date_created=derivative.date_created,
+                    blob=None,
+                )
+
+        return file_object
+
+    def get_local_file_path(self, file_object: FileObjectOut) -> Optional[str]:
+        """Where the file is on this machine, None unless the backend storage is LOCAL_STORAGE."""
+
+        return self.backend_storage.get_local_file_path(
+            self._get_s3_file_data(file_object)
+        )
+
+    def delete_files(
+        self, file_ids: List[UUID], owner_id: UUID = None  # type: ignore
+    ) -> ServiceResult[Union[int, GeneralException]]:
+        """
+        Deletes many files at once, only the owner's if `owner_id` is given.
+
+        The rows go in one statement and one transaction, together with the
+        references they held to shared blobs. The stored objects are removed
+        after the commit, with one multi-object delete per bucket. An object
+        that can not be removed is only wasted space, a row without its object
+        would be a broken file.
+
+        Returns:
+            int: The number of files deleted.
+        """
+
+        file_objects = self.crud.get_files_by_ids(file_ids, owner_id=owner_id)
+        if not file_objects:
+            return success_service_result(0)
+
+        deleted_file_ids = [file_object.id for file_object in file_objects]
+        stored_objects: DefaultDict[str, List[str]] = defaultdict(list)
+        blob_references: Counter = Counter()
+
+        # * The derivative rows go with the files, their objects do not.
+        for derivative in self.crud.get_derivatives_of_files(deleted_file_ids):
+            stored_objects[derivative.storage_bucket].append(derivative.object_name)
+
+        for file_object in file_objects:
+            if file_object.blob_id is None:
+                s3_file_data = self._get_s3_file_data(
+                    FileObjectOut.parse_obj(file_object.__dict__)
+                )
+                stored_objects[s3_file_data.bucket_name].append(s3_file_data.file_name)
+            else:
+                blob_references[file_object.blob_id] += 1
+
+        try:
+            total_deleted = self.crud.remove_files(deleted_file_ids)
+            for blob_id, references in blob_references.items():
+                removed_blob = self.crud.release_blob(blob_id, references)
+                if removed_blob is not None:
+                    stored_objects[removed_blob.bucket_name].append(
+                        removed_blob.object_name
+                    )
+            self.db.commit()
+        except Exception as raised_exception:
+            self.logger.exception(raised_exception)
+            self.db.rollback()
+            return failed_service_result(
+                GeneralException("There was a problem removing the files.")
+            )
+
+        try:
+            for bucket_name, object_names in stored_objects.items():
+                self.backend_storage.remove_files(bucket_name, object_names)
+        except Exception as raised_exception:
+            self.logger.exception(raised_exception)
+
+        return success_service_result(total_deleted)
+
     def delete_file(
         self, owner_id, file_object_id: UUID
     ) -> ServiceResult[Union[None, BaseNotFoundException, GeneralException]]:
@@ -178,18 +989,45 @@ class FileService(BaseService):
                 BaseNotFoundException(FILE_DOES_NOT_EXIST_ERROR_MESSAGE)
             )
 
-        try:
-            self.backend_storage.remove_file(
-                format_bucket_name(owner_id), str(file_object.file_name)
-            )
-            self.crud.remove_file(file_object_id)
-            return success_service_result(None)
-        except Exception as raised_exception:
-            self.logger.exception(raised_exception)
+        result = self.delete_files([file_object_id])
+        if not result.success:
             return failed_service_result(
                 GeneralException("There was a problem removing the file.")
             )
 
+        return success_service_result(None)
+
+    def delete_user_files(
+        self, owner_id: UUID
+    ) -> ServiceResult[Union[int, GeneralException]]:
+        """
+        Deletes every file of the user, `DELETE_BATCH_SIZE` at a time, and their
+        unfinished resumable uploads.
+
+        The bucket row and the storage bucket are kept, as the user can still
+        upload and every worker remembers them in its `bucket_registry`.
+
+        Returns:
+            int: The number of files deleted.
+        """
+
+        total_deleted = 0
+        while True:
+            file_ids = self.crud.get_file_ids(owner_id, limit=DELETE_BATCH_SIZE)
+            if not file_ids:
+                break
+
+            result = self.delete_files(file_ids, owner_id=owner_id)
+            if not result.success:
+                return result
+            total_deleted += result.data
+
+        for upload_session in self.crud.get_user_upload_sessions(owner_id):
+            remove_upload_session(self.crud, self.backend_storage, upload_session)
+        self.db.commit()
+
+        return success_service_result(total_deleted)
+
     def get_file(
         self, file_object_id: UUID
     ) -> ServiceResult[Union[FileObjectOut, BaseNotFoundException]]:
@@ -202,12 +1040,39 @@ class FileService(BaseService):
 
         return success_service_result(FileObjectOut.parse_obj(file_object.__dict__))
 
+    def get_user_file(
+        self, file_object_id: UUID
+    ) -> ServiceResult[Union[FileObjectOut, BaseNotFoundException]]:
+        """The file, if the requesting user owns it. Admins can read every file."""
+
+        owner_id = (
+            None if self.requesting_user.is_super_admin else self.requesting_user.id
+        )
+        file_objects = self.crud.get_files_by_ids([file_object_id], owner_id=owner_id)
+        if not file_objects:
+            return failed_service_result(
+                BaseNotFoundException(FILE_DOES_NOT_EXIST_ERROR_MESSAGE)
+            )
+
+        return success_service_result(FileObjectOut.from_orm(file_objects[0]))
+
     def get_files(
-        self, user_id: UUID, skip: int = 0, limit: int = 10
+        self,
+        user_id: UUID,
+        skip: int = 0,
+        limit: int = 10,
+        extension: str = None,  # type: ignore
+        mime_type: str = None,  # type: ignore
     ) -> ServiceResult[ManyFileObjectsOut]:
-        file_objects = self.crud.get_files(owner_id=user_id, skip=skip, limit=limit)
-        total_bytes = self.crud.get_total_bytes_used(owner_id=user_id)
-        total_files = self.crud.total_files(owner_id=user_id)
+        """The user's files, `total` and `total_bytes` count every file matching the filters."""
+
+        file_objects, total_files, total_bytes = self.crud.get_files_with_totals(
+            skip=skip,
+            limit=limit,
+            owner_id=user_id,
+            extension=extension,
+            mime_type=mime_type,
+        )
 
         result = {
             "total_bytes": total_bytes,
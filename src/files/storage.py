@@ -1,51 +1,268 @@
-from typing import BinaryIO
+import datetime
+import os
+import threading
+from io import BytesIO
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
 from src.config import Settings
-from src.files.clients.minio_client import MinioClient
-from src.files.utils import BackendStorageOption, S3FileData
+from src.exceptions import GeneralException
+from src.files.clients.client import BaseS3Client
+from src.files.disk_cache import get_file_cache
+from src.files.pipeline import UploadStream, iter_file_chunks
+from src.files.presigned import presigned_download_urls
+from src.metrics import (
+    count_storage_bytes,
+    count_streamed_bytes,
+    register_stats,
+    track_storage_operation,
+)
+from src.files.utils import (
+    BackendStorageOption,
+    S3FileData,
+    StoredFileInfo,
+    StoredObject,
+    megabytes_to_bytes,
+)
+
+
+_storage_clients: Dict[Tuple[str, ...], BaseS3Client] = {}
+_storage_clients_lock = threading.Lock()
+
+
+def make_storage_client(settings: Settings) -> BaseS3Client:
+    if settings.backend_storage_option == BackendStorageOption.MINIO_STORAGE.value:
+        # * Imported here so that only deployments using MinIO load the SDK.
+        from src.files.clients.minio_client import MinioClient
+
+        return MinioClient(settings)
+    elif settings.backend_storage_option == BackendStorageOption.GOOGLE_STORAGE.value:
+        raise NotImplementedError("Google Cloud Storage is not yet implemented.")
+    elif settings.backend_storage_option == BackendStorageOption.LOCAL_STORAGE.value:
+        from src.files.clients.local_client import LocalStorageClient
+
+        return LocalStorageClient(settings)
+
+    raise GeneralException(
+        f"Unknown backend storage option {settings.backend_storage_option}."
+    )
+
+
+def get_storage_client(settings: Settings) -> BaseS3Client:
+    """
+    The process-wide client of the configured storage, created on first use,
+    so every request shares its connection pool.
+    """
+
+    # * Every setting `make_storage_client` reads, so other settings never get this client.
+    key = (
+        settings.backend_storage_option,
+        str(settings.minio_host),
+        str(settings.minio_access_key),
+        str(settings.minio_secret_key),
+        settings.secure_minio,
+        settings.storage_pool_size,
+        settings.threadpool_size,
+        settings.image_derivative_workers,
+        settings.storage_connect_timeout_seconds,
+        settings.storage_read_timeout_seconds,
+        os.path.abspath(settings.local_storage_path),
+    )
+    with _storage_clients_lock:
+        if key not in _storage_clients:
+            _storage_clients[key] = make_storage_client(settings)
+            register_stats("storage_pool", _storage_clients[key].pool_stats)
+        return _storage_clients[key]
 
 
 class BackendStorage:
     def __init__(self, settings: Settings) -> None:
-        if settings.backend_storage_option == BackendStorageOption.MINIO_STORAGE.value:
-            self.client = MinioClient(settings)
-        elif (
-            settings.backend_storage_option == BackendStorageOption.GOOGLE_STORAGE.value
+        self.client = get_storage_client(settings)
+
+        # * Files already on the local disk gain nothing from a copy.
+        self.file_cache = None
+        if (
+            settings.file_cache_path
+            and settings.backend_storage_option
+            != BackendStorageOption.LOCAL_STORAGE.value
         ):
-            raise NotImplementedError("Google Cloud Storage is not yet implemented.")
+            self.file_cache = get_file_cache(
+                settings.file_cache_path,
+                max_bytes=megabytes_to_bytes(settings.file_cache_max_mb),
+                max_file_bytes=megabytes_to_bytes(settings.file_cache_max_file_mb),
+            )
 
     def create_bucket(self, bucket_name: str):
         self.client.make_bucket(bucket_name)
 
     def bucket_exists(self, bucket_name: str):
-        return self.client.bucket_exists(bucket_name)
+        with track_storage_operation("bucket_exists"):
+            return self.client.bucket_exists(bucket_name)
+
+    def pool_stats(self) -> Dict[str, int]:
+        return self.client.pool_stats()
 
     def upload_file(
         self,
-        file_to_upload: BinaryIO,
+        upload_stream: UploadStream,
         s3_file_data: S3FileData,
         mime_type: str,
-        file_size_limit: int = -1,
     ) -> int:
 
-        file_size = self.client.upload_file(
-            file_to_upload=file_to_upload,
-            bucket_name=s3_file_data.bucket_name,
-            s3_file_name=s3_file_data.file_name,
-            file_size_limit=file_size_limit,
-            mime_type=mime_type,
-        )
+        with track_storage_operation("upload"):
+            file_size = self.client.upload_file(
+                upload_stream=upload_stream,
+                bucket_name=s3_file_data.bucket_name,
+                s3_file_name=s3_file_data.file_name,
+                mime_type=mime_type,
+            )
+        count_storage_bytes("upload", file_size)
         return file_size
 
+    def create_multipart_upload(self, s3_file_data: S3FileData, mime_type: str) -> str:
+        return self.client.create_multipart_upload(
+            s3_file_data.bucket_name, s3_file_data.file_name, mime_type
+        )
+
+    def upload_part(
+        self, s3_file_data: S3FileData, upload_id: str, part_number: int, data: bytes
+    ) -> str:
+        with track_storage_operation("upload_part"):
+            etag = self.client.upload_part(
+                s3_file_data.bucket_name,
+                s3_file_data.file_name,
+                upload_id,
+                part_number,
+                data,
+            )
+        count_storage_bytes("upload_part", len(data))
+        return etag
+
+    def complete_multipart_upload(
+        self, s3_file_data: S3FileData, upload_id: str, parts: List[Tuple[int, str]]
+    ):
+        self.client.complete_multipart_upload(
+            s3_file_data.bucket_name, s3_file_data.file_name, upload_id, parts
+        )
+
+    def abort_multipart_upload(self, s3_file_data: S3FileData, upload_id: str):
+        self.client.abort_multipart_upload(
+            s3_file_data.bucket_name, s3_file_data.file_name, upload_id
+        )
+
+    def _open_cached_file(self, s3_file_data: S3FileData) -> Optional[BinaryIO]:
+        """The cached copy of the file, fetched on a miss. None without a cache or for large files."""
+
+        if self.file_cache is None:
+            return None
+
+        bucket_name, file_name = s3_file_data.bucket_name, s3_file_data.file_name
+
+        def get_size() -> int:
+            if s3_file_data.total_bytes is not None:
+                return s3_file_data.total_bytes
+            return self.client.get_file_info(bucket_name, file_name).total_bytes
+
+        def fill(cached_file: BinaryIO):
+            for chunk in self.client.open_file_stream(
+                bucket_name=bucket_name, file_name=file_name
+            ):
+                cached_file.write(chunk)
+
+        return self.file_cache.open(
+            bucket_name, file_name, get_size=get_size, fill=fill
+        )
+
     def download_file(self, s3_file_data: S3FileData):
-        return self.client.download_file(
-            bucket_name=s3_file_data.bucket_name, file_name=s3_file_data.file_name
+        with track_storage_operation("download"):
+            cached_file = self._open_cached_file(s3_file_data)
+            if cached_file is not None:
+                with cached_file:
+                    downloaded_file = BytesIO(cached_file.read())
+            else:
+                downloaded_file = self.client.download_file(
+                    bucket_name=s3_file_data.bucket_name,
+                    file_name=s3_file_data.file_name,
+                )
+        count_storage_bytes("download", downloaded_file.getbuffer().nbytes)
+        return downloaded_file
+
+    def open_file_stream(
+        self, s3_file_data: S3FileData, offset: int = 0, length: int = 0
+    ) -> Iterator[bytes]:
+        # * Timed until the stream is open, its bytes are counted as they are read.
+        with track_storage_operation("download"):
+            cached_file = self._open_cached_file(s3_file_data)
+            if cached_file is not None:
+                chunks = iter_file_chunks(cached_file, offset, length)
+            else:
+                chunks = self.client.open_file_stream(
+                    bucket_name=s3_file_data.bucket_name,
+                    file_name=s3_file_data.file_name,
+                    offset=offset,
+                    length=length,
+                )
+        return count_streamed_bytes("download", chunks)
+
+    def get_local_file_path(self, s3_file_data: S3FileData) -> Optional[str]:
+        """The path of the file on this machine, when the storage keeps it on the local file system."""
+
+        return self.client.get_file_path(
+            s3_file_data.bucket_name, s3_file_data.file_name
         )
 
-    def get_signed_upload_url(self, bucket_name: str, file_name: str):
-        return self.client.presigned_upload_url(bucket_name, file_name, days_expiring=7)
+    def read_file_head(self, s3_file_data: S3FileData, size: int) -> bytes:
+        return b"".join(self.open_file_stream(s3_file_data, length=size))
+
+    def get_file_info(self, s3_file_data: S3FileData) -> StoredFileInfo:
+        with track_storage_operation("get_file_info"):
+            return self.client.get_file_info(
+                bucket_name=s3_file_data.bucket_name, file_name=s3_file_data.file_name
+            )
+
+    def list_files(
+        self, bucket_name: str, after: Optional[str], limit: int
+    ) -> Tuple[List[StoredObject], Optional[str]]:
+        return self.client.list_file_objects(bucket_name, after, limit)
+
+    def get_signed_upload_url(
+        self, bucket_name: str, file_name: str, expires_in: datetime.timedelta
+    ) -> str:
+        return self.client.presigned_upload_url(
+            bucket_name, file_name, expires=expires_in
+        )
+
+    def get_signed_download_url(
+        self, bucket_name: str, file_name: str, expires_in: datetime.timedelta
+    ) -> Tuple[str, datetime.datetime]:
+        """Returns a presigned GET URL and when it expires, reusing a cached one until it is close to expiring."""
+
+        return presigned_download_urls.get_or_sign(
+            bucket_name,
+            file_name,
+            expires_in,
+            sign=lambda: self.client.presigned_download_url(
+                bucket_name, file_name, expires=expires_in
+            ),
+        )
+
+    def remove_files(self, bucket_name: str, file_names: List[str]) -> List[str]:
+        """Removes many files of a bucket at once, returns the names of the ones that could not be removed."""
+
+        with track_storage_operation("remove_many"):
+            failed_file_names = self.client.remove_file_objects(bucket_name, file_names)
+        for file_name in file_names:
+            presigned_download_urls.invalidate(bucket_name, file_name)
+            if self.file_cache is not None:
+                self.file_cache.remove(bucket_name, file_name)
+
+        return failed_file_names
 
-    def get_signed_download_url(self, bucket_name: str, file_name: str):
-        return self.client.presigned_download_url(bucket_name, file_name)
+    def remove_bucket(self, bucket_name: str):
+        self.client.remove_bucket(bucket_name)
 
     def remove_file(self, bucket_name: str, file_name: str):
-        self.client.remove_file_object(bucket_name, file_name)
+        with track_storage_operation("remove"):
+            self.client.remove_file_object(bucket_name, file_name)
+        presigned_download_urls.invalidate(bucket_name, file_name)
+        if self.file_cache is not None:
+            self.file_cache.remove(bucket_name, file_name)
@@ -0,0 +1,113 @@
+"""Resumable Upload Sweeper"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from src.config import Settings, setup_logger
+from src.exceptions import BaseNotFoundException, GeneralException
+from src.files.crud import FileCRUD
+from src.files.storage import BackendStorage
+from src.files.utils import S3FileData
+from src.models import UploadSession
+
+# * Sessions expired per transaction.
+EXPIRE_BATCH_SIZE = 100
+
+_sweeper_thread: Optional[threading.Thread] = None
+_sweeper_stop = threading.Event()
+_sweeper_lock = threading.Lock()
+
+
+def get_upload_session_file_data(upload_session: UploadSession) -> S3FileData:
+    """Where the object of the session is being uploaded to."""
+
+    return S3FileData(
+        file_name=upload_session.object_name,  # type: ignore
+        original_file_name=upload_session.original_file_name,  # type: ignore
+        bucket_name=upload_session.storage_bucket,  # type: ignore
+    )
+
+
+def remove_upload_session(
+    crud: FileCRUD, backend_storage: BackendStorage, upload_session: UploadSession
+):
+    """Aborts the storage upload of the session and removes its row, in the caller's transaction."""
+
+    if upload_session.upload_id is not None:
+        try:
+            backend_storage.abort_multipart_upload(
+                get_upload_session_file_data(upload_session),
+                upload_session.upload_id,  # type: ignore
+            )
+        except (BaseNotFoundException, GeneralException) as raised_exception:
+            # ? The storage's lifecycle rules have to clean this one up.
+            crud.logger.error(raised_exception)
+
+    crud.remove_upload_session(upload_session.id)  # type: ignore
+
+
+def expire_upload_sessions(db: Session, app_settings: Settings) -> int:
+    """
+    Removes the sessions no chunk was sent to for `resumable_upload_expire_minutes`,
+    with the parts they left in the storage.
+
+    Returns:
+        int: The number of sessions removed.
+    """
+
+    crud = FileCRUD(db)
+    backend_storage = BackendStorage(app_settings)
+    updated_before = datetime.now(timezone.utc) - timedelta(
+        minutes=app_settings.resumable_upload_expire_minutes
+    )
+
+    total_expired = 0
+    while True:
+        upload_sessions = crud.get_expired_upload_sessions(
+            updated_before, limit=EXPIRE_BATCH_SIZE
+        )
+        for upload_session in upload_sessions:
+            remove_upload_session(crud, backend_storage, upload_session)
+        db.commit()
+
+        total_expired += len(upload_sessions)
+        if len(upload_sessions) < EXPIRE_BATCH_SIZE:
+            return total_expired
+
+
+def start_upload_sweeper(app_settings: Settings):
+    """Expires abandoned uploads every `resumable_upload_sweep_minutes` on a background thread."""
+
+    global _sweeper_thread
+
+    def run_forever():
+        from src.database import get_db_conn
+
+        while not _sweeper_stop.wait(app_settings.resumable_upload_sweep_minutes * 60):
+            try:
+                with Session(bind=get_db_conn()) as db:
+                    total_expired = expire_upload_sessions(db, app_settings)
+                if total_expired:
+                    setup_logger().info(f"Expired {total_expired} resumable uploads")
+            except Exception as raised_exception:
+                setup_logger().exception(raised_exception)
+
+    with _sweeper_lock:
+        if _sweeper_thread is None:
+            _sweeper_stop.clear()
+            _sweeper_thread = threading.Thread(
+                target=run_forever, name="upload-sweeper", daemon=True
+            )
+            _sweeper_thread.start()
+
+
+def stop_upload_sweeper():
+    global _sweeper_thread
+    with _sweeper_lock:
+        if _sweeper_thread is not None:
+            _sweeper_stop.set()
+            _sweeper_thread.join()
+            _sweeper_thread = None
@@ -1,14 +1,14 @@
+import datetime
 import hashlib
 
 import enum
 
 from fastapi import UploadFile
 from tempfile import SpooledTemporaryFile
-from typing import BinaryIO
+from typing import BinaryIO, Optional
 import uuid
-import os
 
-from src.exceptions import GeneralException
+from src.exceptions import RangeNotSatisfiableException
 
 
 ONE_MEGA_BYTE = 1024 * 1024
@@ -19,40 +19,19 @@ def format_bucket_name(owner_id: uuid.UUID):
     return str(owner_id).replace("-", "")
 
 
-def prepare_file_for_http_upload(file_to_upload: UploadFile):
-    """If this is a SpooledTemporaryFile, force the file to be saved to disk."""
+def prepare_file_for_http_upload(file_to_upload: UploadFile) -> BinaryIO:
+    """
+    Returns the spooled file behind the upload as it is.
 
-    the_file = file_to_upload.file
-    if isinstance(the_file, SpooledTemporaryFile):
-        # roll over to an on-disk file regardless of its size.
-        # https://docs.python.org/3/library/tempfile.html#tempfile.SpooledTemporaryFile
-        # This might not be needed in python3.11
-        the_file.rollover()
-        the_file = the_file._file  # type: ignore
+    The upload is read once, as a stream, by `UploadStream`, so there is no
+    need to roll it over to disk or know its size up front.
+    """
 
-    return the_file
+    return file_to_upload.file  # type: ignore
 
 
-def meet_upload_file_limit_rule(
-    the_file: BinaryIO,
-    file_limit: float = float(os.getenv("MAX_SIZE_OF_A_FILE", "5.0")),
-):
-
-    max_bytes_to_read = round(file_limit * ONE_MEGA_BYTE) + 1
-    max_bytes_expected = round(file_limit * ONE_MEGA_BYTE)
-
-    if max_bytes_expected < ONE_MEGA_BYTE:
-        size_chunk = f"{max_bytes_expected / ONE_KB} kb"
-    else:
-        size_chunk = f"{max_bytes_expected / ONE_MEGA_BYTE} mb"
-
-    # * If the actual number of bytes are less than the max_bytes_to_read,
-    # * the actual number of bytes is only read.
-    if len(the_file.read(max_bytes_to_read)) > max_bytes_expected:
-        seek_to_start(the_file)
-        raise GeneralException(f"Your file size can not be more than {size_chunk}.")
-
-    seek_to_start(the_file)
+def megabytes_to_bytes(megabytes: float) -> int:
+    return round(megabytes * ONE_MEGA_BYTE)
 
 
 def seek_to_start(the_file: BinaryIO):
@@ -96,18 +75,135 @@ class S3FileData:
     file_name: str
     original_file_name: str
     bucket_name: str
+    # * The size of the stored object when it is known, saves asking the storage for it.
+    total_bytes: Optional[int]
 
     def __init__(
-        self, file_name: str, original_file_name: str, bucket_name: str
+        self,
+        file_name: str,
+        original_file_name: str,
+        bucket_name: str,
+        total_bytes: Optional[int] = None,
     ) -> None:
         self.file_name = file_name
         self.original_file_name = original_file_name
         self.bucket_name = bucket_name
+        self.total_bytes = total_bytes
+
+
+class ByteRange:
+    """An inclusive range of bytes, as sent in a `Range: bytes=start-end` header."""
+
+    start: int
+    end: int
+
+    def __init__(self, start: int, end: int) -> None:
+        self.start = start
+        self.end = end
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start + 1
+
+    def content_range(self, total_bytes: int) -> str:
+        return f"bytes {self.start}-{self.end}/{total_bytes}"
+
+
+def parse_range_header(
+    range_header: Optional[str], total_bytes: int
+) -> Optional[ByteRange]:
+    """
+    Parses a single `bytes` range against a file of `total_bytes`.
+
+    Headers that are missing, malformed, use another unit or ask for several
+    ranges are ignored (None), the caller then sends the whole file as the
+    RFC allows.
+
+    Raises:
+        RangeNotSatisfiableException: If the range starts past the end of the file.
+    """
+
+    if not range_header:
+        return None
+
+    unit, _, byte_range = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in byte_range:
+        return None
+
+    first, _, last = byte_range.strip().partition("-")
+    try:
+        if first == "":
+            # * bytes=-500, the last 500 bytes.
+            suffix_length = int(last)
+            if suffix_length <= 0:
+                raise RangeNotSatisfiableException(
+                    "The requested range is not satisfiable.", total_bytes
+                )
+            start = max(total_bytes - suffix_length, 0)
+            end = total_bytes - 1
+        else:
+            start = int(first)
+            end = int(last) if last else max(start, total_bytes - 1)
+    except ValueError:
+        return None
+
+    if start < 0 or end < start:
+        return None
+
+    if start >= total_bytes:
+        raise RangeNotSatisfiableException(
+            "The requested range is not satisfiable.", total_bytes
+        )
+
+    return ByteRange(start, min(end, total_bytes - 1))
+
+
+class StoredFileInfo:
+    """What the backend storage knows about an object, without reading it."""
+
+    total_bytes: int
+    content_type: Optional[str]
+
+    def __init__(self, total_bytes: int, content_type: Optional[str]) -> None:
+        self.total_bytes = total_bytes
+        self.content_type = content_type
+
+
+class StoredObject:
+    """An object found while listing a bucket."""
+
+    name: str
+    total_bytes: int
+    last_modified: datetime.datetime
+
+    def __init__(
+        self, name: str, total_bytes: int, last_modified: datetime.datetime
+    ) -> None:
+        self.name = name
+        self.total_bytes = total_bytes
+        self.last_modified = last_modified
 
 
 class BackendStorageOption(enum.Enum):
     MINIO_STORAGE: str = "MINIO_STORAGE"  # type: ignore
     GOOGLE_STORAGE: str = "GOOGLE_STORAGE"  # type: ignore
+    LOCAL_STORAGE: str = "LOCAL_STORAGE"  # type: ignore
+
+
+class StorageLayout(enum.Enum):
+    BUCKET_PER_USER: str = "BUCKET_PER_USER"  # type: ignore
+    SHARED_BUCKET: str = "SHARED_BUCKET"  # type: ignore
+
+
+class FileDeliveryMode(enum.Enum):
+    PROXY: str = "PROXY"  # type: ignore
+    REDIRECT: str = "REDIRECT"  # type: ignore
+    PRESIGNED_URL: str = "PRESIGNED_URL"  # type: ignore
+
+
+class OrphanAction(enum.Enum):
+    REPORT: str = "REPORT"  # type: ignore
+    DELETE: str = "DELETE"  # type: ignore
 
 
 def make_custom_id():
@@ -3,15 +3,21 @@ import sys
 # ? Allows this script read the src folder.
 sys.path.append(".")
 
-from src.database import SessionLocal
+from sqlalchemy import func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from src.database import get_engine
 from src.config import Settings
 from src.exceptions import BaseConflictException, GeneralException
+from src.models import PlatformBootstrap
 from src.users.schemas import UserCreate
 from src.users.services.users import UserCRUD
 from src.users.crud.roles import RoleCRUD
 from src.config import setup_logger
 from src.users import models
-from src.database import engine
 
 
 logger = setup_logger()
@@ -21,18 +27,23 @@ app_settings = Settings()
 if not app_settings.is_database_credentials_set():
     raise GeneralException("Database URL not configured")
 
+# * Bump this whenever the default data created below changes, so that the
+# * next deploy runs the bootstrap again.
+BOOTSTRAP_VERSION = 1
+
+# * Arbitrary, but must stay constant across releases.
+BOOTSTRAP_ADVISORY_LOCK_ID = 7_349_201_118
 
-def create_admin_user():
-    db = SessionLocal()
-    models.Base.metadata.create_all(bind=engine)
+
+def create_admin_user(db: Session) -> models.User:
     user_crud = UserCRUD(db)  # type: ignore
     logger.info("Creating Admin User")
     existing_admin_user = user_crud.get_user_by_email(app_settings.admin_email)
     if existing_admin_user:
         logger.info("Admin User already created.")
-        return
+        return existing_admin_user
 
-    user_crud.create_user(
+    admin_user = user_crud.create_user(
         UserCreate(
             email=app_settings.admin_email,  # type: ignore
             last_name=app_settings.admin_first_name,
@@ -45,42 +56,87 @@ def create_admin_user():
     logger.info(
         f"{app_settings.admin_email} ==> {app_settings.admin_password} - admin user created!"
     )
+    return admin_user
 
 
-def create_default_roles():
-    db = SessionLocal()
-    models.Base.metadata.create_all(bind=engine)
-
+def create_default_roles(db: Session, admin_user: models.User):
     role_crud = RoleCRUD(db)  # type: ignore
-    user_crud = UserCRUD(db)  # type: ignore
 
     logger.info("Creating Default Roles")
-    existing_admin_user = user_crud.get_user_by_email(app_settings.admin_email)
-    if not existing_admin_user:
-        raise Exception(f"Admin {app_settings.admin_email} user does not exist")
+    default_roles = {
+        "Users Management": models.User.full_scopes(),
+        "Roles Management": models.Roles.full_scopes(),
+    }
+    for title, permissions in default_roles.items():
+        try:
+            role_crud.create_role(title, permissions=permissions, created_by=admin_user)
+        except BaseConflictException:
+            db.rollback()
+            logger.info(f"Role {title} already created.")
+
+
+def get_bootstrapped_version(connection: Connection) -> int:
+    """Returns the applied bootstrap version, 0 if the platform was never bootstrapped."""
 
     try:
-        role_crud.create_role(
-            "Users Management",
-            permissions=models.User.full_scopes(),
-            created_by=existing_admin_user,
-        )
-    except Exception:
-        pass
+        version = connection.execute(
+            select(PlatformBootstrap.version).where(PlatformBootstrap.id == 1)
+        ).scalar()
+    except ProgrammingError:
+        # * The marker table does not exist yet.
+        return 0
+
+    return version or 0
+
+
+def mark_platform_bootstrapped(db: Session):
+    db.merge(PlatformBootstrap(id=1, version=BOOTSTRAP_VERSION))
+    db.commit()
+
+
+def init_platform() -> bool:
+    """
+    Creates the tables, the admin user and the default roles exactly once.
+
+    Concurrent callers (e.g. every hypercorn worker of a rolling deploy) are
+    serialised with a Postgres advisory lock, and once the version marker is
+    up to date a call costs a single query on a single, unpooled connection.
+
+    Returns:
+        bool: True if this call ran the bootstrap, False if it was skipped.
+    """
 
+    engine = get_engine(poolclass=NullPool)
     try:
-        role_crud.create_role(
-            "Roles Management",
-            permissions=models.Roles.full_scopes(),
-            created_by=existing_admin_user,
-        )
-    except Exception:
-        pass
-
-
-def init_platform():
-    create_admin_user()
-    create_default_roles()
+        with engine.connect() as connection:
+            if get_bootstrapped_version(connection) >= BOOTSTRAP_VERSION:
+                logger.info("Platform already bootstrapped.")
+                return False
+
+            connection.execute(
+                select(func.pg_advisory_lock(BOOTSTRAP_ADVISORY_LOCK_ID))
+            )
+            try:
+                # * Another process might have finished while we waited for the lock.
+                if get_bootstrapped_version(connection) >= BOOTSTRAP_VERSION:
+                    logger.info("Platform already bootstrapped.")
+                    return False
+
+                models.Base.metadata.create_all(bind=connection)
+
+                with Session(bind=connection) as db:
+                    admin_user = create_admin_user(db)
+                    create_default_roles(db, admin_user)
+                    mark_platform_bootstrapped(db)
+
+                logger.info(f"Platform bootstrapped to version {BOOTSTRAP_VERSION}.")
+                return True
+            finally:
+                connection.execute(
+                    select(func.pg_advisory_unlock(BOOTSTRAP_ADVISORY_LOCK_ID))
+                )
+    finally:
+        engine.dispose()
 
 
 if __name__ == "__main__":
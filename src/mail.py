@@ -1,11 +1,24 @@
+import hashlib
+import threading
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Any, Dict
+from typing import TYPE_CHECKING, List, Any, Dict
+from jose import jwe
 from pydantic import EmailStr, BaseModel
+from sqlalchemy.orm import Session
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-
+from src.models import EmailOutbox
 from src.service import get_settings
 
+if TYPE_CHECKING:
+    from fastapi_mail import FastMail
+    from jinja2 import Template
+
+EMAIL_TEMPLATE_FOLDER = Path(__file__).parent / "email-templates"
+
+_email_templates: Dict[str, "Template"] = {}
+_email_templates_lock = threading.Lock()
+
 
 class EmailSchema(BaseModel):
     email: List[EmailStr]
@@ -14,23 +27,125 @@ class EmailSchema(BaseModel):
 
 app_settings = get_settings()
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=app_settings.mail_username,
-    MAIL_PASSWORD=app_settings.mail_password,
-    MAIL_FROM=EmailStr(app_settings.mail_from),
-    MAIL_PORT=app_settings.mail_port,  # 587
-    MAIL_SERVER=app_settings.mail_server,
-    MAIL_STARTTLS=app_settings.mail_starttls,  # True
-    MAIL_SSL_TLS=app_settings.mail_ssl_tls,  # False
-    TEMPLATE_FOLDER=Path(__file__).parent / "email-templates",
-    USE_CREDENTIALS=app_settings.use_credentials,
-)
 
-fm = FastMail(conf)
+@lru_cache()
+def get_fast_mail() -> "FastMail":
+    """Builds the mail client on first use, so deployments that never send emails do not load fastapi_mail."""
+
+    from fastapi_mail import FastMail, ConnectionConfig
+
+    conf = ConnectionConfig(
+        MAIL_USERNAME=app_settings.mail_username,
+        MAIL_PASSWORD=app_settings.mail_password,
+        MAIL_FROM=EmailStr(app_settings.mail_from),
+        MAIL_PORT=app_settings.mail_port,  # 587
+        MAIL_SERVER=app_settings.mail_server,
+        MAIL_STARTTLS=app_settings.mail_starttls,  # True
+        MAIL_SSL_TLS=app_settings.mail_ssl_tls,  # False
+        TEMPLATE_FOLDER=EMAIL_TEMPLATE_FOLDER,
+        USE_CREDENTIALS=app_settings.use_credentials,
+    )
+    return FastMail(conf)
+
+
+def __getattr__(name: str):
+    # * Keeps `from src.mail import fm` working without building the client at import.
+    if name == "fm":
+        return get_fast_mail()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load_email_templates() -> Dict[str, "Template"]:
+    """Compiles every template in `EMAIL_TEMPLATE_FOLDER` once, keyed by its file name."""
+
+    with _email_templates_lock:
+        if not _email_templates:
+            from jinja2 import Environment, FileSystemLoader
+
+            # * The same environment `FastMail` builds for every message it renders.
+            environment = Environment(loader=FileSystemLoader(EMAIL_TEMPLATE_FOLDER))
+            for template_path in sorted(EMAIL_TEMPLATE_FOLDER.glob("*.html")):
+                _email_templates[template_path.name] = environment.get_template(
+                    template_path.name
+                )
+    return _email_templates
+
+
+def render_email_template(template_name: str, template_body: Dict[str, Any]) -> str:
+    """Renders a template compiled by `load_email_templates`, raises KeyError for an unknown one."""
+
+    return load_email_templates()[template_name].render(**template_body)
+
+
+# * Fields of `template_body` encrypted while the email is pending, and blanked
+# * once it is dead-lettered, so the row can be kept.
+SECRET_TEMPLATE_FIELDS = ("password", "token")
+
 
+def _get_template_key(secret_key: str) -> bytes:
+    # * `dir` encryption takes a 256-bit key as it is.
+    return hashlib.sha256(secret_key.encode()).digest()
 
-async def send_new_account_info(
-    email: EmailStr, password: str, owner_name: str, subject: str = "New Account Info"
+
+def seal_template_secrets(
+    template_body: Dict[str, Any], secret_key: str
+) -> Dict[str, Any]:
+    """Encrypts the `SECRET_TEMPLATE_FIELDS` of the body, so the outbox row does not hold them in plaintext."""
+
+    key = _get_template_key(secret_key)
+    return {
+        field: jwe.encrypt(
+            str(value).encode(), key, algorithm="dir", encryption="A256GCM"
+        ).decode()
+        if field in SECRET_TEMPLATE_FIELDS
+        else value
+        for field, value in template_body.items()
+    }
+
+
+def open_template_secrets(
+    template_body: Dict[str, Any], secret_key: str
+) -> Dict[str, Any]:
+    """The body `seal_template_secrets` encrypted, raises JWEError when it was sealed with another key."""
+
+    key = _get_template_key(secret_key)
+    return {
+        field: jwe.decrypt(value, key).decode()
+        if field in SECRET_TEMPLATE_FIELDS
+        else value
+        for field, value in template_body.items()
+    }
+
+
+def queue_email(
+    db: Session,
+    subject: str,
+    recipients: List[EmailStr],
+    template_name: str,
+    template_body: Dict[str, Any],
+) -> EmailOutbox:
+    """
+    Adds the email to the outbox in the session's transaction. It is sent by
+    the outbox sender once the transaction is committed, and never if it is
+    rolled back.
+    """
+
+    email = EmailOutbox(
+        subject=subject,
+        recipients=[str(recipient) for recipient in recipients],
+        template_name=template_name,
+        template_body=seal_template_secrets(template_body, app_settings.secret_key),
+    )
+    db.add(email)
+    return email
+
+
+def queue_new_account_info(
+    db: Session,
+    email: EmailStr,
+    password: str,
+    owner_name: str,
+    subject: str = "New Account Info",
 ):
     email_body = {
         "password": password,
@@ -39,34 +154,22 @@ async def send_new_account_info(
         "owner_name": owner_name,
         "app_name": get_settings().app_name,
     }
-    message = MessageSchema(
-        subject=subject,
-        recipients=[email],
-        template_body=email_body,
-        subtype=MessageType.html,
-    )
-    await fm.send_message(message, template_name="new_account_info.html")
+    queue_email(db, subject, [email], "new_account_info.html", email_body)
 
 
-async def send_how_to_change_password_email(
-    email: EmailStr, subject: str = "Change Password"
+def queue_how_to_change_password_email(
+    db: Session, email: EmailStr, subject: str = "Change Password"
 ):
     email_body = {
         "email": email,
         "login_ui_url": app_settings.login_ui_url,
         "app_name": get_settings().app_name,
     }
-    message = MessageSchema(
-        subject=subject,
-        recipients=[email],
-        template_body=email_body,
-        subtype=MessageType.html,
-    )
-    await fm.send_message(message, template_name="how_to_change_password.html")
+    queue_email(db, subject, [email], "how_to_change_password.html", email_body)
 
 
-async def send_change_password_request_mail(
-    email: EmailStr, subject: str, reset_token: str
+def queue_change_password_request_mail(
+    db: Session, email: EmailStr, subject: str, reset_token: str
 ) -> None:
     email_body = {
         "token": reset_token,
@@ -75,24 +178,18 @@ async def send_change_password_request_mail(
         "expires_in": app_settings.password_request_minutes,
         "app_name": get_settings().app_name,
     }
-    message = MessageSchema(
-        subject=subject,
-        recipients=[email],
-        template_body=email_body,
-        subtype=MessageType.html,
-    )
-    await fm.send_message(message, template_name="password_change_request.html")
+    queue_email(db, subject, [email], "password_change_request.html", email_body)
 
 
-async def send_password_changed_mail(email: EmailStr) -> None:
+def queue_password_changed_mail(db: Session, email: EmailStr) -> None:
     email_body = {
         "email": email,
         "app_name": get_settings().app_name,
     }
-    message = MessageSchema(
-        subject="Password Successfully Changed",
-        recipients=[email],
-        template_body=email_body,
-        subtype=MessageType.html,
+    queue_email(
+        db,
+        "Password Successfully Changed",
+        [email],
+        "password_changed.html",
+        email_body,
     )
-    await fm.send_message(message, template_name="password_changed.html")
@@ -1,5 +1,6 @@
 """main.py"""
 
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_utils.openapi import simplify_operation_ids
@@ -7,17 +8,27 @@ from fastapi_utils.openapi import simplify_operation_ids
 from src.auth.router import router as auth_router
 from src.exceptions import GeneralException
 from src.init_platform import init_platform
-from src.users import models
-from src.database import engine
 from src.users.routers.users import router as user_router
 from src.users.routers.roles import router as role_router
+from src.files.router import router as file_router
 from src.config import setup_logger
-from src.service import custom_openapi_with_scopes, get_settings
+from src.openapi import install_precomputed_openapi
+from src.service import get_settings
 from src.database import open_db_connections, close_db_connections
-
-from src.database import open_db_connections, close_db_connections
-
-models.Base.metadata.create_all(bind=engine)
+from src.files.derivatives import shutdown_derivatives_executor
+from src.files.reconciler import start_orphan_reconciler, stop_orphan_reconciler
+from src.files.uploads import start_upload_sweeper, stop_upload_sweeper
+from src.outbox import start_email_outbox_sender, stop_email_outbox_sender
+from src.files.service import get_upload_part_size
+from src.files.utils import ONE_KB, megabytes_to_bytes
+from src.middleware import RequestSizeLimitMiddleware, make_body_limit
+from src.files.admission import UploadAdmissionMiddleware, get_upload_admission
+from src.metrics import (
+    MetricsMiddleware,
+    configure_metrics,
+    make_metrics_response,
+    mark_metrics_process_dead,
+)
 
 logger = setup_logger()
 
@@ -27,6 +38,35 @@ app = FastAPI(
     redoc_url=get_settings().redoc_url,
     openapi_url=get_settings().openapi_url,
 )
+
+# * Room for the boundaries and part headers around a file in a multipart form.
+MULTIPART_OVERHEAD_BYTES = 16 * ONE_KB
+
+# * The routes that take a file, and the most bytes their bodies can have.
+upload_routes = [
+    make_body_limit(
+        "PUT",
+        "/users/[^/]+/upload-photo",
+        megabytes_to_bytes(get_settings().user_file_to_upload_limit)
+        + MULTIPART_OVERHEAD_BYTES,
+    ),
+    make_body_limit(
+        "PATCH", "/files/uploads/[^/]+", get_upload_part_size(get_settings())
+    ),
+]
+
+# * Oversized uploads are refused before they wait for admission, and both
+# * are added before CORS so that their early responses still get the CORS headers.
+app.add_middleware(
+    UploadAdmissionMiddleware,
+    admission=get_upload_admission(get_settings()),
+    routes=upload_routes,
+)
+app.add_middleware(
+    RequestSizeLimitMiddleware,
+    limits=upload_routes,
+    default_max_bytes=megabytes_to_bytes(get_settings().max_request_body_size),
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=get_settings().allowed_origins,
@@ -37,14 +77,15 @@ app.add_middleware(
     allow_origin_regex=get_settings().allow_origin_regex,
 )
 
+# * Outermost, so the requests the other middlewares answer early are counted too.
+if configure_metrics(get_settings()) is not None:
+    app.add_middleware(MetricsMiddleware, routes=app.routes)
+
 
 app.include_router(auth_router)
 app.include_router(role_router)
 app.include_router(user_router)
-
-simplify_operation_ids(app)
-
-app.openapi_schema = custom_openapi_with_scopes(app, get_settings())
+app.include_router(file_router)
 
 
 @app.get("/")
@@ -54,20 +95,55 @@ def root():
     return {"message": "Hello, Welcome to REGNIFY"}
 
 
+simplify_operation_ids(app)
+
+# * After every documented route, so a document written by `python -m src.openapi` matches them.
+install_precomputed_openapi(app, get_settings())
+
+
+if get_settings().metrics_enabled:
+
+    @app.get("/metrics", include_in_schema=False)
+    def read_metrics():
+        """The metrics of every worker process, in the Prometheus text format."""
+
+        return make_metrics_response()
+
+
 @app.on_event("startup")
 def check_dependencies():
     if not get_settings().is_database_credentials_set():
         logger.error("Database URL not configured")
         raise GeneralException("Database URL has not been configured.")
 
-    init_platform()
+    if get_settings().bootstrap_on_startup:
+        init_platform()
+
+
+@app.on_event("startup")
+async def size_threadpool():
+    # * The storage connection pool is sized for these threads, see `src.files.clients.minio_client`.
+    to_thread.current_default_thread_limiter().total_tokens = (
+        get_settings().threadpool_size
+    )
 
 
 @app.on_event("startup")
 def open_database_connection_pools():
     open_db_connections()
 
+    if get_settings().orphan_reconciler:
+        start_orphan_reconciler(get_settings())
+    start_upload_sweeper(get_settings())
+    start_email_outbox_sender(get_settings())
+
 
 @app.on_event("shutdown")
 def close_database_connection_pools():
+    # * Pending derivatives still need their database sessions.
+    shutdown_derivatives_executor()
+    stop_orphan_reconciler()
+    stop_upload_sweeper()
+    stop_email_outbox_sender()
     close_db_connections()
+    mark_metrics_process_dead()
@@ -0,0 +1,388 @@
+"""Metrics"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from starlette.responses import Response
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.config import Settings
+
+if TYPE_CHECKING:
+    from prometheus_client import CollectorRegistry
+
+# * The label of requests to a path no route matches, so unknown paths do not add series.
+UNMATCHED_ROUTE = "unmatched"
+
+# * The `stats()` of the process-wide objects published as gauges named `<source>_<stat>`,
+# * with how `/metrics` combines the values of the worker processes.
+STATS_GAUGES = {
+    "upload_admission": {
+        "in_flight": ("Uploads let in and not finished yet.", "livesum"),
+        "bytes_in_flight": ("Bytes the uploads in flight can bring in.", "livesum"),
+        "waiting": ("Uploads waiting to be let in.", "livesum"),
+        "admitted": ("Uploads let in since the worker started.", "livesum"),
+        "rejected": ("Uploads turned away since the worker started.", "livesum"),
+    },
+    "file_cache": {
+        "hits": ("Downloads served from the disk cache.", "livesum"),
+        "misses": ("Downloads that filled the disk cache.", "livesum"),
+        "bypasses": ("Downloads too large for the disk cache.", "livesum"),
+        "evictions": ("Files dropped from the disk cache to make room.", "livesum"),
+        "fill_errors": (
+            "Files that could not be written to the disk cache.",
+            "livesum",
+        ),
+        "bytes_saved": ("Bytes served from the disk cache.", "livesum"),
+        # * The workers index the same directory, so their sizes are not added up.
+        "total_bytes": ("Bytes held by the disk cache.", "livemax"),
+        "entries": ("Files held by the disk cache.", "livemax"),
+    },
+    "storage_pool": {
+        "max_size": ("Connections the storage client keeps open at most.", "livesum"),
+        "opened": ("Connections the storage client opened.", "livesum"),
+        "requests": ("Requests the storage client sent.", "livesum"),
+        "idle": ("Open connections waiting for a request.", "livesum"),
+        "reused": ("Requests sent over a connection kept alive.", "livesum"),
+    },
+}
+
+
+class Metrics:
+    """Every metric the API exposes, created in `registry`."""
+
+    def __init__(self, registry: "CollectorRegistry") -> None:
+        from prometheus_client import Counter, Gauge, Histogram
+
+        self.registry = registry
+
+        self.request_seconds = Histogram(
+            "http_request_duration_seconds",
+            "Time taken to answer a request, by route.",
+            ["method", "route"],
+            registry=registry,
+        )
+        self.requests = Counter(
+            "http_requests_total",
+            "Requests answered, by route and status code.",
+            ["method", "route", "status_code"],
+            registry=registry,
+        )
+        self.requests_in_flight = Gauge(
+            "http_requests_in_flight",
+            "Requests being answered, by route.",
+            ["method", "route"],
+            multiprocess_mode="livesum",
+            registry=registry,
+        )
+
+        self.db_checkout_wait_seconds = Histogram(
+            "db_pool_checkout_wait_seconds",
+            "Time spent waiting for a connection from the database pool.",
+            registry=registry,
+        )
+        self.db_checkout_seconds = Histogram(
+            "db_pool_checkout_seconds",
+            "Time a connection was checked out of the database pool for.",
+            registry=registry,
+        )
+        self.db_connections_checked_out = Gauge(
+            "db_pool_connections_checked_out",
+            "Connections checked out of the database pool.",
+            multiprocess_mode="livesum",
+            registry=registry,
+        )
+        self.db_queries = Counter(
+            "db_queries_total", "Statements sent to the database.", registry=registry
+        )
+
+        self.storage_seconds = Histogram(
+            "storage_operation_duration_seconds",
+            "Time taken by a storage operation.",
+            ["operation"],
+            registry=registry,
+        )
+        self.storage_bytes = Counter(
+            "storage_operation_bytes_total",
+            "Bytes sent to or read from the storage, by operation.",
+            ["operation"],
+            registry=registry,
+        )
+        self.storage_errors = Counter(
+            "storage_operation_errors_total",
+            "Storage operations that raised, by operation.",
+            ["operation"],
+            registry=registry,
+        )
+
+        self.mail_send_seconds = Histogram(
+            "mail_send_duration_seconds",
+            "Time taken to send one email over an open connection.",
+            registry=registry,
+        )
+        self.mails_sent = Counter("mail_sent_total", "Emails sent.", registry=registry)
+        self.mail_failures = Counter(
+            "mail_send_failures_total",
+            "Emails that could not be rendered or sent.",
+            registry=registry,
+        )
+
+        self.stats_gauges: Dict[str, Dict[str, Gauge]] = {
+            source: {
+                stat: Gauge(
+                    f"{source}_{stat}",
+                    description,
+                    multiprocess_mode=multiprocess_mode,
+                    registry=registry,
+                )
+                for stat, (description, multiprocess_mode) in stats.items()
+            }
+            for source, stats in STATS_GAUGES.items()
+        }
+
+
+_metrics: Optional[Metrics] = None
+_stats_sources: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+
+def is_multiprocess() -> bool:
+    return bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def configure_metrics(app_settings: Settings) -> Optional[Metrics]:
+    """
+    Creates the metrics of this process when `metrics_enabled`, every helper
+    of this module does nothing until then.
+
+    With `PROMETHEUS_MULTIPROC_DIR` set, every worker process writes its
+    values there and `/metrics` adds up the values of all of them.
+    """
+
+    global _metrics
+    if _metrics is None and app_settings.metrics_enabled:
+        # * Only deployments exposing metrics pay for importing the client.
+        from prometheus_client import REGISTRY
+
+        _metrics = Metrics(REGISTRY)
+    return _metrics
+
+
+def get_metrics() -> Optional[Metrics]:
+    return _metrics
+
+
+def publish_stats(source: str, stats: Dict[str, float]):
+    """Sets the gauges of `source` in `STATS_GAUGES` to `stats`."""
+
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    for stat, gauge in metrics.stats_gauges[source].items():
+        if stat in stats:
+            gauge.set(stats[stat])
+
+
+def register_stats(source: str, get_stats: Callable[[], Dict[str, float]]):
+    """Publishes `get_stats()` as the gauges of `source` after every request and before every scrape."""
+
+    _stats_sources[source] = get_stats
+
+
+def publish_registered_stats():
+    for source, get_stats in list(_stats_sources.items()):
+        publish_stats(source, get_stats())
+
+
+def make_metrics_response() -> Response:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        generate_latest,
+        multiprocess,
+    )
+
+    publish_registered_stats()
+    registry = _metrics.registry if _metrics is not None else REGISTRY
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_metrics_process_dead():
+    """Drops the live gauges of this process from the totals, called as the worker shuts down."""
+
+    if _metrics is not None and is_multiprocess():
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsMiddleware:
+    """
+    Times every request and counts the ones in flight, labelled by the path
+    template of the route that answers it, e.g. `/files/{file_id}`.
+    """
+
+    def __init__(self, app: ASGIApp, routes: List[BaseRoute]) -> None:
+        self.app = app
+        self.routes = routes
+
+    def get_route(self, scope: Scope) -> str:
+        route_path = UNMATCHED_ROUTE
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", UNMATCHED_ROUTE)
+            if match == Match.PARTIAL and route_path == UNMATCHED_ROUTE:
+                # * The path of a route for another method, answered with 405.
+                route_path = getattr(route, "path", UNMATCHED_ROUTE)
+        return route_path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        metrics = get_metrics()
+        if scope["type"] != "http" or metrics is None:
+            await self.app(scope, receive, send)
+            return
+
+        method, route = scope["method"], self.get_route(scope)
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = metrics.requests_in_flight.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.request_seconds.labels(method, route).observe(
+                time.perf_counter() - started
+            )
+            metrics.requests.labels(method, route, str(status_code)).inc()
+            in_flight.dec()
+            # * A scrape answered by another worker only sees the values last published here.
+            publish_registered_stats()
+
+
+class TimedQueuePool(QueuePool):
+    """A `QueuePool` that records how long getting a connection out of it waited."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics = get_metrics()
+            if metrics is not None:
+                metrics.db_checkout_wait_seconds.observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine: Engine):
+    """Records how long connections of the engine's pool are checked out, and counts its statements."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(*args):
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.db_queries.inc()
+
+    @event.listens_for(engine.pool, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.db_connections_checked_out.inc()
+
+    @event.listens_for(engine.pool, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        metrics = get_metrics()
+        if metrics is not None and checked_out_at is not None:
+            metrics.db_checkout_seconds.observe(time.perf_counter() - checked_out_at)
+            metrics.db_connections_checked_out.dec()
+
+
+@contextmanager
+def track_storage_operation(operation: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.storage_errors.labels(operation).inc()
+        raise
+    finally:
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.storage_seconds.labels(operation).observe(
+                time.perf_counter() - started
+            )
+
+
+def count_storage_bytes(operation: str, total_bytes: int):
+    metrics = get_metrics()
+    if metrics is not None and total_bytes:
+        metrics.storage_bytes.labels(operation).inc(total_bytes)
+
+
+class CountedStream:
+    """
+    Counts the bytes of a stream as they are read from it. Closing it closes
+    the stream, read or not, so its connection is still released.
+    """
+
+    def __init__(self, operation: str, chunks: Iterator[bytes]) -> None:
+        self.operation = operation
+        self.chunks = iter(chunks)
+
+    def __iter__(self) -> "CountedStream":
+        return self
+
+    def __next__(self) -> bytes:
+        chunk = next(self.chunks)
+        count_storage_bytes(self.operation, len(chunk))
+        return chunk
+
+    def close(self):
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def count_streamed_bytes(operation: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    if get_metrics() is None:
+        return chunks
+    return CountedStream(operation, chunks)
+
+
+def observe_mail_send(started: float, failed: bool = False):
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    metrics.mail_send_seconds.observe(time.perf_counter() - started)
+    if failed:
+        metrics.mail_failures.inc()
+    else:
+        metrics.mails_sent.inc()
+
+
+def count_mail_failures(total: int = 1):
+    """Counts emails that failed before they could be sent, e.g. while rendering or connecting."""
+
+    metrics = get_metrics()
+    if metrics is not None and total:
+        metrics.mail_failures.inc(total)
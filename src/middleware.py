@@ -0,0 +1,86 @@
+"""Request Body Limits"""
+
+import re
+from typing import List, Optional, Pattern, Tuple
+
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.files.pipeline import format_file_size_limit
+
+# * A method, a pattern the whole path has to match and the most bytes its body can have.
+BodyLimit = Tuple[str, Pattern, int]
+
+
+def make_body_limit(method: str, path_pattern: str, max_bytes: int) -> BodyLimit:
+    return (method.upper(), re.compile(f"^{path_pattern}$"), max_bytes)
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Refuses request bodies over the limit of their route with 413, before
+    anything is parsed or spooled to disk.
+
+    A `Content-Length` over the limit is answered without reading the body at
+    all. A body without one, e.g. chunked, is counted as it is received and
+    cut off as soon as it goes over, so reading an oversized upload stops
+    after `max_bytes`. Routes without a limit of their own get
+    `default_max_bytes`, None lets their bodies through as they are.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limits: List[BodyLimit],
+        default_max_bytes: Optional[int] = None,
+    ) -> None:
+        self.app = app
+        self.limits = limits
+        self.default_max_bytes = default_max_bytes
+
+    def get_max_bytes(self, method: str, path: str) -> Optional[int]:
+        for limit_method, path_pattern, max_bytes in self.limits:
+            if limit_method == method and path_pattern.match(path):
+                return max_bytes
+        return self.default_max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.get_max_bytes(scope["method"], scope["path"])
+        if max_bytes is None:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"The request body can not be more than {format_file_size_limit(max_bytes)}."
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > max_bytes:
+                    response = JSONResponse(
+                        {"detail": detail},
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        headers={"Connection": "close"},
+                    )
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received_bytes = 0
+
+        async def receive_within_limit() -> Message:
+            nonlocal received_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                received_bytes += len(message.get("body", b""))
+                if received_bytes > max_bytes:
+                    # * Raised where the body is read, FastAPI answers it like any other HTTPException.
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=detail,
+                    )
+            return message
+
+        await self.app(scope, receive_within_limit, send)
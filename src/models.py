@@ -1,6 +1,15 @@
 from email.policy import default
 import uuid
-from sqlalchemy import Column, ForeignKey, Date, String, DateTime, Integer
+from sqlalchemy import (
+    Column,
+    ForeignKey,
+    Date,
+    String,
+    DateTime,
+    Integer,
+    Text,
+    UniqueConstraint,
+)
 
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.sql.functions import func
@@ -15,13 +24,38 @@ class Bucket(Base):
     id = Column(
         postgresql.UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4
     )
-    name = Column(String(63))
+    name = Column(String(63), unique=True)
 
     owner_id = Column(postgresql.UUID(as_uuid=True), ForeignKey("users.id"))
 
     date_created = Column(DateTime(timezone=True), server_default=func.now())
 
 
+class FileBlob(Base):
+    """
+    Content shared by every file object with the same SHA-256, stored once.
+
+    `reference_count` is the number of file objects pointing at the blob, the
+    stored object is removed when it drops to zero.
+    """
+
+    __tablename__ = "file_blob"
+
+    id = Column(
+        postgresql.UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4
+    )
+
+    checksum = Column(String(64), unique=True, index=True, nullable=False)
+
+    bucket_name = Column(String(63), nullable=False)
+    object_name = Column(String(255), nullable=False)
+
+    total_bytes = Column(Integer, default=0)
+    reference_count = Column(Integer, default=0, nullable=False)
+
+    date_created = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class FileObject(Base):
     __tablename__ = "file_object"
 
@@ -39,7 +73,164 @@ class FileObject(Base):
 
     total_bytes = Column(Integer, default=0)
 
+    # * SHA-256 of the content, computed while the file is streamed to storage.
+    checksum = Column(String(64), nullable=True)
+
     bucket_id = Column(postgresql.UUID(as_uuid=True), ForeignKey("bucket.id"))
     bucket = relationship(Bucket, foreign_keys=[bucket_id], lazy="joined")
 
+    # * The storage bucket `file_name` is in, the bucket above only records the owner.
+    storage_bucket = Column(String(63), nullable=True)
+
+    # * Set when the content lives in a shared, content-addressed blob instead
+    # * of `file_name` in the owner's bucket.
+    blob_id = Column(
+        postgresql.UUID(as_uuid=True), ForeignKey("file_blob.id"), nullable=True
+    )
+    blob = relationship(FileBlob, foreign_keys=[blob_id], lazy="joined")
+
+    date_created = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class FileDerivative(Base):
+    """A resized copy of an image file object, stored next to the original."""
+
+    __tablename__ = "file_derivative"
+    __table_args__ = (UniqueConstraint("file_object_id", "size", "format"),)
+
+    id = Column(
+        postgresql.UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4
+    )
+
+    file_object_id = Column(
+        postgresql.UUID(as_uuid=True),
+        ForeignKey("file_object.id", ondelete="CASCADE"),
+        index=True,
+        nullable=False,
+    )
+
+    # * The width and height, derivatives are square.
+    size = Column(Integer, nullable=False)
+    format = Column(String(10), nullable=False)
+    mime_type = Column(String(100))
+
+    storage_bucket = Column(String(63), nullable=False)
+    object_name = Column(String(255), nullable=False)
+
+    total_bytes = Column(Integer, default=0)
+    checksum = Column(String(64), nullable=True)
+
+    date_created = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class UploadSession(Base):
+    """A resumable upload, its chunks are sent as the parts of a storage multipart upload."""
+
+    __tablename__ = "upload_session"
+
+    id = Column(
+        postgresql.UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4
+    )
+
+    owner_id = Column(
+        postgresql.UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        index=True,
+        nullable=False,
+    )
+    bucket_id = Column(postgresql.UUID(as_uuid=True), ForeignKey("bucket.id"))
+
+    original_file_name = Column(String(255), nullable=False)
+    storage_bucket = Column(String(63), nullable=False)
+    object_name = Column(String(255), nullable=False)
+
+    # * Sniffed from the first chunk.
+    mime_type = Column(String(100), nullable=True)
+    extension = Column(String(100), nullable=True)
+
+    total_bytes = Column(Integer, nullable=False)
+    received_bytes = Column(Integer, default=0, nullable=False)
+    part_size = Column(Integer, nullable=False)
+
+    # * The id of the storage multipart upload, started with the first chunk.
+    upload_id = Column(String(255), nullable=True)
+
+    date_created = Column(DateTime(timezone=True), server_default=func.now())
+    date_updated = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class UploadSessionPart(Base):
+    """A chunk of a resumable upload the storage has received."""
+
+    __tablename__ = "upload_session_part"
+    __table_args__ = (UniqueConstraint("upload_session_id", "part_number"),)
+
+    id = Column(
+        postgresql.UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4
+    )
+
+    upload_session_id = Column(
+        postgresql.UUID(as_uuid=True),
+        ForeignKey("upload_session.id", ondelete="CASCADE"),
+        index=True,
+        nullable=False,
+    )
+    part_number = Column(Integer, nullable=False)
+    etag = Column(String(255), nullable=False)
+
+
+class ReconcilerCheckpoint(Base):
+    """Where a walk of the orphan reconciler stopped, so the next run carries on from there."""
+
+    __tablename__ = "reconciler_checkpoint"
+
+    name = Column(String(50), primary_key=True)
+
+    bucket_name = Column(String(63), nullable=True)
+    # * The listing marker of the next page, or the last file object id checked.
+    marker = Column(String(1024), nullable=True)
+
+    date_updated = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class PlatformBootstrap(Base):
+    """A single row recording the version of the platform bootstrap that has been applied."""
+
+    __tablename__ = "platform_bootstrap"
+
+    id = Column(Integer, primary_key=True, default=1)
+    version = Column(Integer, nullable=False)
+
+    date_bootstrapped = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class EmailOutbox(Base):
+    """
+    An email waiting to be sent, added in the transaction of the change it is
+    about, so it is sent if and only if that change is committed.
+    """
+
+    __tablename__ = "email_outbox"
+
+    id = Column(
+        postgresql.UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4
+    )
+
+    subject = Column(String(255), nullable=False)
+    recipients = Column(postgresql.ARRAY(String(255)), nullable=False)
+    template_name = Column(String(100), nullable=False)
+    template_body = Column(postgresql.JSONB, nullable=False)
+
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(
+        DateTime(timezone=True), server_default=func.now(), index=True
+    )
+    # * Set once it ran out of attempts, it is then kept for an admin to look at.
+    dead_lettered_at = Column(DateTime(timezone=True), nullable=True)
+
     date_created = Column(DateTime(timezone=True), server_default=func.now())
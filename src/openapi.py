@@ -0,0 +1,149 @@
+"""Pre-serialized OpenAPI document"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import sys
+from pathlib import Path
+from typing import Set, Tuple
+
+# ? Allows this script read the src folder.
+sys.path.append(".")
+
+from fastapi import FastAPI, Request, Response, status
+from fastapi.routing import APIRoute
+from starlette.routing import Route
+
+from src.config import Settings, setup_logger
+from src.service import custom_openapi_with_scopes
+
+logger = setup_logger()
+
+
+class PrecomputedOpenAPI:
+    """The scope-annotated OpenAPI document, serialized and compressed once."""
+
+    def __init__(self, body: bytes) -> None:
+        self.body = body
+        self.gzipped_body = gzip.compress(body)
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    @classmethod
+    def from_schema(cls, openapi_schema: dict) -> "PrecomputedOpenAPI":
+        return cls(
+            json.dumps(
+                openapi_schema, ensure_ascii=False, separators=(",", ":")
+            ).encode("utf-8")
+        )
+
+    @classmethod
+    def from_file(cls, file_path: str) -> "PrecomputedOpenAPI":
+        return cls(Path(file_path).read_bytes())
+
+    def write(self, file_path: str):
+        Path(file_path).write_bytes(self.body)
+
+    def to_schema(self) -> dict:
+        return json.loads(self.body)
+
+    def make_response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Vary": "Accept-Encoding"}
+
+        if request.headers.get("if-none-match") == self.etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            return Response(
+                self.gzipped_body,
+                media_type="application/json",
+                headers={**headers, "Content-Encoding": "gzip"},
+            )
+
+        return Response(self.body, media_type="application/json", headers=headers)
+
+
+def get_route_signature(app: FastAPI) -> Set[Tuple[str, str]]:
+    """The path and method of every operation the app documents."""
+
+    return {
+        (route.path_format, method.lower())
+        for route in app.routes
+        if isinstance(route, APIRoute) and route.include_in_schema
+        for method in route.methods
+    }
+
+
+def get_document_signature(openapi_schema: dict) -> Set[Tuple[str, str]]:
+    return {
+        (path, method)
+        for path, operations in openapi_schema.get("paths", {}).items()
+        for method in operations
+    }
+
+
+def is_document_current(app: FastAPI, settings: Settings, openapi_schema: dict) -> bool:
+    """Whether a document written by an earlier build still describes this app."""
+
+    info = openapi_schema.get("info", {})
+    return (
+        info.get("title") == settings.app_name
+        and info.get("version") == settings.api_version
+        and get_document_signature(openapi_schema) == get_route_signature(app)
+    )
+
+
+def build_openapi_document(app: FastAPI, settings: Settings) -> PrecomputedOpenAPI:
+    """
+    Loads the document from `settings.openapi_schema_file` if it exists and
+    still matches the app's version and routes, otherwise generates it.
+    """
+
+    if settings.openapi_schema_file and Path(settings.openapi_schema_file).exists():
+        document = PrecomputedOpenAPI.from_file(settings.openapi_schema_file)
+        if is_document_current(app, settings, document.to_schema()):
+            logger.info(
+                f"Loading the OpenAPI document from {settings.openapi_schema_file}"
+            )
+            return document
+        logger.warning(
+            f"{settings.openapi_schema_file} does not match this build, the OpenAPI document is generated instead."
+        )
+
+    return PrecomputedOpenAPI.from_schema(custom_openapi_with_scopes(app, settings))
+
+
+def install_precomputed_openapi(app: FastAPI, settings: Settings) -> PrecomputedOpenAPI:
+    """Serves the OpenAPI document from pre-serialized bytes instead of re-encoding it on every request."""
+
+    document = build_openapi_document(app, settings)
+    app.openapi_schema = document.to_schema()
+
+    async def openapi(request: Request) -> Response:
+        return document.make_response(request)
+
+    # * Replace the route FastAPI registered, the docs pages keep pointing to the same url.
+    for index, route in enumerate(app.router.routes):
+        if isinstance(route, Route) and route.path == app.openapi_url:
+            app.router.routes[index] = Route(
+                app.openapi_url, openapi, include_in_schema=False
+            )
+
+    return document
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Writes the scope-annotated OpenAPI document to a file."
+    )
+    parser.add_argument("--output", default="openapi.json")
+    args = parser.parse_args()
+
+    from src.main import app
+    from src.service import get_settings
+
+    app.openapi_schema = None
+    PrecomputedOpenAPI.from_schema(
+        custom_openapi_with_scopes(app, get_settings())
+    ).write(args.output)
+    logger.info(f"OpenAPI document written to {args.output}")
@@ -0,0 +1,223 @@
+"""Email Outbox"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from src.config import Settings, setup_logger
+from src.metrics import count_mail_failures, observe_mail_send
+from src.mail import (
+    SECRET_TEMPLATE_FIELDS,
+    get_fast_mail,
+    load_email_templates,
+    open_template_secrets,
+    render_email_template,
+)
+from src.models import EmailOutbox
+
+_sender_thread: Optional[threading.Thread] = None
+_sender_stop = threading.Event()
+_sender_wake = threading.Event()
+_sender_lock = threading.Lock()
+
+
+class OutboxReport:
+    def __init__(self) -> None:
+        self.batches = 0
+        self.sent = 0
+        self.failed = 0
+        self.dead_lettered = 0
+
+
+class EmailOutboxSender:
+    """
+    Sends the emails of the outbox in batches, each batch over one SMTP
+    connection.
+
+    A batch is claimed with `FOR UPDATE SKIP LOCKED`, so every worker process
+    can run a sender without two of them sending the same email. A sent
+    email is removed. One that fails is tried again after a backoff that
+    doubles with every attempt, and is dead-lettered after
+    `mail_outbox_max_attempts` with its `SECRET_TEMPLATE_FIELDS` blanked.
+    """
+
+    def __init__(self, db: Session, app_settings: Settings) -> None:
+        self.db = db
+        self.app_settings = app_settings
+        self.logger = setup_logger()
+
+    def claim_batch(self) -> List[EmailOutbox]:
+        return (
+            self.db.query(EmailOutbox)
+            .filter(
+                EmailOutbox.dead_lettered_at.is_(None),
+                EmailOutbox.next_attempt_at <= datetime.now(timezone.utc),
+            )
+            .order_by(EmailOutbox.next_attempt_at.asc())
+            .limit(self.app_settings.mail_outbox_batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+
+    async def _send_emails(self, emails: List[EmailOutbox]) -> Dict[UUID, str]:
+        """Sends the emails over one connection, returns the errors of the ones that failed."""
+
+        from fastapi_mail import MessageSchema, MessageType
+        from fastapi_mail.connection import Connection
+        from fastapi_mail.fastmail import email_dispatched
+        from fastapi_mail.msg import MailMsg
+
+        config = get_fast_mail().config
+        sender = (
+            f"{config.MAIL_FROM_NAME} <{config.MAIL_FROM}>"
+            if config.MAIL_FROM_NAME
+            else config.MAIL_FROM
+        )
+
+        # * Rendered before the connection is opened, so it is not held while templates render.
+        errors: Dict[UUID, str] = {}
+        messages = []
+        for email in emails:
+            try:
+                template_body = open_template_secrets(
+                    email.template_body, self.app_settings.secret_key  # type: ignore
+                )
+                html = render_email_template(email.template_name, template_body)  # type: ignore
+                message = MessageSchema(
+                    subject=email.subject,
+                    recipients=email.recipients,
+                    body=html,
+                    subtype=MessageType.html,
+                )
+                messages.append((email, await MailMsg(message)._message(sender)))
+            except Exception as raised_exception:
+                errors[email.id] = repr(raised_exception)  # type: ignore
+        count_mail_failures(len(errors))
+
+        sent = set()
+        try:
+            async with Connection(config) as connection:
+                for email, message in messages:
+                    started = time.perf_counter()
+                    try:
+                        if not config.SUPPRESS_SEND:
+                            await connection.session.send_message(message)
+                        sent.add(email.id)
+                        observe_mail_send(started)
+                        email_dispatched.send(message)
+                    except Exception as raised_exception:
+                        observe_mail_send(started, failed=True)
+                        errors[email.id] = repr(raised_exception)  # type: ignore
+        except Exception as raised_exception:
+            # ? The connection could not be opened, or broke along the way.
+            for email, _ in messages:
+                if email.id not in sent and email.id not in errors:
+                    errors[email.id] = repr(raised_exception)  # type: ignore
+                    count_mail_failures()
+
+        return errors
+
+    def send_batch(self, report: OutboxReport) -> int:
+        """Sends one batch, returns the number of emails it held."""
+
+        emails = self.claim_batch()
+        if not emails:
+            self.db.rollback()
+            return 0
+
+        errors = asyncio.run(self._send_emails(emails))
+
+        now = datetime.now(timezone.utc)
+        for email in emails:
+            error = errors.get(email.id)  # type: ignore
+            if error is None:
+                self.db.delete(email)
+                report.sent += 1
+                continue
+
+            email.attempts += 1  # type: ignore
+            email.last_error = error  # type: ignore
+            if email.attempts >= self.app_settings.mail_outbox_max_attempts:
+                email.dead_lettered_at = now  # type: ignore
+                email.template_body = {  # type: ignore
+                    field: "" if field in SECRET_TEMPLATE_FIELDS else value
+                    for field, value in email.template_body.items()  # type: ignore
+                }
+                report.dead_lettered += 1
+                self.logger.error(f"Email {email.id} was dead-lettered: {error}")
+            else:
+                email.next_attempt_at = now + timedelta(  # type: ignore
+                    seconds=self.app_settings.mail_outbox_retry_backoff_seconds
+                    * 2 ** (email.attempts - 1)
+                )
+                report.failed += 1
+                self.logger.warning(
+                    f"Email {email.id} failed on attempt {email.attempts}: {error}"
+                )
+
+        self.db.commit()
+        report.batches += 1
+        return len(emails)
+
+    def send_pending(self) -> OutboxReport:
+        """Sends batches until the emails that are due run out."""
+
+        report = OutboxReport()
+        while (
+            self.send_batch(report) == self.app_settings.mail_outbox_batch_size
+            and not _sender_stop.is_set()
+        ):
+            pass
+        return report
+
+
+def notify_email_outbox():
+    """Wakes the sender of this process, for emails that were just committed."""
+
+    _sender_wake.set()
+
+
+def start_email_outbox_sender(app_settings: Settings):
+    """Sends the outbox every `mail_outbox_poll_seconds`, or right away when notified, on a background thread."""
+
+    global _sender_thread
+
+    # * A template that does not compile fails the startup instead of every email sent with it.
+    load_email_templates()
+
+    def run_forever():
+        from src.database import get_db_conn
+
+        while not _sender_stop.is_set():
+            _sender_wake.wait(app_settings.mail_outbox_poll_seconds)
+            _sender_wake.clear()
+            if _sender_stop.is_set():
+                return
+            try:
+                with Session(bind=get_db_conn()) as db:
+                    EmailOutboxSender(db, app_settings).send_pending()
+            except Exception as raised_exception:
+                setup_logger().exception(raised_exception)
+
+    with _sender_lock:
+        if _sender_thread is None:
+            _sender_stop.clear()
+            _sender_thread = threading.Thread(
+                target=run_forever, name="email-outbox", daemon=True
+            )
+            _sender_thread.start()
+
+
+def stop_email_outbox_sender():
+    global _sender_thread
+    with _sender_lock:
+        if _sender_thread is not None:
+            _sender_stop.set()
+            _sender_wake.set()
+            _sender_thread.join()
+            _sender_thread = None
@@ -1,8 +1,7 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Any
 
-from passlib.context import CryptContext
-
 from sqlalchemy.orm import Session
 
 from jose import jwt
@@ -16,7 +15,15 @@ from src.users.exceptions import UserNotFoundException
 
 from src.users.schemas import UserInDB
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+@lru_cache()
+def get_password_context():
+    """Loads passlib and its bcrypt backend on the first password check, not at startup."""
+
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl="token", scopes={"me": "Read information about the current user."}
@@ -38,11 +45,11 @@ def decode_token(token: str, secret_key: str, algorithm: str):
 
 
 def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_password_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str):
-    return pwd_context.hash(password)
+    return get_password_context().hash(password)
 
 
 def get_user(db: Session, username: str) -> models.User:
@@ -1,8 +1,10 @@
 from functools import lru_cache
 from typing import Any, Generic, TypeVar
+import orjson
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.openapi.utils import get_openapi
 from src.config import Settings, setup_logger
 from src.exceptions import (
@@ -11,11 +13,13 @@ from src.exceptions import (
     BaseNotFoundException,
     FileTooLargeException,
     GeneralException,
+    RangeNotSatisfiableException,
     handle_bad_request_exception,
     handle_conflict_exception,
     handle_forbidden_exception,
     handle_not_found_exception,
     handle_file_too_large_exception,
+    handle_range_not_satisfiable_exception,
 )
 
 from src.users import schemas
@@ -78,6 +82,10 @@ def handle_result(result: ServiceResult, expected_schema: BaseModel = None):  #
     if result.success:
         try:
             if expected_schema is not None:
+                # * Services that build the output model themselves are not validated again.
+                # ! Not for subclasses, they can carry fields the schema leaves out.
+                if type(result.data) is expected_schema:
+                    return result.data
                 return expected_schema.from_orm(result.data)
             else:
                 return AppResponseModel(detail=result.data)
@@ -94,64 +102,62 @@ def handle_result(result: ServiceResult, expected_schema: BaseModel = None):  #
         handle_conflict_exception(result.exception)
     elif isinstance(result.exception, BaseForbiddenException):
         handle_forbidden_exception(result.exception)
+    elif isinstance(result.exception, RangeNotSatisfiableException):
+        handle_range_not_satisfiable_exception(result.exception)
     else:
         handle_bad_request_exception(result.exception)
 
 
+def make_json_response(model: BaseModel, status_code: int = 200) -> Response:
+    """Serializes the model with orjson. UUIDs, datetimes and enums are encoded natively, anything else by `jsonable_encoder`."""
+
+    return Response(
+        orjson.dumps(model.dict(by_alias=True), default=jsonable_encoder),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+def handle_json_result(result: ServiceResult, expected_schema: BaseModel) -> Response:
+    """
+    Like `handle_result`, but returns the model already serialized.
+
+    FastAPI does not validate and encode a returned `Response` against the
+    route's `response_model`, so the model is built once instead of being
+    walked again for every nested object. `expected_schema` has to be the
+    route's `response_model`, which still documents the response.
+    """
+
+    return make_json_response(handle_result(result, expected_schema))
+
+
 def custom_openapi_with_scopes(app: FastAPI, settings: Settings):
     if app.openapi_schema:
         return app.openapi_schema
 
     openapi_schema = get_openapi(
-        contact={"email": get_settings().admin_email},
-        title=get_settings().app_name,
-        version=get_settings().api_version,
+        contact={"email": settings.admin_email},
+        title=settings.app_name,
+        version=settings.api_version,
         routes=app.routes,
     )
 
     if settings.display_scopes:
-        paths_with_descriptions = []
-        for endpoint in openapi_schema["paths"]:
-            path = openapi_schema["paths"][endpoint]
-            for method in path:
-                method_data = path[method]
-                if "security" in method_data:
-                    for oa2pb in method_data["security"]:
-                        for scope in oa2pb["OAuth2PasswordBearer"]:
-                            try:
-                                endpoint_method_value = openapi_schema["paths"][
-                                    endpoint
-                                ][method]
-
-                                if (
-                                    "description"
-                                    not in openapi_schema["paths"][endpoint][method]
-                                ):
-                                    openapi_schema["paths"][endpoint][method][
-                                        "description"
-                                    ] = f"<strong>Scopes: </strong> {scope},"
-                                else:
-                                    if (
-                                        not endpoint_method_value
-                                        in paths_with_descriptions
-                                    ):
-                                        paths_with_descriptions.append(
-                                            openapi_schema["paths"][endpoint][method]
-                                        )
-                                        openapi_schema["paths"][endpoint][method][
-                                            "description"
-                                        ] += f"""
-                                        <br />
-                                        <br />
-                                        <strong>Scopes: </strong> {scope}, """
-                                    else:
-                                        openapi_schema["paths"][endpoint][method][
-                                            "description"
-                                        ] += (scope + ",  ")
-
-                            except KeyError:
-                                openapi_schema["paths"][endpoint][method][
-                                    "description"
-                                ] = f"<strong>Scopes: </strong> {scope},  "
+        for path in openapi_schema["paths"].values():
+            for method_data in path.values():
+                scopes = [
+                    scope
+                    for security in method_data.get("security", [])
+                    for scope in security.get("OAuth2PasswordBearer", [])
+                ]
+                if not scopes:
+                    continue
+
+                scopes_description = f"<strong>Scopes: </strong> {', '.join(scopes)}"
+                if method_data.get("description"):
+                    scopes_description = (
+                        f"{method_data['description']}<br /><br />{scopes_description}"
+                    )
+                method_data["description"] = scopes_description
 
     return openapi_schema
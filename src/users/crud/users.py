@@ -66,8 +66,10 @@ class UserCRUD:
         is_super_admin: bool = False,
     ):
         try:
-            db_profile = self.create_user_profile(
-                schemas.ProfileCreate(
+            # * Added with the user, so both are committed together with
+            # * anything else the caller added to the session.
+            db_profile = models.Profile(
+                **schemas.ProfileCreate(
                     **{
                         "last_name": user.last_name,
                         "first_name": user.first_name,
@@ -75,7 +77,7 @@ class UserCRUD:
                             user.first_name, user.last_name
                         ),
                     }
-                )
+                ).dict()
             )
 
             hashed_password = get_password_hash(password=user.password)
@@ -138,3 +140,10 @@ class UserCRUD:
         self.db.refresh(db_profile)
 
         return db_profile
+
+    def get_profile_by_photo(self, file_object_id: UUID) -> Union[models.Profile, None]:
+        return (
+            self.db.query(models.Profile)
+            .filter(models.Profile.photo_file_id == file_object_id)
+            .first()
+        )
@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, Security, Body
 from src.config import setup_logger
 from src.scopes import RoleScope
 from src.pagination import CommonQueryParams, OrderBy, OrderDirection
-from src.service import AppResponseModel, handle_result
+from src.service import AppResponseModel, handle_json_result, handle_result
 from src.users import schemas
 from src.users.dependencies import (
     initiate_role_service,
@@ -56,7 +56,7 @@ def get_roles(
         order_by=order_by,
         order_direction=order_direction,
     )
-    return handle_result(result, schemas.ManyRolesOut)  # type: ignore
+    return handle_json_result(result, schemas.ManyRolesOut)  # type: ignore
 
 
 @router.get(
@@ -71,7 +71,7 @@ def get_role(
 ):
     """Gets a single role"""
     result = role_service.get_role(role_id=role_id)
-    return handle_result(result, schemas.RoleOut)  # type: ignore
+    return handle_json_result(result, schemas.RoleOut)  # type: ignore
 
 
 @router.put(
@@ -156,4 +156,4 @@ def list_users_assigned_to_role(
     """List the users that are assigned to a particular role."""
 
     result = role_service.get_users_assigned_to_role(role_id)
-    return handle_result(result, schemas.ManyUserRolesOut)  # type: ignore
+    return handle_json_result(result, schemas.ManyUserRolesOut)  # type: ignore
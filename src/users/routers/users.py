@@ -1,24 +1,44 @@
 """User's Router"""
 
-from io import BytesIO
-from tempfile import NamedTemporaryFile
-
+from typing import Dict, Optional, Tuple
 from uuid import UUID
 from pydantic import EmailStr
-from fastapi import APIRouter, Depends, Header, Path, Query, Security, UploadFile, File
-from fastapi.responses import FileResponse
-from src import mail as mail_funcs
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    Path,
+    Query,
+    Request,
+    Response,
+    Security,
+    UploadFile,
+    File,
+)
+from fastapi.responses import StreamingResponse
 
 from src.auth.dependencies import (
     get_current_active_user,
     user_must_be_admin,
 )
 from src.config import setup_logger
-from src.files.schemas import FileObjectOut
+from src.outbox import notify_email_outbox
+from src.files.responses import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    make_file_delivery_response,
+    make_file_response,
+)
+from src.files.schemas import (
+    DirectUploadFinalize,
+    DirectUploadInitiate,
+    DirectUploadOut,
+    FileObjectOut,
+)
 from src.scopes import UserScope
 from src.service import AppResponseModel, does_admin_token_match
 from src.pagination import CommonQueryParams
-from src.service import handle_result, success_service_result
+from src.service import handle_json_result, handle_result, success_service_result
 from src.users import schemas
 from src.users.dependencies import (
     can_read_all_users,
@@ -60,35 +80,26 @@ def list_scopes(
 
 
 @router.post("/request-password-change", response_model=AppResponseModel)
-async def request_password_change(
+def request_password_change(
     email: EmailStr = Query(),
     user_service: UserService = Depends(initiate_anonymous_user_service),
 ):
     success_message = "A reset password information has been sent to the associated account's email address."
     result_with_token = user_service.create_request_password(email)
     if result_with_token.success:
-        user_with_email_result = user_service.get_user_by_email(email)
-        if not user_with_email_result.success:
-            logger.error("Unable to send email to user")
-            return
-        else:
-            await mail_funcs.send_change_password_request_mail(
-                user_with_email_result.data.email,
-                subject="Password Change Request",
-                reset_token=result_with_token.data,
-            )
+        notify_email_outbox()
 
     return handle_result(success_service_result(success_message))  # type: ignore
 
 
 @router.put("/change-user-password", response_model=AppResponseModel)
-async def change_user_password(
+def change_user_password(
     data: ChangePasswordWithToken,
     user_service: UserService = Depends(initiate_anonymous_user_service),
 ):
     result = user_service.change_password_with_token(data.token, data.new_password)
     if result.success:
-        await mail_funcs.send_password_changed_mail(result.data.email)
+        notify_email_outbox()
         return handle_result(success_service_result("Your password has been successfully changed."))  # type: ignore
 
     return handle_result(result)
@@ -98,7 +109,7 @@ async def change_user_password(
     "/",
     response_model=schemas.UserOut,
 )
-async def create_user(
+def create_user(
     user: schemas.UserCreate,
     user_service: UserService = Security(
         initiate_user_service, scopes=[UserScope.CREATE.value]
@@ -114,11 +125,7 @@ async def create_user(
     result = user_service.create_user(user, admin_signup_token=admin_signup_token)  # type: ignore
 
     if result.success and not does_admin_token_match(admin_signup_token):
-        await mail_funcs.send_new_account_info(
-            user.email,
-            password=user.password,
-            owner_name=f"{user_service.requesting_user.profile.last_name} {user_service.requesting_user.profile.first_name}",
-        )
+        notify_email_outbox()
 
     return handle_result(result, schemas.UserOut)  # type: ignore
 
@@ -127,15 +134,15 @@ async def create_user(
     "/resend-invite",
     response_model=AppResponseModel,
 )
-async def resend_invite(
+def resend_invite(
     email: EmailStr,
     user_service: UserService = Depends(initiate_anonymous_user_service),
 ):
     """Sends an email to the user on how to access their account again."""
 
-    result = user_service.get_user_by_email(email)
+    result = user_service.resend_invite(email)
     if result.success:
-        await mail_funcs.send_how_to_change_password_email(email)  # type: ignore
+        notify_email_outbox()
 
     return handle_result(success_service_result("Check your email."))  # type: ignore
 
@@ -175,7 +182,7 @@ def read_users(
     user_service: UserService = Depends(initiate_user_service),
 ):
     result = user_service.get_users(skip=common.skip, limit=common.limit)
-    return handle_result(result, schemas.ManyUsersInDB)  # type: ignore
+    return handle_json_result(result, schemas.ManyUsersInDB)  # type: ignore
 
 
 @router.get(
@@ -187,32 +194,123 @@ def read_user(
     user_service: UserService = Depends(initiate_user_service),
 ):
     result = user_service.get_user_by_id(id=user_id)
-    return handle_result(result, schemas.UserOut)  # type: ignore
+    return handle_json_result(result, schemas.UserOut)  # type: ignore
+
+
+# * Served from the closest derivative, see `src.files.derivatives`.
+PHOTO_SIZE_QUERY = Query(
+    None, ge=1, le=4096, description="The width of the square photo wanted, in px."
+)
+
+
+def select_photo_variant(
+    request: Request,
+    photo_file: FileObjectOut,
+    size: Optional[int],
+    user_service: UserService,
+) -> Tuple[FileObjectOut, Dict[str, str]]:
+    """The photo to send for the requested size, and the headers the choice adds."""
+
+    if size is None:
+        return photo_file, {}
+
+    return (
+        user_service.file_service.select_image_variant(
+            photo_file, size=size, accept=request.headers.get("accept")
+        ),
+        {"Vary": "Accept"},
+    )
+
+
+@router.get("/photos/{photo_file_id}", response_class=StreamingResponse)
+def download_photo(
+    request: Request,
+    photo_file_id: UUID,
+    size: Optional[int] = PHOTO_SIZE_QUERY,
+    user_service: UserService = Depends(initiate_user_service),
+):
+    """
+    Streams one version of a user's photo, as linked by `ProfileOut.photo_url`.
+    A new photo gets a new URL, so the response can be cached forever.
+
+    The original sent in place of a `size` not rendered yet is revalidated
+    instead, so the resized copy is picked up once it exists.
+    """
+
+    original_file: FileObjectOut = handle_result(
+        user_service.get_photo(photo_file_id=photo_file_id), FileObjectOut
+    )
+    photo_file, headers = select_photo_variant(
+        request, original_file, size, user_service
+    )
+    is_final_variant = size is None or photo_file.id != original_file.id
+    return make_file_delivery_response(
+        request,
+        photo_file,
+        user_service.file_service,
+        cache_control=IMMUTABLE_CACHE_CONTROL
+        if is_final_variant
+        else REVALIDATE_CACHE_CONTROL,
+        extra_headers=headers,
+    )
 
 
 @router.get(
     "/{user_id}/download-photo",
-    response_class=FileResponse,
+    response_class=StreamingResponse,
 )
 def download_user_photo(
+    request: Request,
     user_id: UUID,
+    size: Optional[int] = PHOTO_SIZE_QUERY,
     user_service: UserService = Depends(initiate_user_service),
 ):
-    result = user_service.download_user_photo(user_id=user_id)
-    buffer: BytesIO = result.data[0]
-    file_object: FileObjectOut = result.data[1]
+    """
+    Streams the user's photo, a single `Range` is answered with 206 Partial Content.
+    Depending on `FILE_DELIVERY_MODE` a presigned URL is redirected to or returned instead.
 
-    delete_immediately = False
+    With `size` a resized copy without metadata is sent, as WebP or AVIF when
+    the `Accept` header allows it. The original is sent until it is rendered.
+    """
 
-    with NamedTemporaryFile(
-        mode="w+b", suffix=file_object.extension, delete=delete_immediately
-    ) as file_out:
-        file_out.write(buffer.read())
-        return FileResponse(
-            file_out.name,
-            media_type=file_object.mime_type,
-            headers={"Cache-Control": "max-age=0"},
-        )
+    photo_file: FileObjectOut = handle_result(
+        user_service.get_user_photo(user_id=user_id), FileObjectOut
+    )
+    photo_file, headers = select_photo_variant(request, photo_file, size, user_service)
+    return make_file_delivery_response(
+        request, photo_file, user_service.file_service, extra_headers=headers
+    )
+
+
+@router.head("/{user_id}/download-photo", response_class=Response)
+def download_user_photo_headers(
+    request: Request,
+    user_id: UUID,
+    size: Optional[int] = PHOTO_SIZE_QUERY,
+    user_service: UserService = Depends(initiate_user_service),
+):
+    photo_file: FileObjectOut = handle_result(
+        user_service.get_user_photo(user_id=user_id), FileObjectOut
+    )
+    photo_file, headers = select_photo_variant(request, photo_file, size, user_service)
+    return make_file_response(
+        request, photo_file, user_service.file_service, extra_headers=headers
+    )
+
+
+@router.delete(
+    "/{user_id}/files",
+    response_model=AppResponseModel,
+    dependencies=[Depends(user_must_be_admin)],
+)
+def delete_user_files(
+    user_id: UUID,
+    user_service: UserService = Depends(initiate_user_service),
+):
+    """Deletes every file of the user, the photo included, for when the user leaves the platform. The integer returned is the number of files deleted."""
+
+    result = user_service.delete_user_files(user_id)
+    return handle_result(result)  # type: ignore
 
 
 @router.put("/{user_id}/upload-photo", response_model=schemas.ProfileOut)
@@ -230,3 +328,31 @@ def upload_user_photo(
         file_name=file_to_upload.filename,
     )
     return handle_result(result, schemas.ProfileOut)  # type: ignore
+
+
+@router.post("/{user_id}/upload-photo/initiate", response_model=DirectUploadOut)
+def initiate_user_photo_upload(
+    data: DirectUploadInitiate,
+    user_id: UUID,
+    user_service: UserService = Depends(initiate_user_service),
+):
+    """Returns a short-lived URL to PUT the photo to, straight to the storage. Call finalize once it is uploaded."""
+
+    result = user_service.initiate_user_photo_upload(
+        user_id=user_id, file_name=data.file_name
+    )
+    return handle_result(result, DirectUploadOut)  # type: ignore
+
+
+@router.post("/{user_id}/upload-photo/finalize", response_model=schemas.ProfileOut)
+def finalize_user_photo_upload(
+    data: DirectUploadFinalize,
+    user_id: UUID,
+    user_service: UserService = Depends(initiate_user_service),
+):
+    """Checks the size and type of the uploaded photo and makes it the user's photo."""
+
+    result = user_service.finalize_user_photo_upload(
+        user_id=user_id, object_name=data.object_name, file_name=data.file_name
+    )
+    return handle_result(result, schemas.ProfileOut)  # type: ignore
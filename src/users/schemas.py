@@ -3,7 +3,7 @@
 from datetime import datetime
 from typing import Optional
 from uuid import UUID
-from pydantic import BaseModel, constr, EmailStr
+from pydantic import BaseModel, constr, EmailStr, validator
 from src.schemas import ParentPydanticModel
 
 from src.files.schemas import MiniFileObjectOut
@@ -64,6 +64,16 @@ class ProfileOut(ProfileBase):
     # id: UUID
     photo_file: Optional[MiniFileObjectOut]
 
+    # * Points to this version of the photo only, so it can be cached forever.
+    photo_url: Optional[str]
+
+    @validator("photo_url", always=True)
+    def make_photo_url(cls, value, values):
+        photo_file = values.get("photo_file")
+        if photo_file is None:
+            return None
+        return f"/users/photos/{photo_file.id}"
+
 
 class MiniRoleOut(ParentPydanticModel):
     title: str
@@ -1,9 +1,8 @@
 import datetime
 from datetime import timedelta
-from io import BufferedReader, BytesIO
+from io import BytesIO
 from typing import Any, BinaryIO, Tuple, Union
 from uuid import UUID
-from filetype.helpers import is_image
 
 from sqlalchemy.orm import Session
 
@@ -15,7 +14,6 @@ from src.exceptions import (
     GeneralException,
     BaseNotFoundException,
 )
-from src.files.utils import meet_upload_file_limit_rule
 from src.security import decode_token, get_password_hash
 from src.service import (
     BaseService,
@@ -25,6 +23,7 @@ from src.service import (
     success_service_result,
 )
 
+from src import mail
 from src.users import schemas
 from src.users.crud.users import UserCRUD
 from src.users.exceptions import DuplicateUserException, UserNotFoundException
@@ -33,7 +32,7 @@ from src.users.models import Profile, Roles, User
 from src.users.schemas import ProfileOut
 
 from src.files.service import FileService
-from src.files.schemas import FileObjectOut
+from src.files.schemas import DirectUploadOut, FileObjectOut
 
 
 class UserService(BaseService):
@@ -128,6 +127,15 @@ class UserService(BaseService):
                         )
                     )
 
+            # * Users created with the admin signup token are not sent an email.
+            if not should_make_active:
+                mail.queue_new_account_info(
+                    self.db,
+                    user.email,
+                    password=user.password,
+                    owner_name=f"{self.requesting_user.profile.last_name} {self.requesting_user.profile.first_name}",
+                )
+
             created_user = self.users_crud.create_user(
                 user, should_make_active, user.is_super_admin
             )
@@ -144,7 +152,9 @@ class UserService(BaseService):
             db_users = self.users_crud.get_users(skip=skip, limit=limit)
             total_db_users = self.users_crud.get_total_users()
 
-            users_data = {"total": total_db_users, "data": db_users}
+            users_data = schemas.ManyUsersInDB.parse_obj(
+                {"total": total_db_users, "data": db_users}
+            )
             return ServiceResult(data=users_data, success=True)
         except Exception as raised_exception:
             self.logger.exception(raised_exception)
@@ -181,6 +191,15 @@ class UserService(BaseService):
             self.logger.exception(raised_exception)
             return failed_service_result(raised_exception)
 
+    def resend_invite(self, email: str) -> ServiceResult[Union[User, None]]:
+        """Queues an email to the user on how to access their account again."""
+
+        result = self.get_user_by_email(email)
+        if result.success:
+            mail.queue_how_to_change_password_email(self.db, result.data.email)
+            self.db.commit()
+        return result
+
     def create_request_password(self, email: str) -> ServiceResult[Union[str, None]]:
         try:
             result = self.get_user_by_email(email)
@@ -198,6 +217,12 @@ class UserService(BaseService):
                     self.app_settings.secret_key_for_tokens,
                     algorithm=self.app_settings.algorithm,
                 )
+                mail.queue_change_password_request_mail(
+                    self.db,
+                    result.data.email,
+                    subject="Password Change Request",
+                    reset_token=encoded_jwt,
+                )
                 self.update_user_last_password_token(result.data.id, encoded_jwt)
                 return success_service_result(encoded_jwt)
             return result
@@ -264,6 +289,7 @@ class UserService(BaseService):
             )
 
         try:
+            mail.queue_password_changed_mail(self.db, get_user_result.data.email)
             updated_user = self.users_crud.update_user_password(
                 user_id, get_password_hash(new_password)
             )
@@ -296,51 +322,153 @@ class UserService(BaseService):
 
         user: User = get_user_result.data
 
-        if not is_image(file_to_upload):
+        upload_stream = self.file_service.open_upload_stream(
+            file_to_upload, file_size_limit=self.app_settings.user_file_to_upload_limit
+        )
+        if not upload_stream.is_image:
+            file_to_upload.close()
             return failed_service_result(
                 GeneralException("Only images are allowed to be uploaded.")
             )
 
         upload_result = self.file_service.upload_file(
-            file_to_upload=file_to_upload,
+            file_to_upload=upload_stream,
             user_id=user_id,
             file_name=file_name,
-            file_size_limit=self.app_settings.user_file_to_upload_limit,
         )
 
         if not upload_result.success:
             file_to_upload.close()
             return failed_service_result(upload_result.exception)
 
+        return success_service_result(
+            self._replace_user_photo(user, upload_result.data)
+        )
+
+    def _replace_user_photo(self, user: User, file_object: FileObjectOut) -> ProfileOut:
         if user.profile.photo_file_id:
             self.file_service.delete_file(user.id, user.profile.photo_file_id)
 
-        file_object: FileObjectOut = upload_result.data
-
         profile = self.users_crud.update_user_profile_photo(
-            user_id=user_id, file_object_id=file_object.id
+            user_id=user.id, file_object_id=file_object.id
         )
 
-        return success_service_result(ProfileOut.parse_obj(profile.__dict__))
+        if self.app_settings.image_derivatives:
+            self.file_service.schedule_image_derivatives(file_object.id)
 
-    def download_user_photo(
+        return ProfileOut.parse_obj(profile.__dict__)
+
+    def delete_user_files(self, user_id: UUID) -> ServiceResult[Union[int, Exception]]:
+        """Deletes all the files of the user, the profile photo goes with them."""
+
+        get_user_result = self.get_user_by_id(user_id)
+        if not get_user_result.success:
+            return failed_service_result(
+                BaseNotFoundException("The user does not exist.")
+            )
+
+        return self.file_service.delete_user_files(user_id)
+
+    def initiate_user_photo_upload(
+        self, user_id: UUID, file_name: str
+    ) -> ServiceResult[Union[DirectUploadOut, Exception]]:
+        """Returns a presigned URL the photo can be PUT to, straight to the storage."""
+
+        if (
+            self.requesting_user.id != user_id
+            and not self.requesting_user.is_super_admin
+        ):
+            return failed_service_result(
+                BaseForbiddenException("You are not allowed to perform this request.")
+            )
+
+        get_user_result = self.get_user_by_id(user_id)
+        if not get_user_result.success:
+            return failed_service_result(
+                BaseNotFoundException("The user does not exist.")
+            )
+
+        return self.file_service.initiate_direct_upload(user_id, file_name)
+
+    def finalize_user_photo_upload(
+        self, user_id: UUID, object_name: str, file_name: str
+    ) -> ServiceResult[Union[ProfileOut, Exception]]:
+        """Makes a photo uploaded with `initiate_user_photo_upload` the user's photo."""
+
+        if (
+            self.requesting_user.id != user_id
+            and not self.requesting_user.is_super_admin
+        ):
+            return failed_service_result(
+                BaseForbiddenException("You are not allowed to perform this request.")
+            )
+
+        get_user_result = self.get_user_by_id(user_id)
+        if not get_user_result.success:
+            return failed_service_result(
+                BaseNotFoundException("The user does not exist.")
+            )
+
+        finalize_result = self.file_service.finalize_direct_upload(
+            user_id=user_id,
+            object_name=object_name,
+            file_name=file_name,
+            file_size_limit=self.app_settings.user_file_to_upload_limit,
+            images_only=True,
+        )
+        if not finalize_result.success:
+            return failed_service_result(finalize_result.exception)
+
+        return success_service_result(
+            self._replace_user_photo(get_user_result.data, finalize_result.data)
+        )
+
+    def get_user_photo(
         self, user_id: UUID
-    ) -> ServiceResult[Union[Tuple[BytesIO, FileObjectOut], Exception]]:
+    ) -> ServiceResult[Union[FileObjectOut, Exception]]:
+        """Returns the record of the user's photo, the file itself is not read."""
 
         result = self.get_user_by_id(user_id)
         if not result.success:
             return failed_service_result(result.exception)
 
         profile: Profile = result.data.profile
+        if profile.photo_file is None:
+            return failed_service_result(
+                BaseNotFoundException("The user does not have a photo.")
+            )
 
-        buffer_result = self.file_service.download_file(profile.photo_file.id)
-        if not buffer_result.success:
-            return failed_service_result(buffer_result.exception)
-
-        buffer: BufferedReader = buffer_result.data
         return success_service_result(
-            (
-                BytesIO(buffer.read()),
-                FileObjectOut.parse_obj(profile.photo_file.__dict__),
+            FileObjectOut.parse_obj(profile.photo_file.__dict__)
+        )
+
+    def get_photo(
+        self, photo_file_id: UUID
+    ) -> ServiceResult[Union[FileObjectOut, Exception]]:
+        """Returns the record of a file that is some user's photo, other files can not be read this way."""
+
+        profile = self.users_crud.get_profile_by_photo(photo_file_id)
+        if profile is None:
+            return failed_service_result(
+                BaseNotFoundException("The photo does not exist.")
             )
+
+        return success_service_result(
+            FileObjectOut.parse_obj(profile.photo_file.__dict__)
         )
+
+    def download_user_photo(
+        self, user_id: UUID
+    ) -> ServiceResult[Union[Tuple[BytesIO, FileObjectOut], Exception]]:
+
+        photo_result = self.get_user_photo(user_id)
+        if not photo_result.success:
+            return failed_service_result(photo_result.exception)
+
+        photo_file: FileObjectOut = photo_result.data
+
+        buffer_result = self.file_service.download_file(photo_file.id)
+        if not buffer_result.success:
+            return failed_service_result(buffer_result.exception)
+
+        return success_service_result((buffer_result.data, photo_file))
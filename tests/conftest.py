@@ -1,3 +1,5 @@
+from typing import Callable, List
+
 import pytest
 from src.config import Settings
 from sqlalchemy.orm import Session
@@ -39,3 +41,47 @@ def test_db():
     finally:
         db.close()
         close_db_connections()
+
+
+# * The lines reported by the micro-benchmarks, shown at the end of the run.
+benchmark_results_key = pytest.StashKey[List[str]]()
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        help="Also run the micro-benchmarks and report their numbers.",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "benchmark: a micro-benchmark, only run with --benchmark"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    # * Timings depend on the machine and its load, so they stay out of the default run.
+    if config.getoption("--benchmark"):
+        return
+
+    skip_benchmark = pytest.mark.skip(reason="Micro-benchmarks run with --benchmark.")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
+
+
+@pytest.fixture()
+def benchmark_report(request) -> Callable[[str], None]:
+    """Adds a line to the benchmark numbers reported at the end of the run."""
+
+    return request.config.stash.setdefault(benchmark_results_key, []).append
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.stash.get(benchmark_results_key, [])
+    if results:
+        terminalreporter.section("benchmarks")
+        for result in results:
+            terminalreporter.write_line(result)
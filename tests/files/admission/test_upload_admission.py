@@ -0,0 +1,94 @@
+import asyncio
+
+import anyio
+
+from src.files.admission import UploadAdmission, UploadAdmissionMiddleware
+from src.middleware import make_body_limit
+
+
+def test_uploads_over_the_caps_wait_in_line():
+    async def run():
+        admission = UploadAdmission(max_uploads=2, max_bytes=100, max_wait_seconds=1)
+        assert await admission.acquire(40)
+        assert await admission.acquire(40)
+
+        # * over the count, then over the bytes
+        third = asyncio.ensure_future(admission.acquire(10))
+        fourth = asyncio.ensure_future(admission.acquire(60))
+        await asyncio.sleep(0)
+        assert admission.stats()["waiting"] == 2
+
+        admission.release(40)
+        assert await third
+        await asyncio.sleep(0)
+        assert not fourth.done()
+
+        admission.release(40)
+        assert await fourth
+        assert admission.stats()["in_flight"] == 2
+        assert admission.stats()["bytes_in_flight"] == 70
+
+        # * one larger than every byte allowed gets in once nothing else is in flight
+        admission.release(10)
+        admission.release(60)
+        assert await admission.acquire(1000)
+        admission.release(1000)
+
+        stats = admission.stats()
+        assert stats["admitted"] == 5
+        assert stats["rejected"] == 0
+        assert stats["in_flight"] == stats["bytes_in_flight"] == stats["waiting"] == 0
+
+    anyio.run(run)
+
+
+def test_uploads_are_refused_after_the_wait():
+    async def run():
+        admission = UploadAdmission(max_uploads=1, max_bytes=100, max_wait_seconds=0.01)
+        assert await admission.acquire(10)
+        assert not await admission.acquire(10)
+        assert admission.stats()["rejected"] == 1
+        assert admission.stats()["waiting"] == 0
+
+        admission.release(10)
+        assert await admission.acquire(10)
+
+    anyio.run(run)
+
+
+def test_middleware_answers_503_with_retry_after():
+    messages = []
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        admission = UploadAdmission(max_uploads=1, max_bytes=100, max_wait_seconds=0.01)
+        middleware = UploadAdmissionMiddleware(
+            app, admission, [make_body_limit("PATCH", "/files/uploads/[^/]+", 50)]
+        )
+        scope = {
+            "type": "http",
+            "method": "PATCH",
+            "path": "/files/uploads/some-id",
+            "headers": [(b"content-length", b"20")],
+        }
+
+        await middleware(scope, None, send)
+        assert admission.stats()["admitted"] == 1
+        assert admission.stats()["in_flight"] == 0
+
+        # * the one slot is taken, other routes are not held
+        assert await admission.acquire(20)
+        await middleware({**scope, "method": "GET"}, None, send)
+        await middleware(scope, None, send)
+
+    anyio.run(run)
+
+    assert calls == ["/files/uploads/some-id"] * 2
+    assert messages[0]["status"] == 503
+    assert (b"retry-after", b"1") in messages[0]["headers"]
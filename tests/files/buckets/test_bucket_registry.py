@@ -0,0 +1,34 @@
+from uuid import uuid4
+
+from src.files.buckets import BucketRegistry
+
+
+def test_bucket_ids_are_remembered_per_owner():
+    registry = BucketRegistry(max_owners=2)
+    owners = [uuid4() for _ in range(0, 3)]
+    bucket_ids = [uuid4() for _ in range(0, 3)]
+
+    assert registry.get_bucket_id(owners[0]) is None
+    registry.set_bucket_id(owners[0], bucket_ids[0])
+    registry.set_bucket_id(owners[1], bucket_ids[1])
+    assert registry.get_bucket_id(owners[0]) == bucket_ids[0]
+    assert registry.get_bucket_id(str(owners[0])) == bucket_ids[0]
+
+    # * owners[1] was the least recently used.
+    registry.set_bucket_id(owners[2], bucket_ids[2])
+    assert registry.get_bucket_id(owners[1]) is None
+    assert registry.get_bucket_id(owners[0]) == bucket_ids[0]
+
+    registry.forget_owner(owners[0])
+    assert registry.get_bucket_id(owners[0]) is None
+
+
+def test_storage_buckets():
+    registry = BucketRegistry()
+
+    assert not registry.has_storage_bucket("regnify-files")
+    registry.add_storage_bucket("regnify-files")
+    assert registry.has_storage_bucket("regnify-files")
+
+    registry.forget_storage_bucket("regnify-files")
+    assert not registry.has_storage_bucket("regnify-files")
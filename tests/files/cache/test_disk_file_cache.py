@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+
+import pytest
+
+from src.config import Settings
+from src.files import disk_cache
+from src.files.disk_cache import INCOMING_DIRECTORY, DiskFileCache
+from src.files.storage import BackendStorage
+from src.files.utils import ONE_MEGA_BYTE, S3FileData
+
+BUCKET_NAME = "cached-bucket"
+
+
+class Storage:
+    """Counts the fetches the cache makes."""
+
+    def __init__(self, objects: dict) -> None:
+        self.objects = objects
+        self.fetches = 0
+        self.lock = threading.Lock()
+
+    def open(self, cache: DiskFileCache, file_name: str):
+        def fill(cached_file):
+            with self.lock:
+                self.fetches += 1
+            time.sleep(0.05)
+            cached_file.write(self.objects[file_name])
+
+        return cache.open(
+            BUCKET_NAME,
+            file_name,
+            get_size=lambda: len(self.objects[file_name]),
+            fill=fill,
+        )
+
+    def read(self, cache: DiskFileCache, file_name: str):
+        cached_file = self.open(cache, file_name)
+        if cached_file is None:
+            return None
+        with cached_file:
+            return cached_file.read()
+
+
+def test_read_through(tmp_path):
+    cache = DiskFileCache(str(tmp_path), max_bytes=1000, max_file_bytes=500)
+    storage = Storage({"a": b"a" * 100, "large": b"l" * 600})
+
+    assert storage.read(cache, "a") == b"a" * 100
+    assert storage.read(cache, "a") == b"a" * 100
+    assert storage.fetches == 1
+
+    assert storage.read(cache, "large") is None
+    assert storage.fetches == 1
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["bypasses"] == 1
+    assert stats["hit_ratio"] == 0.5
+    assert stats["bytes_saved"] == 100
+
+    cache.remove(BUCKET_NAME, "a")
+    assert cache.stats()["total_bytes"] == 0
+    assert storage.read(cache, "a") == b"a" * 100
+    assert storage.fetches == 2
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = DiskFileCache(str(tmp_path), max_bytes=250, max_file_bytes=250)
+    storage = Storage({name: name.encode() * 100 for name in "abc"})
+
+    storage.read(cache, "a")
+    storage.read(cache, "b")
+    storage.read(cache, "a")
+    storage.read(cache, "c")
+
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["total_bytes"] == 200
+
+    storage.read(cache, "a")
+    assert storage.fetches == 3
+    storage.read(cache, "b")
+    assert storage.fetches == 4
+
+
+def test_concurrent_misses_fetch_once(tmp_path):
+    cache = DiskFileCache(str(tmp_path), max_bytes=1000, max_file_bytes=1000)
+    storage = Storage({"a": b"a" * 100})
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(storage.read(cache, "a")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [b"a" * 100] * 8
+    assert storage.fetches == 1
+
+
+def test_failed_fill_leaves_nothing_behind(tmp_path):
+    cache = DiskFileCache(str(tmp_path), max_bytes=1000, max_file_bytes=1000)
+
+    def fill(cached_file):
+        cached_file.write(b"partial")
+        raise ConnectionError("connection reset")
+
+    with pytest.raises(ConnectionError):
+        cache.open(BUCKET_NAME, "a", get_size=lambda: 100, fill=fill)
+
+    assert cache.stats()["fill_errors"] == 1
+    assert cache.stats()["entries"] == 0
+    assert os.listdir(os.path.join(tmp_path, INCOMING_DIRECTORY)) == []
+
+
+def test_failed_move_closes_the_filled_file(tmp_path, monkeypatch):
+    cache = DiskFileCache(str(tmp_path), max_bytes=1000, max_file_bytes=1000)
+    opened_files = []
+
+    def open_recorded(*args, **kwargs):
+        opened_file = open(*args, **kwargs)
+        opened_files.append(opened_file)
+        return opened_file
+
+    def replace(*args):
+        raise OSError("no space left on device")
+
+    monkeypatch.setattr(disk_cache, "open", open_recorded, raising=False)
+    monkeypatch.setattr(disk_cache.os, "replace", replace)
+    with pytest.raises(OSError):
+        Storage({"a": b"a" * 100}).read(cache, "a")
+
+    assert len(opened_files) == 1
+    assert opened_files[0].closed
+    assert cache.stats()["fill_errors"] == 1
+
+
+def test_large_files_bypass_the_cache_without_asking_the_storage(tmp_path):
+    backend_storage = BackendStorage(
+        Settings(
+            minio_host="cache-host:9000",
+            minio_access_key="access-key",
+            minio_secret_key="secret-key",
+            file_cache_path=str(tmp_path),
+            file_cache_max_file_mb=1,
+        )
+    )
+
+    def get_file_info(*args):
+        raise AssertionError("the size of the file is known")
+
+    backend_storage.client.get_file_info = get_file_info  # type: ignore
+    s3_file_data = S3FileData(
+        "large.bin", "large.bin", BUCKET_NAME, total_bytes=2 * ONE_MEGA_BYTE
+    )
+    assert backend_storage._open_cached_file(s3_file_data) is None
+    assert backend_storage.file_cache.stats()["bypasses"] == 1  # type: ignore
+
+
+def test_entries_survive_a_restart(tmp_path):
+    storage = Storage({"a": b"a" * 100})
+    storage.read(DiskFileCache(str(tmp_path), 1000, 1000), "a")
+
+    cache = DiskFileCache(str(tmp_path), 1000, 1000)
+    assert cache.stats()["total_bytes"] == 100
+    assert storage.read(cache, "a") == b"a" * 100
+    assert storage.fetches == 1
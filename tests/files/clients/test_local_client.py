@@ -0,0 +1,234 @@
+import os
+from datetime import timedelta
+from io import BytesIO
+
+import anyio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.config import Settings
+from src.exceptions import (
+    BaseNotFoundException,
+    FileTooLargeException,
+    GeneralException,
+)
+from src.files.clients.local_client import INCOMING_DIRECTORY, LocalStorageClient
+from src.files.pipeline import UploadStream
+from src.files.responses import LocalFileResponse
+
+BUCKET_NAME = "local-bucket"
+CONTENT = bytes(range(256)) * 1000
+
+
+@pytest.fixture()
+def local_client(tmp_path) -> LocalStorageClient:
+    client = LocalStorageClient(Settings(local_storage_path=str(tmp_path)))
+    client.make_bucket(BUCKET_NAME)
+    return client
+
+
+def upload(client: LocalStorageClient, file_name: str, content: bytes = CONTENT):
+    return client.upload_file(
+        UploadStream(BytesIO(content), max_bytes=len(content)),
+        BUCKET_NAME,
+        file_name,
+        "application/octet-stream",
+    )
+
+
+def test_upload_and_read_back(local_client: LocalStorageClient):
+    assert local_client.bucket_exists(BUCKET_NAME)
+    assert not local_client.bucket_exists("missing-bucket")
+    with pytest.raises(GeneralException):
+        local_client.make_bucket(BUCKET_NAME)
+
+    assert upload(local_client, "owner/file.bin") == len(CONTENT)
+
+    assert local_client.download_file(BUCKET_NAME, "owner/file.bin").read() == CONTENT
+    assert b"".join(local_client.open_file_stream(BUCKET_NAME, "owner/file.bin")) == (
+        CONTENT
+    )
+    assert b"".join(
+        local_client.open_file_stream(
+            BUCKET_NAME, "owner/file.bin", offset=1000, length=70_000, chunk_size=4096
+        )
+    ) == (CONTENT[1000:71_000])
+
+    file_info = local_client.get_file_info(BUCKET_NAME, "owner/file.bin")
+    assert file_info.total_bytes == len(CONTENT)
+    assert file_info.content_type == "application/octet-stream"
+
+    file_path = local_client.get_file_path(BUCKET_NAME, "owner/file.bin")
+    assert os.path.dirname(os.path.dirname(os.path.dirname(file_path))) == (
+        os.path.join(local_client.root, BUCKET_NAME)
+    )
+
+    local_client.remove_file_object(BUCKET_NAME, "owner/file.bin")
+    with pytest.raises(BaseNotFoundException):
+        local_client.get_file_info(BUCKET_NAME, "owner/file.bin")
+    with pytest.raises(BaseNotFoundException):
+        local_client.open_file_stream(BUCKET_NAME, "owner/file.bin")
+
+
+def test_failed_upload_leaves_nothing_behind(local_client: LocalStorageClient):
+    with pytest.raises(FileTooLargeException):
+        local_client.upload_file(
+            UploadStream(BytesIO(CONTENT), max_bytes=1000),
+            BUCKET_NAME,
+            "too-large.bin",
+            "application/octet-stream",
+        )
+
+    assert os.listdir(os.path.join(local_client.root, INCOMING_DIRECTORY)) == []
+    with pytest.raises(BaseNotFoundException):
+        local_client.get_file_info(BUCKET_NAME, "too-large.bin")
+
+
+def test_bucket_names_can_not_escape_the_root(local_client: LocalStorageClient):
+    with pytest.raises(GeneralException):
+        local_client.make_bucket("../outside")
+
+    with pytest.raises(GeneralException):
+        local_client.presigned_download_url(
+            BUCKET_NAME, "file.bin", timedelta(minutes=1)
+        )
+
+
+def test_local_file_response(local_client: LocalStorageClient):
+    upload(local_client, "served.bin")
+    file_path = local_client.get_file_path(BUCKET_NAME, "served.bin")
+
+    app = FastAPI()
+
+    @app.get("/whole")
+    def whole():
+        return LocalFileResponse(file_path, 0, len(CONTENT))
+
+    @app.get("/part")
+    def part():
+        return LocalFileResponse(
+            file_path,
+            100,
+            200_000,
+            status_code=206,
+            headers={"Content-Length": "200000"},
+        )
+
+    client = TestClient(app)
+    assert client.get("/whole").content == CONTENT
+
+    response = client.get("/part")
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:200_100]
+
+
+def test_local_file_response_uses_zero_copy_send(local_client: LocalStorageClient):
+    upload(local_client, "sent.bin")
+    file_path = local_client.get_file_path(BUCKET_NAME, "sent.bin")
+    messages = []
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            message["file"].seek(message["offset"])
+            message["body"] = message["file"].read(message["count"])
+        messages.append(message)
+
+    scope = {"type": "http", "extensions": {"http.response.zerocopysend": {}}}
+    anyio.run(LocalFileResponse(file_path, 10, 20), scope, None, send)
+
+    assert [message["type"] for message in messages] == [
+        "http.response.start",
+        "http.response.zerocopysend",
+    ]
+    assert messages[1]["body"] == CONTENT[10:30]
+
+
+def test_remove_many_files_and_the_bucket(local_client: LocalStorageClient):
+    for index in range(0, 3):
+        upload(local_client, f"owner/file-{index}.bin")
+
+    # * the bucket can only go once it is empty
+    with pytest.raises(GeneralException):
+        local_client.remove_bucket(BUCKET_NAME)
+
+    assert (
+        local_client.remove_file_objects(
+            BUCKET_NAME, [f"owner/file-{index}.bin" for index in range(0, 3)]
+        )
+        == []
+    )
+    local_client.remove_bucket(BUCKET_NAME)
+    assert not local_client.bucket_exists(BUCKET_NAME)
+
+
+def test_list_file_objects_in_pages(local_client: LocalStorageClient):
+    file_names = {f"owner/listed-{index}.bin" for index in range(0, 5)}
+    for file_name in file_names:
+        upload(local_client, file_name)
+
+    listed_names = []
+    marker = None
+    pages = 0
+    while True:
+        stored_objects, marker = local_client.list_file_objects(BUCKET_NAME, marker, 2)
+        listed_names.extend(stored_object.name for stored_object in stored_objects)
+        pages += 1
+        assert all(
+            stored_object.total_bytes == len(CONTENT)
+            for stored_object in stored_objects
+        )
+        if marker is None:
+            break
+
+    assert pages == 3
+    assert sorted(listed_names) == sorted(file_names)
+    assert local_client.list_file_objects("missing-bucket", None, 2) == ([], None)
+
+
+def test_multipart_upload(local_client: LocalStorageClient):
+    upload_id = local_client.create_multipart_upload(
+        BUCKET_NAME, "owner/joined.bin", "image/png"
+    )
+    # * parts can arrive in any order, and a part sent again replaces the first one
+    parts = [
+        (
+            2,
+            local_client.upload_part(
+                BUCKET_NAME, "owner/joined.bin", upload_id, 2, CONTENT[100:]
+            ),
+        ),
+        (
+            1,
+            local_client.upload_part(
+                BUCKET_NAME, "owner/joined.bin", upload_id, 1, b"x" * 100
+            ),
+        ),
+        (
+            1,
+            local_client.upload_part(
+                BUCKET_NAME, "owner/joined.bin", upload_id, 1, CONTENT[:100]
+            ),
+        ),
+    ]
+    local_client.complete_multipart_upload(
+        BUCKET_NAME, "owner/joined.bin", upload_id, sorted(dict(parts).items())
+    )
+
+    assert local_client.download_file(BUCKET_NAME, "owner/joined.bin").read() == CONTENT
+    file_info = local_client.get_file_info(BUCKET_NAME, "owner/joined.bin")
+    assert file_info.content_type == "image/png"
+    assert os.listdir(local_client.incoming) == []
+
+    upload_id = local_client.create_multipart_upload(
+        BUCKET_NAME, "owner/aborted.bin", "image/png"
+    )
+    local_client.upload_part(BUCKET_NAME, "owner/aborted.bin", upload_id, 1, CONTENT)
+    local_client.abort_multipart_upload(BUCKET_NAME, "owner/aborted.bin", upload_id)
+    assert os.listdir(local_client.incoming) == []
+    with pytest.raises(BaseNotFoundException):
+        local_client.upload_part(
+            BUCKET_NAME, "owner/aborted.bin", upload_id, 2, CONTENT
+        )
+    with pytest.raises(GeneralException):
+        local_client.abort_multipart_upload(BUCKET_NAME, "owner/aborted.bin", "../..")
@@ -0,0 +1,65 @@
+from src.config import Settings
+from src.files.clients.minio_client import MinioClient
+from src.files.storage import BackendStorage
+from src.files.utils import BackendStorageOption
+
+
+def test_backend_storages_share_the_client_of_their_storage(tmp_path):
+    settings = Settings(
+        backend_storage_option=BackendStorageOption.LOCAL_STORAGE.value,
+        local_storage_path=str(tmp_path / "one"),
+    )
+    assert BackendStorage(settings).client is BackendStorage(settings).client
+
+    other_settings = Settings(
+        backend_storage_option=BackendStorageOption.LOCAL_STORAGE.value,
+        local_storage_path=str(tmp_path / "two"),
+    )
+    assert BackendStorage(other_settings).client is not BackendStorage(settings).client
+
+
+def test_storages_configured_differently_get_their_own_client():
+    settings = Settings(
+        minio_host="localhost:9000",
+        minio_access_key="access-key",
+        minio_secret_key="secret-key",
+        storage_pool_size=4,
+    )
+    client = BackendStorage(settings).client
+    assert BackendStorage(settings.copy()).client is client
+
+    for changed_setting in [
+        {"minio_secret_key": "other-secret-key"},
+        {"secure_minio": not settings.secure_minio},
+        {"storage_pool_size": 8},
+        {"storage_connect_timeout_seconds": 1},
+        {"storage_read_timeout_seconds": 1},
+    ]:
+        other_settings = settings.copy(update=changed_setting)
+        assert BackendStorage(other_settings).client is not client
+
+
+def test_minio_pool_is_sized_for_the_threads_sharing_it():
+    settings = Settings(
+        minio_host="localhost:9000",
+        minio_access_key="access-key",
+        minio_secret_key="secret-key",
+        threadpool_size=40,
+        image_derivative_workers=2,
+        storage_connect_timeout_seconds=2,
+        storage_read_timeout_seconds=30,
+    )
+    client = MinioClient(settings)
+
+    assert client.pool_stats() == {
+        "max_size": 42,
+        "opened": 0,
+        "requests": 0,
+        "idle": 0,
+        "reused": 0,
+    }
+    timeout = client.http_client.connection_pool_kw["timeout"]
+    assert (timeout.connect_timeout, timeout.read_timeout) == (2, 30)
+
+    settings.storage_pool_size = 8
+    assert MinioClient(settings).pool_stats()["max_size"] == 8
@@ -52,6 +52,34 @@ def test_get_files(test_db):
     assert len(files) > 0
 
 
+def test_get_files_with_totals(test_db):
+    file_crud = FileCRUD(test_db)
+    owner_id = FILE_CRUD_CACHE["USER_ID"]
+
+    files, total, total_bytes = file_crud.get_files_with_totals(owner_id=owner_id)
+    assert len(files) == total == 1
+    assert total_bytes == 100
+
+    files, total, _ = file_crud.get_files_with_totals(
+        owner_id=owner_id, extension="jpg"
+    )
+    assert total == 1
+    files, total, _ = file_crud.get_files_with_totals(
+        owner_id=owner_id, mime_type="application/*"
+    )
+    assert total == 1
+    files, total, total_bytes = file_crud.get_files_with_totals(
+        owner_id=owner_id, mime_type="image/png"
+    )
+    assert (files, total, total_bytes) == ([], 0, 0)
+
+    # * the totals are still known past the last page
+    files, total, total_bytes = file_crud.get_files_with_totals(
+        owner_id=owner_id, skip=10
+    )
+    assert (files, total, total_bytes) == ([], 1, 100)
+
+
 def test_get_file(test_db):
     file_crud = FileCRUD(test_db)
 
@@ -115,3 +143,15 @@ def test_remove_files(test_db):
 
     db_bucket = file_crud.get_owner_bucket(FILE_CRUD_CACHE["USER_ID"])  # type: ignore
     assert isinstance(db_bucket, Bucket)
+
+
+def test_upsert_bucket(test_db):
+    file_crud = FileCRUD(test_db)
+
+    db_bucket = file_crud.get_owner_bucket(FILE_CRUD_CACHE["USER_ID"])  # type: ignore
+    assert isinstance(db_bucket, Bucket)
+
+    # * an existing bucket is returned, not created again
+    assert file_crud.upsert_bucket(FILE_CRUD_CACHE["USER_ID"]) == db_bucket.id
+    assert file_crud.upsert_bucket(FILE_CRUD_CACHE["USER_ID"]) == db_bucket.id
+    assert test_db.query(Bucket).filter(Bucket.name == db_bucket.name).count() == 1
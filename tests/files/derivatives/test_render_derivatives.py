@@ -0,0 +1,67 @@
+import io
+
+import pytest
+from PIL import Image
+
+from src.files.derivatives import (
+    IMAGE_DERIVATIVE_SIZES,
+    get_accepted_image_formats,
+    render_image_derivatives,
+)
+
+
+def make_image(size, mode="RGB", exif=None) -> bytes:
+    buffer = io.BytesIO()
+    image = Image.new(mode, size, "red")
+    if mode == "RGB":
+        image.save(buffer, format="JPEG", exif=exif or Image.Exif())
+    else:
+        image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_render_image_derivatives_strips_exif():
+    exif = Image.Exif()
+    exif[0x010F] = "Camera Maker"
+    # * Rotated by 90 degrees.
+    exif[0x0112] = 6
+
+    derivatives = render_image_derivatives(make_image((400, 320), exif=exif))
+
+    assert {derivative.size for derivative in derivatives} == set(
+        IMAGE_DERIVATIVE_SIZES
+    )
+    for derivative in derivatives:
+        image = Image.open(io.BytesIO(derivative.body))
+        assert image.size == (derivative.size, derivative.size)
+        assert image.format.lower() == derivative.format
+        assert "exif" not in image.info
+        assert not image.getexif()
+
+
+def test_render_image_derivatives_skips_sizes_larger_than_the_image():
+    derivatives = render_image_derivatives(make_image((100, 200)))
+
+    assert {derivative.size for derivative in derivatives} == {32, 64}
+    assert {derivative.format for derivative in derivatives} >= {"webp", "jpeg"}
+
+
+def test_render_image_derivatives_keeps_transparency():
+    derivatives = render_image_derivatives(make_image((64, 64), mode="RGBA"))
+
+    assert {derivative.format for derivative in derivatives} >= {"webp", "png"}
+    assert "jpeg" not in {derivative.format for derivative in derivatives}
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        ("image/avif,image/webp,image/apng,*/*;q=0.8", ["avif", "webp"]),
+        ("image/webp;q=0, image/png", []),
+        ("IMAGE/WEBP", ["webp"]),
+        ("*/*", []),
+        (None, []),
+    ],
+)
+def test_get_accepted_image_formats(accept, expected):
+    assert get_accepted_image_formats(accept) == expected
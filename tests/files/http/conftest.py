@@ -0,0 +1,7 @@
+from tests.users.http.conftest import (  # noqa: F401
+    client,
+    test_admin_user,
+    test_admin_user_headers,
+    test_non_admin_user,
+    test_non_admin_user_headers,
+)
@@ -0,0 +1,223 @@
+import time
+from typing import Callable
+
+import pytest
+from fastapi.testclient import TestClient
+from requests import Response
+
+from src.config import Settings
+from src.files.service import FileService
+from src.users.crud.users import UserCRUD
+from src.files.utils import hash_bytes, hash_file
+from tests.files.service.test_service_files import FILE_PATH_UNDER_TEST
+
+# * Requests timed per endpoint by the latency benchmark.
+LATENCY_RUNS = 20
+
+
+def upload_file(test_db, user_id, file_name: str):
+    file_service = FileService(
+        requesting_user=UserCRUD(test_db).get_user(user_id),  # type: ignore
+        db=test_db,
+        app_settings=Settings(),
+    )
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        result = file_service.upload_file(
+            file_to_upload=f, user_id=user_id, file_name=file_name
+        )
+    assert result.success, result.exception
+    return result.data
+
+
+def get_p95_ms(call: Callable[[], Response], expected_status: int = 200) -> float:
+    durations = []
+    for _ in range(0, LATENCY_RUNS):
+        started = time.perf_counter()
+        response = call()
+        durations.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == expected_status, response.content
+
+    durations.sort()
+    return durations[int(len(durations) * 0.95) - 1]
+
+
+def test_list_get_download_and_delete_files(
+    client: TestClient,
+    test_db,
+    test_admin_user: dict,
+    test_non_admin_user: dict,
+    test_non_admin_user_headers: dict,
+    test_admin_user_headers: dict,
+):
+    the_file = upload_file(test_db, test_non_admin_user["id"], "listed-file.jpg")
+
+    response = client.get("/files/", headers=test_non_admin_user_headers)
+    assert response.status_code == 200, response.json()
+    listing = response.json()
+    assert listing["total"] >= 1
+    assert listing["total_bytes"] >= the_file.total_bytes
+    assert str(the_file.id) in [item["id"] for item in listing["file_objects"]]
+
+    response = client.get(
+        "/files/?mime_type=image/*&extension=jpg", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 200, response.json()
+    assert all(
+        item["mime_type"].startswith("image/")
+        for item in response.json()["file_objects"]
+    )
+    response = client.get(
+        "/files/?mime_type=application/pdf", headers=test_non_admin_user_headers
+    )
+    assert response.json()["total"] == 0
+
+    response = client.get(f"/files/{the_file.id}", headers=test_non_admin_user_headers)
+    assert response.status_code == 200, response.json()
+    assert response.json()["original_file_name"] == "listed-file.jpg"
+
+    response = client.get(
+        f"/files/{the_file.id}/download", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 200, response.content
+    assert hash_bytes(response.content) == hash_file(FILE_PATH_UNDER_TEST)
+    assert "listed-file.jpg" in response.headers["content-disposition"]
+
+    # * someone else's file is not found, unless the one asking is an admin
+    other_file = upload_file(test_db, test_admin_user["id"], "not-yours.jpg")
+    response = client.get(
+        f"/files/{other_file.id}", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 404
+    response = client.delete(
+        f"/files/{other_file.id}", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 404
+    response = client.get(f"/files/{other_file.id}", headers=test_admin_user_headers)
+    assert response.status_code == 200, response.json()
+
+    response = client.delete(
+        f"/files/{the_file.id}", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 200, response.json()
+    response = client.get(f"/files/{the_file.id}", headers=test_non_admin_user_headers)
+    assert response.status_code == 404
+
+    response = client.delete(f"/files/{other_file.id}", headers=test_admin_user_headers)
+    assert response.status_code == 200, response.json()
+
+
+def test_resumable_upload(
+    client: TestClient,
+    test_non_admin_user_headers: dict,
+):
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        head = f.read()
+
+    response = client.post(
+        "/files/uploads",
+        json={"file_name": "resumed.jpg", "total_bytes": 1},
+        headers=test_non_admin_user_headers,
+    )
+    assert response.status_code == 200, response.json()
+    part_size = response.json()["part_size"]
+
+    # * two chunks, the last one shorter
+    content = head + b"\0" * (part_size + 1000 - len(head))
+    response = client.post(
+        "/files/uploads",
+        json={"file_name": "resumed.jpg", "total_bytes": len(content)},
+        headers=test_non_admin_user_headers,
+    )
+    assert response.status_code == 200, response.json()
+    upload_id = response.json()["id"]
+    assert response.json()["received_bytes"] == 0
+
+    def send_chunk(offset: int, data: bytes) -> Response:
+        return client.patch(
+            f"/files/uploads/{upload_id}",
+            content=data,
+            headers={**test_non_admin_user_headers, "Upload-Offset": str(offset)},
+        )
+
+    assert send_chunk(part_size, content[part_size:]).status_code == 409
+    assert send_chunk(0, content[:1000]).status_code == 400
+
+    response = send_chunk(0, content[:part_size])
+    assert response.status_code == 200, response.json()
+    assert response.json()["received_bytes"] == part_size
+
+    # * a chunk sent again is refused, the client resumes from `received_bytes`
+    assert send_chunk(0, content[:part_size]).status_code == 409
+    response = client.post(
+        f"/files/uploads/{upload_id}/finalize", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 409
+    response = client.get(
+        f"/files/uploads/{upload_id}", headers=test_non_admin_user_headers
+    )
+    assert response.json()["received_bytes"] == part_size
+
+    response = send_chunk(part_size, content[part_size:])
+    assert response.status_code == 200, response.json()
+    response = client.post(
+        f"/files/uploads/{upload_id}/finalize", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 200, response.json()
+    the_file = response.json()
+    assert the_file["mime_type"] == "image/jpeg"
+    assert the_file["total_bytes"] == len(content)
+
+    response = client.get(
+        f"/files/{the_file['id']}/download", headers=test_non_admin_user_headers
+    )
+    assert hash_bytes(response.content) == hash_bytes(content)
+    response = client.get(
+        f"/files/uploads/{upload_id}", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 404
+
+    # * a cancelled upload is gone
+    response = client.post(
+        "/files/uploads",
+        json={"file_name": "cancelled.jpg", "total_bytes": len(content)},
+        headers=test_non_admin_user_headers,
+    )
+    upload_id = response.json()["id"]
+    assert send_chunk(0, content[:part_size]).status_code == 200
+    response = client.delete(
+        f"/files/uploads/{upload_id}", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 200, response.json()
+    assert send_chunk(part_size, content[part_size:]).status_code == 404
+
+
+@pytest.mark.benchmark
+def test_files_endpoint_latency(
+    client: TestClient,
+    test_db,
+    test_non_admin_user: dict,
+    test_non_admin_user_headers: dict,
+    benchmark_report,
+):
+    the_file = upload_file(test_db, test_non_admin_user["id"], "timed-file.jpg")
+    headers = test_non_admin_user_headers
+
+    for endpoint in [
+        "/files/",
+        "/files/?mime_type=image/*",
+        f"/files/{the_file.id}",
+        f"/files/{the_file.id}/download",
+    ]:
+        p95 = get_p95_ms(lambda: client.get(endpoint, headers=headers))
+        benchmark_report(f"GET {endpoint}: p95 of {p95:.1f}ms")
+
+    file_ids = iter(
+        [
+            upload_file(test_db, test_non_admin_user["id"], f"timed-{index}.jpg").id
+            for index in range(0, LATENCY_RUNS)
+        ]
+    )
+    p95 = get_p95_ms(lambda: client.delete(f"/files/{next(file_ids)}", headers=headers))
+    benchmark_report(f"DELETE /files/{{file_id}}: p95 of {p95:.1f}ms")
+
+    client.delete(f"/files/{the_file.id}", headers=headers)
@@ -0,0 +1,105 @@
+import threading
+import time
+from io import BytesIO
+
+import pytest
+
+from src.exceptions import FileTooLargeException
+from src.files.multipart import MultipartUpload
+from src.files.pipeline import UploadStream
+
+PART_SIZE = 1000
+
+
+class InMemoryMultipartUpload(MultipartUpload):
+    def __init__(self, failures=None, **kw) -> None:
+        super().__init__(part_size=PART_SIZE, retry_backoff_seconds=0, **kw)
+        # * part number -> number of times it fails before it goes through
+        self.failures = dict(failures or {})
+        self.attempts = {}
+        self.parts = {}
+        self.stored = None
+        self.aborted = False
+        self.in_flight = 0
+        self.max_seen_in_flight = 0
+        self.lock = threading.Lock()
+
+    def put_object(self, data: bytes):
+        self.stored = data
+
+    def create(self) -> str:
+        return "upload-id"
+
+    def upload_part(self, upload_id: str, part_number: int, data: bytes) -> str:
+        with self.lock:
+            self.attempts[part_number] = self.attempts.get(part_number, 0) + 1
+            self.in_flight += 1
+            self.max_seen_in_flight = max(self.max_seen_in_flight, self.in_flight)
+        try:
+            time.sleep(0.01)
+            if self.failures.get(part_number, 0) >= self.attempts[part_number]:
+                raise ConnectionError("connection reset")
+            self.parts[part_number] = data
+            return f"etag-{part_number}"
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def complete(self, upload_id, parts):
+        assert [part_number for part_number, _ in parts] == sorted(self.parts)
+        self.stored = b"".join(self.parts[part_number] for part_number, _ in parts)
+
+    def abort(self, upload_id: str):
+        self.aborted = True
+
+
+def test_small_stream_is_sent_in_one_request():
+    upload = InMemoryMultipartUpload(max_in_flight=4)
+    upload.upload(BytesIO(b"x" * PART_SIZE))
+
+    assert upload.stored == b"x" * PART_SIZE
+    assert upload.parts == {}
+
+
+def test_large_stream_is_sent_in_parallel_parts():
+    content = bytes(range(256)) * 40
+    upload = InMemoryMultipartUpload(max_in_flight=3)
+    upload.upload(BytesIO(content))
+
+    assert upload.stored == content
+    assert len(upload.parts) == 11
+    assert 1 < upload.max_seen_in_flight <= 3
+    assert not upload.aborted
+
+
+def test_failed_part_is_retried_on_its_own():
+    content = b"y" * 5500
+    upload = InMemoryMultipartUpload(max_in_flight=2, failures={3: 2})
+    upload.upload(BytesIO(content))
+
+    assert upload.stored == content
+    assert upload.attempts[3] == 3
+    assert all(
+        attempts == 1
+        for part_number, attempts in upload.attempts.items()
+        if part_number != 3
+    )
+
+
+def test_upload_is_aborted_when_a_part_keeps_failing():
+    upload = InMemoryMultipartUpload(max_in_flight=2, max_attempts=2, failures={2: 5})
+    with pytest.raises(ConnectionError):
+        upload.upload(BytesIO(b"z" * 5500))
+
+    assert upload.aborted
+    assert upload.attempts[2] == 2
+
+
+def test_upload_is_aborted_when_the_stream_is_too_large():
+    upload = InMemoryMultipartUpload(max_in_flight=2)
+    with pytest.raises(FileTooLargeException):
+        upload.upload(
+            UploadStream(BytesIO(b"a" * 5000), max_bytes=3500, chunk_size=100)
+        )
+
+    assert upload.aborted
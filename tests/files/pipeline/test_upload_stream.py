@@ -0,0 +1,123 @@
+import hashlib
+from io import BytesIO
+
+import pytest
+
+from src.exceptions import FileTooLargeException
+from src.files.pipeline import FileInspection, UploadStream
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"
+
+
+class NonSeekableReader:
+    """Only exposes read(), like a request body."""
+
+    def __init__(self, data: bytes) -> None:
+        self.buffer = BytesIO(data)
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.buffer.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def test_upload_stream_sniffs_hashes_and_counts_in_one_pass():
+    content = PNG_HEADER + b"x" * 300_000
+    source = NonSeekableReader(content)
+
+    upload_stream = UploadStream(source, max_bytes=len(content), chunk_size=1024)  # type: ignore
+    assert upload_stream.is_image
+    assert upload_stream.extension == "png"
+    assert upload_stream.mime_type == "image/png"
+
+    parts = []
+    while True:
+        part = upload_stream.read(100_000)
+        if not part:
+            break
+        parts.append(part)
+
+    assert b"".join(parts) == content
+    assert upload_stream.total_bytes == len(content)
+    assert upload_stream.checksum == hashlib.sha256(content).hexdigest()
+    assert source.bytes_read == len(content)
+
+
+class TrickleReader(NonSeekableReader):
+    """Returns a few bytes per read, like a slow request body."""
+
+    def read(self, size: int = -1) -> bytes:
+        return super().read(min(size, 7) if size >= 0 else 7)
+
+
+def test_upload_stream_sniffs_short_reads():
+    content = PNG_HEADER + b"x" * 20_000
+    upload_stream = UploadStream(TrickleReader(content), max_bytes=len(content))  # type: ignore
+    assert upload_stream.mime_type == "image/png"
+    assert upload_stream.inspection.total_bytes == len(upload_stream.head)
+
+    assert upload_stream.read() == content
+    assert upload_stream.checksum == hashlib.sha256(content).hexdigest()
+
+
+def test_file_inspection_from_head():
+    inspection = FileInspection.from_head(PNG_HEADER)
+    assert inspection.is_image
+    assert inspection.extension == "png"
+
+    assert FileInspection.from_head(b"").kind is None
+
+
+def test_upload_stream_stops_reading_past_the_limit():
+    content = PNG_HEADER + b"x" * 1_000_000
+    source = NonSeekableReader(content)
+
+    upload_stream = UploadStream(source, max_bytes=2048, chunk_size=1024)  # type: ignore
+    with pytest.raises(FileTooLargeException):
+        while upload_stream.read(4096):
+            pass
+
+    assert source.bytes_read == 2049
+
+
+def test_upload_stream_of_unknown_type():
+    upload_stream = UploadStream(BytesIO(b"just some text"), max_bytes=100)
+    assert not upload_stream.is_image
+    assert upload_stream.mime_type is None
+    assert upload_stream.read() == b"just some text"
+
+
+def test_buffer_ahead_finalises_the_checksum_before_reading():
+    content = PNG_HEADER + b"x" * 300_000
+    upload_stream = UploadStream(
+        BytesIO(content), max_bytes=len(content), chunk_size=1024
+    )
+
+    assert upload_stream.buffer_ahead(len(content) + 1)
+    assert upload_stream.total_bytes == len(content)
+    assert upload_stream.checksum == hashlib.sha256(content).hexdigest()
+
+    assert upload_stream.read(100) + upload_stream.read() == content
+    assert upload_stream.read() == b""
+
+
+def test_buffer_ahead_stops_at_the_given_size():
+    content = PNG_HEADER + b"x" * 300_000
+    upload_stream = UploadStream(
+        BytesIO(content), max_bytes=len(content), chunk_size=1024
+    )
+
+    assert not upload_stream.buffer_ahead(10_000)
+    assert upload_stream.total_bytes == 10_000
+    assert upload_stream.read() == content
+
+
+def test_buffer_ahead_enforces_the_limit():
+    content = PNG_HEADER + b"x" * 300_000
+    upload_stream = UploadStream(
+        BytesIO(content), max_bytes=len(content) - 1, chunk_size=1024
+    )
+
+    with pytest.raises(FileTooLargeException):
+        upload_stream.buffer_ahead(len(content) + 1)
@@ -0,0 +1,52 @@
+import datetime
+
+from src.files.presigned import PresignedUrlCache
+
+EXPIRES_IN = datetime.timedelta(minutes=15)
+
+
+class Signer:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def __call__(self) -> str:
+        self.calls += 1
+        return f"https://storage/bucket/file?signature={self.calls}"
+
+
+def test_urls_are_reused_until_close_to_expiring():
+    cache = PresignedUrlCache()
+    sign = Signer()
+
+    url, expires_at = cache.get_or_sign("bucket", "file", EXPIRES_IN, sign)
+    assert sign.calls == 1
+    assert expires_at > datetime.datetime.now(datetime.timezone.utc)
+
+    assert cache.get_or_sign("bucket", "file", EXPIRES_IN, sign) == (url, expires_at)
+    assert sign.calls == 1
+
+    # * the cached URL has less than a fifth of its lifetime left.
+    almost_expired = datetime.datetime.now(datetime.timezone.utc) + EXPIRES_IN / 10
+    cache._entries[("bucket", "file")] = (url, almost_expired)
+    new_url, _ = cache.get_or_sign("bucket", "file", EXPIRES_IN, sign)
+    assert sign.calls == 2
+    assert new_url != url
+
+
+def test_invalidate_and_eviction():
+    cache = PresignedUrlCache(max_entries=2)
+    sign = Signer()
+
+    cache.get_or_sign("bucket", "a", EXPIRES_IN, sign)
+    cache.get_or_sign("bucket", "b", EXPIRES_IN, sign)
+    cache.get_or_sign("bucket", "a", EXPIRES_IN, sign)
+    cache.get_or_sign("bucket", "c", EXPIRES_IN, sign)
+    assert sign.calls == 3
+
+    # * "b" was the least recently used entry.
+    cache.get_or_sign("bucket", "b", EXPIRES_IN, sign)
+    assert sign.calls == 4
+
+    cache.invalidate("bucket", "b")
+    cache.get_or_sign("bucket", "b", EXPIRES_IN, sign)
+    assert sign.calls == 5
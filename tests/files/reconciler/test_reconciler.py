@@ -0,0 +1,104 @@
+from io import BytesIO
+from uuid import UUID
+
+import pytest
+
+from src.config import Settings
+from src.files.buckets import bucket_registry
+from src.files.pipeline import UploadStream
+from src.files.reconciler import (
+    FILES_CHECKPOINT,
+    OBJECTS_CHECKPOINT,
+    OrphanReconciler,
+    ReconcileReport,
+)
+from src.files.service import FileService
+from src.files.utils import (
+    BackendStorageOption,
+    OrphanAction,
+    S3FileData,
+    StorageLayout,
+    format_bucket_name,
+)
+from tests.utils import FILE_FIXTURES_PATH
+
+FILE_PATH_UNDER_TEST = f"{FILE_FIXTURES_PATH}/flower.jpg"
+
+
+@pytest.fixture()
+def local_settings(tmp_path) -> Settings:
+    # * The storage buckets known to this process are in MinIO, not in tmp_path.
+    bucket_registry.clear()
+    return Settings(
+        backend_storage_option=BackendStorageOption.LOCAL_STORAGE.value,
+        local_storage_path=str(tmp_path),
+        storage_layout=StorageLayout.BUCKET_PER_USER.value,
+        content_addressed_storage=False,
+        orphan_action=OrphanAction.DELETE.value,
+        orphan_grace_period_minutes=0,
+        presigned_url_expire_minutes=0,
+    )
+
+
+def upload_user_file(file_service: FileService, user_id):
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        result = file_service.upload_file(
+            file_to_upload=f, user_id=user_id, file_name="reconciled.jpg"
+        )
+    assert result.success, result.exception
+    return result.data
+
+
+def test_orphaned_objects_are_removed(test_db, file_user, local_settings):
+    file_service = FileService(
+        requesting_user=file_user, db=test_db, app_settings=local_settings
+    )
+    the_file = upload_user_file(file_service, file_user.id)
+    bucket_name = format_bucket_name(file_user.id)
+
+    stray_content = b"left behind by a failed upload" * 10
+    file_service.backend_storage.upload_file(
+        UploadStream(BytesIO(stray_content), max_bytes=len(stray_content)),
+        S3FileData("stray.bin", "stray.bin", bucket_name),
+        "application/octet-stream",
+    )
+
+    reconciler = OrphanReconciler(test_db, local_settings)
+    reconciler.crud.save_checkpoint(OBJECTS_CHECKPOINT, bucket_name, None)
+    report = ReconcileReport()
+    reconciler.reconcile_objects_page(report)
+
+    assert report.orphaned_objects == 1
+    assert report.removed_objects == 1
+    assert report.reclaimed_bytes == len(stray_content)
+
+    # * the file with a row is kept, and the walk moved on to the next bucket
+    assert file_service.download_file(the_file.id).success
+    checkpoint = reconciler.crud.get_checkpoint(OBJECTS_CHECKPOINT)
+    assert checkpoint.marker is None
+
+    file_service.delete_file(file_user.id, the_file.id)
+
+
+def test_files_without_an_object_are_reported(test_db, file_user, local_settings):
+    file_service = FileService(
+        requesting_user=file_user, db=test_db, app_settings=local_settings
+    )
+    the_file = upload_user_file(file_service, file_user.id)
+    file_service.backend_storage.remove_file(
+        the_file.storage_bucket, the_file.file_name
+    )
+
+    reconciler = OrphanReconciler(test_db, local_settings)
+    # * start the walk right before the file
+    reconciler.crud.save_checkpoint(
+        FILES_CHECKPOINT, None, str(UUID(int=the_file.id.int - 1))
+    )
+    report = ReconcileReport()
+    reconciler.check_files_page(report)
+
+    assert str(the_file.id) in report.missing_file_ids
+    # * rows are only reported, never removed
+    assert file_service.get_file(file_object_id=the_file.id).success
+
+    file_service.delete_file(file_user.id, the_file.id)
@@ -1,19 +1,49 @@
+import hashlib
 import os
+import urllib.request
 from io import BytesIO
 from uuid import uuid4
+
+import pytest
+from sqlalchemy.orm import Session
+
 from src.files.utils import hash_bytes, hash_file
 from src.files.service import FileService
 from src.config import Settings
 from tests.utils import FILE_FIXTURES_PATH
 from src.service import ServiceResult
-from src.exceptions import FileTooLargeException
-from src.files.utils import ONE_MEGA_BYTE
+from src.exceptions import (
+    BaseConflictException,
+    BaseForbiddenException,
+    BaseNotFoundException,
+    FileTooLargeException,
+)
+from src.database import get_engine
+from src.files.buckets import BucketRegistry, bucket_registry
+from src.files.utils import (
+    ONE_MEGA_BYTE,
+    BackendStorageOption,
+    StorageLayout,
+    format_bucket_name,
+)
+from src.models import FileBlob
 
-from src.files.schemas import FileObjectOut, ManyFileObjectsOut
+from src.files.schemas import (
+    DirectUploadOut,
+    FileObjectOut,
+    ManyFileObjectsOut,
+    PresignedUrlOut,
+)
 
 MAX_UPLOAD_COUNT = 5
 FILE_PATH_UNDER_TEST = f"{FILE_FIXTURES_PATH}/flower.jpg"
 
+# * The local storage can not hand out URLs to itself.
+requires_presigned_urls = pytest.mark.skipif(
+    Settings().backend_storage_option == BackendStorageOption.LOCAL_STORAGE.value,
+    reason="The backend storage does not support presigned URLs.",
+)
+
 
 def test_upload_and_download_of_file(test_db, file_user):
     file_service = FileService(
@@ -140,3 +170,383 @@ def test_upload_file_larger_than_limit(test_db, file_user):
 
     # * reset
     os.environ["MAX_SIZE_OF_A_FILE"] = f"{test_file_size_in_bytes / ONE_MEGA_BYTE}"
+
+
+@requires_presigned_urls
+def test_direct_upload_and_presigned_download(test_db, file_user):
+    file_service = FileService(
+        requesting_user=file_user, db=test_db, app_settings=Settings()
+    )
+
+    result = file_service.initiate_direct_upload(file_user.id, "direct-file.jpg")
+    assert result.success, result.exception
+    assert isinstance(result.data, DirectUploadOut)
+    direct_upload = result.data
+
+    # * nothing has been uploaded yet
+    result = file_service.finalize_direct_upload(
+        file_user.id, direct_upload.object_name, "direct-file.jpg"
+    )
+    assert not result.success
+
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        file_content = f.read()
+
+    request = urllib.request.Request(
+        direct_upload.upload_url, data=file_content, method="PUT"
+    )
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 200
+
+    result = file_service.finalize_direct_upload(
+        file_user.id, direct_upload.object_name, "direct-file.jpg", images_only=True
+    )
+    assert result.success, result.exception
+    assert isinstance(result.data, FileObjectOut)
+    assert result.data.mime_type == "image/jpeg"
+    assert result.data.total_bytes == len(file_content)
+
+    # * the same object can only be recorded once
+    result = file_service.finalize_direct_upload(
+        file_user.id, direct_upload.object_name, "direct-file.jpg"
+    )
+    assert not result.success
+
+    file_object = file_service.get_file(
+        file_object_id=file_service.crud.get_file_by_name(direct_upload.object_name).id  # type: ignore
+    ).data
+
+    first_url = file_service.get_signed_download_url(file_object)
+    assert first_url.success, first_url.exception
+    assert isinstance(first_url.data, PresignedUrlOut)
+    assert (
+        file_service.get_signed_download_url(file_object).data.url == first_url.data.url
+    )
+
+    with urllib.request.urlopen(first_url.data.url) as response:
+        assert hash_bytes(response.read()) == hash_file(FILE_PATH_UNDER_TEST)
+
+
+@requires_presigned_urls
+def test_direct_upload_larger_than_limit_is_removed(test_db, file_user):
+    file_service = FileService(
+        requesting_user=file_user, db=test_db, app_settings=Settings()
+    )
+
+    direct_upload = file_service.initiate_direct_upload(
+        file_user.id, "direct-file.jpg"
+    ).data
+
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        request = urllib.request.Request(
+            direct_upload.upload_url, data=f.read(), method="PUT"
+        )
+    urllib.request.urlopen(request).close()
+
+    result = file_service.finalize_direct_upload(
+        file_user.id,
+        direct_upload.object_name,
+        "direct-file.jpg",
+        file_size_limit=0.0001,
+    )
+    assert not result.success
+    assert isinstance(result.exception, FileTooLargeException)
+
+    # * the rejected object is gone from the storage
+    result = file_service.finalize_direct_upload(
+        file_user.id, direct_upload.object_name, "direct-file.jpg"
+    )
+    assert not result.success
+
+
+def test_content_addressed_uploads_share_one_blob(test_db, file_user):
+    file_service = FileService(
+        requesting_user=file_user,
+        db=test_db,
+        app_settings=Settings(content_addressed_storage=True),
+    )
+
+    file_objects = []
+    for _ in range(0, 2):
+        with open(FILE_PATH_UNDER_TEST, "rb") as f:
+            result = file_service.upload_file(
+                file_to_upload=f, user_id=file_user.id, file_name="shared-file.jpg"
+            )
+            assert result.success, result.exception
+            file_objects.append(result.data)
+
+    first_file, second_file = file_objects
+    assert first_file.id != second_file.id
+    assert first_file.blob is not None
+    assert first_file.blob.object_name == second_file.blob.object_name
+
+    blob = (
+        test_db.query(FileBlob).filter(FileBlob.checksum == first_file.checksum).one()
+    )
+    assert blob.reference_count == 2
+
+    # * the content stays until the last file pointing at it is removed
+    assert file_service.delete_file(file_user.id, first_file.id).success
+    test_db.refresh(blob)
+    assert blob.reference_count == 1
+
+    file_content = file_service.download_file(second_file.id)
+    assert file_content.success, file_content.exception
+    assert hash_bytes(file_content.data.read()) == hash_file(FILE_PATH_UNDER_TEST)
+
+    assert file_service.delete_file(file_user.id, second_file.id).success
+    test_db.expire_all()
+    assert (
+        test_db.query(FileBlob).filter(FileBlob.checksum == first_file.checksum).first()
+        is None
+    )
+
+
+def test_shared_bucket_layout(test_db, file_user):
+    file_service = FileService(
+        requesting_user=file_user,
+        db=test_db,
+        app_settings=Settings(storage_layout=StorageLayout.SHARED_BUCKET.value),
+    )
+
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        result = file_service.upload_file(
+            file_to_upload=f, user_id=file_user.id, file_name="prefixed-file.jpg"
+        )
+    assert result.success, result.exception
+    assert result.data.storage_bucket == file_service.app_settings.shared_bucket_name
+    assert result.data.file_name.startswith(f"{format_bucket_name(file_user.id)}/")
+    assert bucket_registry.get_bucket_id(file_user.id) is not None
+
+    file_content = file_service.download_file(result.data.id)
+    assert file_content.success, file_content.exception
+    assert hash_bytes(file_content.data.read()) == hash_file(FILE_PATH_UNDER_TEST)
+
+    # * a direct upload can only be finalized under the user's own prefix
+    result = file_service.finalize_direct_upload(
+        file_user.id, f"{uuid4().hex}/someone-else.jpg", "someone-else.jpg"
+    )
+    assert not result.success
+    assert isinstance(result.exception, BaseForbiddenException)
+
+
+def test_image_derivatives(test_db, file_user):
+    file_service = FileService(
+        requesting_user=file_user, db=test_db, app_settings=Settings()
+    )
+
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        result = file_service.upload_file(
+            file_to_upload=f, user_id=file_user.id, file_name="resized-file.jpg"
+        )
+    assert result.success, result.exception
+    original = result.data
+
+    # * the original is served until the derivatives are rendered
+    assert file_service.select_image_variant(original, size=64) == original
+
+    derivatives_result = file_service.create_image_derivatives(original.id)
+    assert derivatives_result.success, derivatives_result.exception
+    assert derivatives_result.data > 0
+
+    variant = file_service.select_image_variant(
+        original, size=50, accept="image/webp,*/*"
+    )
+    assert variant.mime_type == "image/webp"
+    assert variant.file_name.endswith("-64.webp")
+
+    variant = file_service.select_image_variant(original, size=50)
+    assert variant.mime_type == "image/jpeg"
+    content = b"".join(file_service.open_file_stream(variant).data)
+    assert hashlib.sha256(content).hexdigest() == variant.checksum
+    assert len(content) == variant.total_bytes
+
+    # * larger than every derivative
+    assert file_service.select_image_variant(original, size=1000) == original
+
+    assert file_service.delete_file(file_user.id, original.id).success
+    assert file_service.crud.get_derivatives(original.id) == []
+    assert not file_service.open_file_stream(variant).success
+
+
+def test_failed_delete_keeps_the_files_and_their_blob(test_db, file_user):
+    file_service = FileService(
+        requesting_user=file_user,
+        db=test_db,
+        app_settings=Settings(content_addressed_storage=True),
+    )
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        result = file_service.upload_file(
+            file_to_upload=f, user_id=file_user.id, file_name="kept-file.jpg"
+        )
+    assert result.success, result.exception
+    file_object = result.data
+    blob = test_db.query(FileBlob).filter(FileBlob.id == file_object.blob.id).one()
+    reference_count = blob.reference_count
+
+    def release_blob(*args):
+        raise ConnectionError("connection lost")
+
+    file_service.crud.release_blob = release_blob  # type: ignore
+    assert not file_service.delete_files([file_object.id]).success
+
+    # * the row delete was rolled back with the reference, the session is usable again
+    assert file_service.get_file(file_object.id).success
+    test_db.refresh(blob)
+    assert blob.reference_count == reference_count
+
+
+def test_bulk_delete_files(test_db, file_user):
+    file_service = FileService(
+        requesting_user=file_user, db=test_db, app_settings=Settings()
+    )
+
+    file_ids = []
+    for index in range(0, 3):
+        with open(FILE_PATH_UNDER_TEST, "rb") as f:
+            result = file_service.upload_file(
+                file_to_upload=f, user_id=file_user.id, file_name=f"bulk-{index}.jpg"
+            )
+        assert result.success, result.exception
+        file_ids.append(result.data.id)
+
+    # * someone else's files are skipped, as are ids that do not exist
+    result = file_service.delete_files(file_ids, owner_id=uuid4())
+    assert result.success
+    assert result.data == 0
+
+    result = file_service.delete_files(file_ids[:2] + [uuid4()], owner_id=file_user.id)
+    assert result.success
+    assert result.data == 2
+    for file_id in file_ids[:2]:
+        assert not file_service.get_file(file_object_id=file_id).success
+    assert file_service.get_file(file_object_id=file_ids[2]).success
+
+
+def test_delete_user_files(test_db, file_user):
+    file_service = FileService(
+        requesting_user=file_user, db=test_db, app_settings=Settings()
+    )
+
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        assert file_service.upload_file(
+            file_to_upload=f, user_id=file_user.id, file_name="leaving.jpg"
+        ).success
+
+    result = file_service.delete_user_files(file_user.id)
+    assert result.success, result.exception
+    assert result.data >= 1
+
+    user_files = file_service.get_files(file_user.id)
+    assert user_files.data.total == 0
+
+
+def test_upload_after_another_worker_deleted_the_user_files(
+    test_db, file_user, monkeypatch
+):
+    file_service = FileService(
+        requesting_user=file_user, db=test_db, app_settings=Settings()
+    )
+    storage_bucket_name = file_service._get_storage_bucket_name(file_user.id)
+
+    # * this worker remembers the user's bucket row and storage bucket
+    this_worker = BucketRegistry()
+    monkeypatch.setattr("src.files.service.bucket_registry", this_worker)
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        assert file_service.upload_file(
+            file_to_upload=f, user_id=file_user.id, file_name="before.jpg"
+        ).success
+    assert this_worker.get_bucket_id(file_user.id) is not None
+    assert this_worker.has_storage_bucket(storage_bucket_name)
+
+    monkeypatch.setattr("src.files.service.bucket_registry", BucketRegistry())
+    result = file_service.delete_user_files(file_user.id)
+    assert result.success, result.exception
+
+    monkeypatch.setattr("src.files.service.bucket_registry", this_worker)
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        result = file_service.upload_file(
+            file_to_upload=f, user_id=file_user.id, file_name="after.jpg"
+        )
+    assert result.success, result.exception
+    assert file_service.download_file(result.data.id).success
+
+
+def test_chunk_sent_twice_at_once_is_recorded_once(test_db, file_user):
+    file_service = FileService(
+        requesting_user=file_user, db=test_db, app_settings=Settings()
+    )
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        content = f.read()
+
+    result = file_service.create_upload_session(
+        file_user.id, "twice.jpg", total_bytes=len(content)
+    )
+    assert result.success, result.exception
+    upload_session_id = result.data.id
+
+    # * the same chunk comes in again while the first one is being sent
+    other_db = Session(bind=get_engine())
+    other_service = FileService(
+        requesting_user=file_user, db=other_db, app_settings=Settings()
+    )
+    other_results = []
+    upload_part = file_service.backend_storage.upload_part
+
+    def upload_part_while_the_chunk_is_sent_again(*args):
+        etag = upload_part(*args)
+        other_results.append(
+            other_service.upload_chunk(file_user.id, upload_session_id, 0, content)
+        )
+        return etag
+
+    file_service.backend_storage.upload_part = upload_part_while_the_chunk_is_sent_again
+    try:
+        result = file_service.upload_chunk(file_user.id, upload_session_id, 0, content)
+    finally:
+        other_db.close()
+
+    assert other_results[0].success, other_results[0].exception
+    assert other_results[0].data.received_bytes == len(content)
+    assert not result.success
+    assert isinstance(result.exception, BaseConflictException)
+
+    result = file_service.finalize_upload_session(file_user.id, upload_session_id)
+    assert result.success, result.exception
+    assert file_service.download_file(result.data.id).data.read() == content
+
+
+def test_chunk_of_an_upload_cancelled_while_it_is_sent_is_not_found(test_db, file_user):
+    file_service = FileService(
+        requesting_user=file_user, db=test_db, app_settings=Settings()
+    )
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        content = f.read()
+
+    result = file_service.create_upload_session(
+        file_user.id, "cancelled.jpg", total_bytes=len(content)
+    )
+    assert result.success, result.exception
+    upload_session_id = result.data.id
+
+    other_db = Session(bind=get_engine())
+    other_service = FileService(
+        requesting_user=file_user, db=other_db, app_settings=Settings()
+    )
+    upload_part = file_service.backend_storage.upload_part
+
+    def upload_part_while_the_upload_is_cancelled(*args):
+        etag = upload_part(*args)
+        assert other_service.cancel_upload_session(
+            file_user.id, upload_session_id
+        ).success
+        return etag
+
+    file_service.backend_storage.upload_part = upload_part_while_the_upload_is_cancelled
+    try:
+        result = file_service.upload_chunk(file_user.id, upload_session_id, 0, content)
+    finally:
+        other_db.close()
+
+    assert not result.success
+    assert isinstance(result.exception, BaseNotFoundException)
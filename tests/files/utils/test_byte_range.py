@@ -0,0 +1,42 @@
+import pytest
+
+from src.exceptions import RangeNotSatisfiableException
+from src.files.utils import parse_range_header
+
+TOTAL_BYTES = 1000
+
+
+@pytest.mark.parametrize(
+    "range_header, expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=500-", (500, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=900-5000", (900, 999)),
+    ],
+)
+def test_parse_range_header(range_header, expected):
+    byte_range = parse_range_header(range_header, TOTAL_BYTES)
+    assert byte_range is not None
+    assert (byte_range.start, byte_range.end) == expected
+    assert byte_range.length == expected[1] - expected[0] + 1
+    assert byte_range.content_range(TOTAL_BYTES) == (
+        f"bytes {expected[0]}-{expected[1]}/{TOTAL_BYTES}"
+    )
+
+
+@pytest.mark.parametrize(
+    "range_header",
+    [None, "", "items=0-10", "bytes=0-10,20-30", "bytes=abc-", "bytes=50-10"],
+)
+def test_ignored_range_headers_send_the_whole_file(range_header):
+    assert parse_range_header(range_header, TOTAL_BYTES) is None
+
+
+@pytest.mark.parametrize("range_header", ["bytes=1000-", "bytes=5000-6000", "bytes=-0"])
+def test_unsatisfiable_range_headers(range_header):
+    with pytest.raises(RangeNotSatisfiableException) as raised_exception:
+        parse_range_header(range_header, TOTAL_BYTES)
+
+    assert raised_exception.value.total_bytes == TOTAL_BYTES
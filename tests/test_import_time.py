@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# * Cumulative microseconds `import src.main` may take in a fresh interpreter.
+IMPORT_TIME_BUDGET_US = int(os.getenv("IMPORT_TIME_BUDGET_US", "1500000"))
+
+OPTIONAL_BACKEND_MODULES = ["google.cloud.sql.connector", "minio", "fastapi_mail"]
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def get_cumulative_import_time(importtime_output: str, module_name: str) -> int:
+    """Reads the cumulative time (us) of a module from `python -X importtime` output."""
+
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.strip() == module_name:
+            return int(cumulative)
+
+    raise AssertionError(f"{module_name} was not imported")
+
+
+def test_import_time_of_main_is_within_budget():
+    result = run_python("-X", "importtime", "-c", "import src.main")
+
+    cumulative_us = get_cumulative_import_time(result.stderr, "src.main")
+    assert (
+        cumulative_us <= IMPORT_TIME_BUDGET_US
+    ), f"Importing src.main took {cumulative_us}us, the budget is {IMPORT_TIME_BUDGET_US}us"
+
+
+def test_optional_backends_are_not_imported_at_startup():
+    result = run_python(
+        "-c",
+        f"import sys, src.main; print(','.join(m for m in {OPTIONAL_BACKEND_MODULES!r} if m in sys.modules))",
+    )
+
+    assert result.stdout.strip() == ""
@@ -0,0 +1,19 @@
+from src.config import Settings
+from src.init_platform import BOOTSTRAP_VERSION, init_platform
+from src.models import PlatformBootstrap
+from src.users.crud.users import UserCRUD
+
+
+def test_init_platform_runs_once(test_db):
+    init_platform()
+
+    marker = test_db.query(PlatformBootstrap).first()
+    assert marker is not None
+    assert marker.version == BOOTSTRAP_VERSION
+
+    admin_user = UserCRUD(test_db).get_user_by_email(Settings().admin_email)
+    assert admin_user is not None
+    assert admin_user.is_super_admin
+
+    # * the marker is up to date, nothing else should happen
+    assert init_platform() == False
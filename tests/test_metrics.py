@@ -0,0 +1,214 @@
+import asyncio
+import os
+import subprocess
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import CollectorRegistry
+from sqlalchemy import create_engine, text
+
+from src import metrics as metrics_module
+from src.config import Settings
+from src.files.admission import UploadAdmission
+from src.files.disk_cache import get_file_cache
+from src.files.pipeline import UploadStream
+from src.files.storage import BackendStorage, get_storage_client
+from src.files.utils import BackendStorageOption, S3FileData
+from src.metrics import Metrics, MetricsMiddleware, TimedQueuePool, instrument_engine
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+CONTENT = b"x" * 10_000
+
+
+@pytest.fixture()
+def metrics(monkeypatch) -> Metrics:
+    metrics = Metrics(CollectorRegistry())
+    monkeypatch.setattr(metrics_module, "_metrics", metrics)
+    monkeypatch.setattr(metrics_module, "_stats_sources", {})
+    return metrics
+
+
+def get_value(metrics: Metrics, name: str, **labels) -> float:
+    return metrics.registry.get_sample_value(name, labels) or 0
+
+
+def test_requests_are_labelled_by_their_route(metrics: Metrics):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, routes=app.routes)
+
+    @app.get("/files/{file_id}")
+    def read_file(file_id: str):
+        assert (
+            get_value(
+                metrics,
+                "http_requests_in_flight",
+                method="GET",
+                route="/files/{file_id}",
+            )
+            == 1
+        )
+        return {"id": file_id}
+
+    client = TestClient(app)
+    assert client.get("/files/one").status_code == 200
+    assert client.get("/files/two").status_code == 200
+    assert client.post("/files/two").status_code == 405
+    assert client.get("/missing").status_code == 404
+
+    route = {"method": "GET", "route": "/files/{file_id}"}
+    assert get_value(metrics, "http_request_duration_seconds_count", **route) == 2
+    assert get_value(metrics, "http_requests_in_flight", **route) == 0
+    assert get_value(metrics, "http_requests_total", status_code="200", **route) == 2
+    assert (
+        get_value(
+            metrics,
+            "http_requests_total",
+            method="POST",
+            route="/files/{file_id}",
+            status_code="405",
+        )
+        == 1
+    )
+    assert (
+        get_value(
+            metrics,
+            "http_requests_total",
+            method="GET",
+            route="unmatched",
+            status_code="404",
+        )
+        == 1
+    )
+
+
+def test_storage_operations_are_timed_and_counted(metrics: Metrics, tmp_path):
+    backend_storage = BackendStorage(
+        Settings(
+            backend_storage_option=BackendStorageOption.LOCAL_STORAGE.value,
+            local_storage_path=str(tmp_path),
+        )
+    )
+    backend_storage.create_bucket("metrics-bucket")
+    s3_file_data = S3FileData("file.bin", "file.bin", "metrics-bucket")
+
+    assert backend_storage.bucket_exists("metrics-bucket")
+    backend_storage.upload_file(
+        UploadStream(BytesIO(CONTENT), max_bytes=len(CONTENT)),
+        s3_file_data,
+        "application/octet-stream",
+    )
+    assert backend_storage.download_file(s3_file_data).read() == CONTENT
+    assert b"".join(backend_storage.open_file_stream(s3_file_data)) == CONTENT
+    backend_storage.remove_file("metrics-bucket", "file.bin")
+    with pytest.raises(Exception):
+        backend_storage.get_file_info(s3_file_data)
+
+    for operation, count in [
+        ("bucket_exists", 1),
+        ("upload", 1),
+        ("download", 2),
+        ("remove", 1),
+    ]:
+        assert (
+            get_value(
+                metrics, "storage_operation_duration_seconds_count", operation=operation
+            )
+            == count
+        )
+    assert get_value(
+        metrics, "storage_operation_bytes_total", operation="upload"
+    ) == len(CONTENT)
+    assert get_value(
+        metrics, "storage_operation_bytes_total", operation="download"
+    ) == 2 * len(CONTENT)
+    assert (
+        get_value(metrics, "storage_operation_errors_total", operation="get_file_info")
+        == 1
+    )
+
+
+def test_database_pool_checkouts_are_timed(metrics: Metrics, tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'metrics.db'}", poolclass=TimedQueuePool
+    )
+    instrument_engine(engine)
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        connection.execute(text("SELECT 2"))
+        assert get_value(metrics, "db_pool_connections_checked_out") == 1
+
+    assert get_value(metrics, "db_queries_total") == 2
+    assert get_value(metrics, "db_pool_checkout_wait_seconds_count") == 1
+    assert get_value(metrics, "db_pool_checkout_seconds_count") == 1
+    assert get_value(metrics, "db_pool_connections_checked_out") == 0
+
+
+def test_stats_of_the_process_wide_objects_are_published(metrics: Metrics, tmp_path):
+    admission = UploadAdmission(max_uploads=2, max_bytes=1000, max_wait_seconds=1)
+    assert asyncio.run(admission.acquire(400))
+    assert get_value(metrics, "upload_admission_in_flight") == 1
+    assert get_value(metrics, "upload_admission_bytes_in_flight") == 400
+    admission.release(400)
+    assert get_value(metrics, "upload_admission_in_flight") == 0
+    assert get_value(metrics, "upload_admission_admitted") == 1
+
+    file_cache = get_file_cache(str(tmp_path), max_bytes=10_000, max_file_bytes=10_000)
+    for _ in range(0, 2):
+        file_cache.open(
+            "metrics-bucket",
+            "file.bin",
+            get_size=lambda: len(CONTENT),
+            fill=lambda file: file.write(CONTENT),
+        ).close()
+    get_storage_client(
+        Settings(
+            minio_host="metrics-host:9000",
+            minio_access_key="access-key",
+            minio_secret_key="secret-key",
+            storage_pool_size=8,
+        )
+    )
+
+    # * read on every scrape, and after every request
+    exposition = metrics_module.make_metrics_response().body.decode()
+    assert "file_cache_hits 1.0" in exposition
+    assert get_value(metrics, "file_cache_misses") == 1
+    assert get_value(metrics, "file_cache_total_bytes") == len(CONTENT)
+    assert get_value(metrics, "storage_pool_max_size") == 8
+
+
+def run_worker(multiproc_dir: Path, code: str) -> str:
+    """Runs `code` in a new process with metrics enabled, like a hypercorn worker."""
+
+    return subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "from src.config import Settings; from src import metrics; "
+            "metrics.configure_metrics(Settings(metrics_enabled=True)); " + code,
+        ],
+        cwd=PROJECT_ROOT,
+        env={
+            **os.environ,
+            "PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir),
+        },
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+def test_metrics_of_every_worker_are_added_up(tmp_path):
+    for total_bytes in [100, 200]:
+        run_worker(tmp_path, f"metrics.count_storage_bytes('upload', {total_bytes})")
+
+    exposition = run_worker(
+        tmp_path, "print(metrics.make_metrics_response().body.decode())"
+    )
+    assert 'storage_operation_bytes_total{operation="upload"} 300.0' in exposition
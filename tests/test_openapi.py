@@ -0,0 +1,78 @@
+import gzip
+import json
+
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.openapi import (
+    PrecomputedOpenAPI,
+    build_openapi_document,
+    is_document_current,
+)
+from src.service import get_settings
+
+
+def test_openapi_document_is_served_with_etag():
+    client = TestClient(app)
+
+    response = client.get(get_settings().openapi_url)
+    assert response.status_code == 200, response.content
+    assert "ETag" in response.headers
+    assert response.json()["info"]["title"] == get_settings().app_name
+
+    response = client.get(
+        get_settings().openapi_url,
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_openapi_document_is_served_gzipped():
+    client = TestClient(app)
+
+    response = client.get(
+        get_settings().openapi_url, headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.json() == app.openapi_schema
+
+
+def test_scopes_are_added_to_descriptions():
+    create_role = app.openapi_schema["paths"]["/roles/"]["post"]  # type: ignore
+    assert "<strong>Scopes: </strong>" in create_role["description"]
+    assert "role:create" in create_role["description"]
+
+
+def test_openapi_document_can_be_written_and_loaded(tmp_path):
+    document = PrecomputedOpenAPI.from_schema(app.openapi_schema)  # type: ignore
+    file_path = str(tmp_path / "openapi.json")
+    document.write(file_path)
+
+    loaded_document = PrecomputedOpenAPI.from_file(file_path)
+    assert loaded_document.etag == document.etag
+    assert (
+        json.loads(gzip.decompress(loaded_document.gzipped_body)) == app.openapi_schema
+    )
+
+
+def test_a_document_of_another_build_is_not_served(tmp_path):
+    settings = get_settings()
+    assert is_document_current(app, settings, app.openapi_schema)  # type: ignore
+
+    stale_schema = json.loads(json.dumps(app.openapi_schema))
+    del stale_schema["paths"]["/roles/"]["post"]
+    file_path = tmp_path / "openapi.json"
+    PrecomputedOpenAPI.from_schema(stale_schema).write(str(file_path))
+
+    stale_settings = settings.copy(update={"openapi_schema_file": str(file_path)})
+    assert not is_document_current(app, stale_settings, stale_schema)
+    assert build_openapi_document(app, stale_settings).to_schema() == app.openapi_schema
+
+    # * a document of another version is not served either
+    other_version = settings.copy(
+        update={"openapi_schema_file": str(file_path), "api_version": "0.1"}
+    )
+    PrecomputedOpenAPI.from_schema(app.openapi_schema).write(str(file_path))  # type: ignore
+    assert not is_document_current(app, other_version, app.openapi_schema)  # type: ignore
@@ -0,0 +1,85 @@
+import pytest
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.testclient import TestClient
+
+from src.middleware import RequestSizeLimitMiddleware, make_body_limit
+
+MAX_PHOTO_BYTES = 1000
+MAX_BODY_BYTES = 100
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(
+        RequestSizeLimitMiddleware,
+        limits=[make_body_limit("PUT", "/users/[^/]+/photo", MAX_PHOTO_BYTES)],
+        default_max_bytes=MAX_BODY_BYTES,
+    )
+    app.state.bodies_read = 0
+
+    @app.put("/users/{user_id}/photo")
+    def upload_photo(file_to_upload: UploadFile = File(...)):
+        app.state.bodies_read += 1
+        return {"total_bytes": len(file_to_upload.file.read())}
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        total_bytes = 0
+        async for chunk in request.stream():
+            total_bytes += len(chunk)
+        return {"total_bytes": total_bytes}
+
+    return TestClient(app)
+
+
+def chunked(body: bytes, chunk_size: int = 10):
+    """A body without a Content-Length, sent with chunked transfer encoding."""
+
+    for start in range(0, len(body), chunk_size):
+        yield body[start : start + chunk_size]
+
+
+def test_bodies_within_the_limit_go_through(client: TestClient):
+    response = client.put(
+        "/users/me/photo", files={"file_to_upload": ("photo.png", b"x" * 500)}
+    )
+    assert response.status_code == 200, response.json()
+    assert response.json() == {"total_bytes": 500}
+
+    response = client.post("/echo", content=chunked(b"x" * MAX_BODY_BYTES))
+    assert response.status_code == 200, response.json()
+    assert response.json() == {"total_bytes": MAX_BODY_BYTES}
+
+
+def test_content_length_over_the_limit_is_refused_up_front(client: TestClient):
+    response = client.put(
+        "/users/me/photo",
+        files={"file_to_upload": ("photo.png", b"x" * (MAX_PHOTO_BYTES + 1))},
+    )
+    assert response.status_code == 413
+    assert "detail" in response.json()
+    assert client.app.state.bodies_read == 0  # type: ignore
+
+    # * other routes get the default limit
+    response = client.post("/echo", content=b"x" * (MAX_BODY_BYTES + 1))
+    assert response.status_code == 413
+
+
+def test_chunked_bodies_are_cut_off_past_the_limit(client: TestClient):
+    response = client.post("/echo", content=chunked(b"x" * (MAX_BODY_BYTES + 1)))
+    assert response.status_code == 413
+
+    response = client.put(
+        "/users/me/photo",
+        content=chunked(
+            b"--boundary\r\n"
+            b'Content-Disposition: form-data; name="file_to_upload"; filename="photo.png"\r\n\r\n'
+            + b"x" * MAX_PHOTO_BYTES * 2
+            + b"\r\n--boundary--\r\n",
+            chunk_size=100,
+        ),
+        headers={"Content-Type": "multipart/form-data; boundary=boundary"},
+    )
+    assert response.status_code == 413
+    assert client.app.state.bodies_read == 0  # type: ignore
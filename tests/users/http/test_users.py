@@ -1,10 +1,15 @@
+import os
+import time
+import uuid
 from datetime import datetime, timedelta
 from email import header
-import pytest
 from fastapi.testclient import TestClient
 
 from src.mail import fm
+from src.main import app
+from src.service import get_settings
 from src.config import Settings, setup_logger
+from src.outbox import EmailOutboxSender
 from src.users.dependencies import anonymous_user
 from src.users.services.users import UserService
 from tests.users.http.conftest import login_test
@@ -18,6 +23,15 @@ email_under_test = "1@regnify.com"
 prefix = "http-user"
 
 
+def send_email_outbox(test_db, app_settings: Settings, recipient: str) -> list:
+    """Sends the emails waiting in the outbox, returns the ones sent to `recipient`."""
+
+    fm.config.SUPPRESS_SEND = 1
+    with fm.record_messages() as outbox:
+        EmailOutboxSender(test_db, app_settings).send_pending()
+    return [message for message in outbox if message["To"] == recipient]
+
+
 def test_root_endpoint(client: TestClient) -> None:
     response = client.get("/")
     assert response.status_code == 200, response.json()
@@ -32,7 +46,10 @@ def test_list_scopes(client: TestClient, test_admin_user_headers: dict):
 
 
 def test_can_create_user_with_admin_signup_token(
-    client: TestClient, test_admin_user_headers: dict, app_settings: Settings
+    client: TestClient,
+    test_admin_user_headers: dict,
+    app_settings: Settings,
+    test_db,
 ) -> None:
     user_data = {
         "email": email_under_test,
@@ -41,30 +58,26 @@ def test_can_create_user_with_admin_signup_token(
         "first_name": "",
     }
 
-    fm.config.SUPPRESS_SEND = 1
-    with fm.record_messages() as outbox:
-        response = client.post(
-            "/users",
-            json=user_data,
-            headers={
-                **test_admin_user_headers,
-                "admin-signup-token": app_settings.admin_signup_token,
-            },
-        )
-        assert response.status_code == 200, response.json()
-        assert response.json()["is_active"] == True
-        assert response.json()["is_super_admin"] == False
+    response = client.post(
+        "/users",
+        json=user_data,
+        headers={
+            **test_admin_user_headers,
+            "admin-signup-token": app_settings.admin_signup_token,
+        },
+    )
+    assert response.status_code == 200, response.json()
+    assert response.json()["is_active"] == True
+    assert response.json()["is_super_admin"] == False
 
-        # * test that the mail was not sent
-        assert len(outbox) == 0
+    # * test that the mail was not sent
+    assert len(send_email_outbox(test_db, app_settings, email_under_test)) == 0
 
     # * the use can resend the invite
-    fm.config.SUPPRESS_SEND = 1
-    with fm.record_messages() as outbox:
-        response = client.post(f"/users/resend-invite?email={email_under_test}")
-        assert response.status_code == 200, response.json()
-        # * test that the mail was sent
-        assert len(outbox) == 1
+    response = client.post(f"/users/resend-invite?email={email_under_test}")
+    assert response.status_code == 200, response.json()
+    # * test that the mail was sent
+    assert len(send_email_outbox(test_db, app_settings, email_under_test)) == 1
 
     user_data = {
         **user_data,
@@ -84,24 +97,21 @@ def test_can_create_user_with_admin_signup_token(
     assert response.json()["is_super_admin"] == True
 
     # * when admin signup token is invalid, email must also be sent
-    fm.config.SUPPRESS_SEND = 1
-    with fm.record_messages() as outbox:
-        user_data = {**user_data, "email": "1" + prefix + email_under_test}
-        response = client.post(
-            "/users",
-            json=user_data,
-            headers={
-                **test_admin_user_headers,
-                "admin-signup-token": "THIS IS WRONG!",
-            },
-        )
-        assert response.status_code == 200, response.json()
-        assert response.json()["is_active"] == False
-        assert response.json()["is_super_admin"] == False
+    user_data = {**user_data, "email": "1" + prefix + email_under_test}
+    response = client.post(
+        "/users",
+        json=user_data,
+        headers={
+            **test_admin_user_headers,
+            "admin-signup-token": "THIS IS WRONG!",
+        },
+    )
+    assert response.status_code == 200, response.json()
+    assert response.json()["is_active"] == False
+    assert response.json()["is_super_admin"] == False
 
-        # * test the mail has been sent
-        assert len(outbox) == 1
-        assert outbox[0]["To"] == user_data["email"]
+    # * test the mail has been sent
+    assert len(send_email_outbox(test_db, app_settings, user_data["email"])) == 1
 
     # * create access begin and access end time
     access_end = datetime.utcnow() + timedelta(days=2)
@@ -257,22 +267,20 @@ def test_admin_can_change_a_user_password(
     assert response.status_code == 403, response.content
 
 
-@pytest.mark.asyncio
-async def test_create_request_password(client: TestClient, test_non_admin_user: dict):
-    fm.config.SUPPRESS_SEND = 1
-    with fm.record_messages() as outbox:
-        response = client.post(
-            f"/users/request-password-change?email=" + test_non_admin_user["email"],
-        )
-        assert response.status_code == 200, response.content
+def test_create_request_password(
+    client: TestClient, test_non_admin_user: dict, app_settings: Settings, test_db
+):
+    response = client.post(
+        f"/users/request-password-change?email=" + test_non_admin_user["email"],
+    )
+    assert response.status_code == 200, response.content
 
-        # * test the mail has been sent
-        assert len(outbox) == 1
-        assert outbox[0]["To"] == test_non_admin_user["email"]
+    # * test the mail has been sent
+    sent = send_email_outbox(test_db, app_settings, test_non_admin_user["email"])
+    assert len(sent) == 1
 
 
-@pytest.mark.asyncio
-async def test_user_can_change_password_with_token(
+def test_user_can_change_password_with_token(
     client: TestClient, test_non_admin_user: dict, test_password, app_settings, test_db
 ):
 
@@ -288,18 +296,17 @@ async def test_user_can_change_password_with_token(
     reset_password_token = user_service.create_request_password(
         test_non_admin_user["email"]
     )
+    send_email_outbox(test_db, app_settings, test_non_admin_user["email"])
 
-    fm.config.SUPPRESS_SEND = 1
-    with fm.record_messages() as outbox:
-        response = client.put(
-            "/users/change-user-password/",
-            json={"token": reset_password_token.data, "new_password": "newPassword"},
-        )
-        assert response.status_code == 200, response.content
+    response = client.put(
+        "/users/change-user-password/",
+        json={"token": reset_password_token.data, "new_password": "newPassword"},
+    )
+    assert response.status_code == 200, response.content
 
-        # * test the mail has been sent
-        assert len(outbox) == 1
-        assert outbox[0]["To"] == test_non_admin_user["email"]
+    # * test the mail has been sent
+    sent = send_email_outbox(test_db, app_settings, test_non_admin_user["email"])
+    assert len(sent) == 1
 
     response = client.post(
         "/token",
@@ -311,18 +318,17 @@ async def test_user_can_change_password_with_token(
     reset_password_token = user_service.create_request_password(
         test_non_admin_user["email"]
     )
+    send_email_outbox(test_db, app_settings, test_non_admin_user["email"])
 
-    fm.config.SUPPRESS_SEND = 1
-    with fm.record_messages() as outbox:
-        response = client.put(
-            "/users/change-user-password/",
-            json={"token": reset_password_token.data, "new_password": test_password},
-        )
-        assert response.status_code == 200, response.content
+    response = client.put(
+        "/users/change-user-password/",
+        json={"token": reset_password_token.data, "new_password": test_password},
+    )
+    assert response.status_code == 200, response.content
 
-        # * test the mail has been sent
-        assert len(outbox) == 1
-        assert outbox[0]["To"] == test_non_admin_user["email"]
+    # * test the mail has been sent
+    sent = send_email_outbox(test_db, app_settings, test_non_admin_user["email"])
+    assert len(sent) == 1
 
     response = client.post(
         "/token",
@@ -359,3 +365,152 @@ def test_upload_and_download_user_photo(
     assert response.status_code == 200, response.content
     print(response.content)
     assert hash_bytes(response.content) == hash_file(FILE_PATH_UNDER_TEST)
+
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        file_content = f.read()
+
+    # * HEAD only sends the headers.
+    response = client.head(endpoint, headers=test_non_admin_user_headers)
+    assert response.status_code == 200
+    assert response.headers["accept-ranges"] == "bytes"
+    assert int(response.headers["content-length"]) == len(file_content)
+    assert response.content == b""
+
+    response = client.get(
+        endpoint, headers={**test_non_admin_user_headers, "Range": "bytes=0-99"}
+    )
+    assert response.status_code == 206, response.content
+    assert response.headers["content-range"] == f"bytes 0-99/{len(file_content)}"
+    assert response.content == file_content[:100]
+
+    response = client.get(
+        endpoint,
+        headers={
+            **test_non_admin_user_headers,
+            "Range": f"bytes={len(file_content)}-",
+        },
+    )
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(file_content)}"
+
+
+def test_user_photo_is_cacheable(
+    client: TestClient,
+    test_non_admin_user: dict,
+    test_non_admin_user_headers: dict,
+):
+    user_id = test_non_admin_user["id"]
+
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        response = client.put(
+            f"/users/{user_id}/upload-photo",
+            headers=test_non_admin_user_headers,
+            files={"file_to_upload": f},
+        )
+        assert response.status_code == 200, response.json()
+
+    photo_url = response.json()["photo_url"]
+    assert photo_url == f"/users/photos/{response.json()['photo_file']['id']}"
+
+    response = client.get(photo_url, headers=test_non_admin_user_headers)
+    assert response.status_code == 200, response.content
+    assert "immutable" in response.headers["cache-control"]
+    assert hash_bytes(response.content) == hash_file(FILE_PATH_UNDER_TEST)
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+
+    response = client.get(
+        f"/users/{user_id}/download-photo",
+        headers={**test_non_admin_user_headers, "If-None-Match": etag},
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get(
+        photo_url,
+        headers={**test_non_admin_user_headers, "If-Modified-Since": last_modified},
+    )
+    assert response.status_code == 304
+
+    # * only photos can be read through the photos endpoint
+    response = client.get(
+        f"/users/photos/{uuid.uuid4()}", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 404
+
+
+def test_user_photo_derivatives(
+    client: TestClient,
+    test_non_admin_user: dict,
+    test_non_admin_user_headers: dict,
+):
+    user_id = test_non_admin_user["id"]
+
+    with open(FILE_PATH_UNDER_TEST, "rb") as f:
+        response = client.put(
+            f"/users/{user_id}/upload-photo",
+            headers=test_non_admin_user_headers,
+            files={"file_to_upload": f},
+        )
+        assert response.status_code == 200, response.json()
+
+    # * the derivatives are rendered in the background
+    headers = {**test_non_admin_user_headers, "Accept": "image/webp,*/*"}
+    for _ in range(50):
+        response = client.get(
+            f"/users/{user_id}/download-photo?size=64", headers=headers
+        )
+        assert response.status_code == 200, response.content
+        if response.headers["content-type"] == "image/webp":
+            break
+        time.sleep(0.2)
+
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["vary"] == "Accept"
+    assert int(response.headers["content-length"]) == len(response.content)
+    assert len(response.content) < os.path.getsize(FILE_PATH_UNDER_TEST)
+
+    response = client.get(
+        f"/users/{user_id}/download-photo?size=64", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 200, response.content
+    assert response.headers["content-type"] == "image/jpeg"
+
+    response = client.get(
+        f"/users/{user_id}/download-photo?size=0", headers=test_non_admin_user_headers
+    )
+    assert response.status_code == 422
+
+
+def test_photo_is_not_cached_for_a_size_not_rendered_yet(
+    client: TestClient,
+    test_non_admin_user: dict,
+    test_non_admin_user_headers: dict,
+):
+    # * no derivative is rendered, so the original stands in for every size
+    app.dependency_overrides[get_settings] = lambda: Settings(image_derivatives=False)
+    try:
+        user_id = test_non_admin_user["id"]
+
+        with open(FILE_PATH_UNDER_TEST, "rb") as f:
+            response = client.put(
+                f"/users/{user_id}/upload-photo",
+                headers=test_non_admin_user_headers,
+                files={"file_to_upload": f},
+            )
+            assert response.status_code == 200, response.json()
+
+        photo_url = response.json()["photo_url"]
+
+        response = client.get(
+            f"{photo_url}?size=64", headers=test_non_admin_user_headers
+        )
+        assert response.status_code == 200, response.content
+        assert hash_bytes(response.content) == hash_file(FILE_PATH_UNDER_TEST)
+        assert response.headers["cache-control"] == "private, no-cache"
+
+        response = client.get(photo_url, headers=test_non_admin_user_headers)
+        assert response.status_code == 200, response.content
+        assert "immutable" in response.headers["cache-control"]
+    finally:
+        app.dependency_overrides.pop(get_settings, None)
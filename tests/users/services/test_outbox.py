@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.config import Settings
+from src.mail import fm, open_template_secrets, queue_new_account_info
+from src.models import EmailOutbox
+from src.outbox import EmailOutboxSender, OutboxReport
+
+RECIPIENT = "outbox@regnify.com"
+
+
+@pytest.fixture()
+def outbox_settings() -> Settings:
+    return Settings(mail_outbox_max_attempts=3, mail_outbox_retry_backoff_seconds=60)
+
+
+@pytest.fixture()
+def failing_smtp_server(test_db, outbox_settings: Settings, monkeypatch):
+    # * Sends what other tests left in the outbox, so only this test's email is due.
+    monkeypatch.setattr(fm.config, "SUPPRESS_SEND", 1)
+    EmailOutboxSender(test_db, outbox_settings).send_pending()
+
+    # * Nothing listens on this port, so the connection is refused.
+    monkeypatch.setattr(fm.config, "SUPPRESS_SEND", 0)
+    monkeypatch.setattr(fm.config, "MAIL_SERVER", "127.0.0.1")
+    monkeypatch.setattr(fm.config, "MAIL_PORT", 1)
+
+
+@pytest.fixture()
+def queued_email(test_db, failing_smtp_server) -> EmailOutbox:
+    queue_new_account_info(test_db, RECIPIENT, "a-secret-password", "Jane")  # type: ignore
+    test_db.commit()
+    email = (
+        test_db.query(EmailOutbox)
+        .filter(EmailOutbox.recipients.any(RECIPIENT))  # type: ignore
+        .one()
+    )
+    yield email
+    test_db.delete(email)
+    test_db.commit()
+
+
+def send_attempt(test_db, app_settings: Settings, email: EmailOutbox) -> OutboxReport:
+    """Makes the email due, then runs one batch of the sender."""
+
+    email.next_attempt_at = datetime.now(timezone.utc)  # type: ignore
+    test_db.commit()
+
+    report = OutboxReport()
+    EmailOutboxSender(test_db, app_settings).send_batch(report)
+    test_db.refresh(email)
+    return report
+
+
+def test_failed_email_is_retried_after_a_doubling_backoff(
+    test_db, outbox_settings: Settings, queued_email: EmailOutbox
+):
+    for attempt in range(1, outbox_settings.mail_outbox_max_attempts):
+        started = datetime.now(timezone.utc)
+        report = send_attempt(test_db, outbox_settings, queued_email)
+
+        assert report.failed == 1
+        assert queued_email.attempts == attempt
+        assert queued_email.last_error
+        assert queued_email.dead_lettered_at is None
+
+        backoff = timedelta(
+            seconds=outbox_settings.mail_outbox_retry_backoff_seconds
+            * 2 ** (attempt - 1)
+        )
+        assert (
+            started + backoff
+            <= queued_email.next_attempt_at
+            <= datetime.now(timezone.utc) + backoff
+        )
+
+
+def test_email_is_dead_lettered_without_its_secrets(
+    test_db, outbox_settings: Settings, queued_email: EmailOutbox
+):
+    for _ in range(1, outbox_settings.mail_outbox_max_attempts):
+        assert send_attempt(test_db, outbox_settings, queued_email).failed == 1
+    assert queued_email.template_body["password"] != "a-secret-password"
+    assert (
+        open_template_secrets(queued_email.template_body, outbox_settings.secret_key)[
+            "password"
+        ]
+        == "a-secret-password"
+    )
+
+    report = send_attempt(test_db, outbox_settings, queued_email)
+    assert report.dead_lettered == 1
+    assert queued_email.attempts == outbox_settings.mail_outbox_max_attempts
+    assert queued_email.dead_lettered_at is not None
+    assert queued_email.template_body["password"] == ""
+    assert queued_email.template_body["email"] == RECIPIENT
+
+    # * a dead letter is not tried again
+    report = OutboxReport()
+    EmailOutboxSender(test_db, outbox_settings).send_batch(report)
+    assert report.dead_lettered == 0
+    assert report.failed == 0